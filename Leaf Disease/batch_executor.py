@@ -0,0 +1,122 @@
+import os
+import time
+import logging
+import threading
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from typing import Any, Callable, List, Optional, Sequence
+
+
+logger = logging.getLogger(__name__)
+
+
+class RateLimiter:
+    """
+    Token bucket: `rate` requests per second on average, bursts up to `burst`.
+    """
+
+    def __init__(self, rate: float, burst: int = 1):
+        self.rate = rate
+        self.burst = max(1, burst)
+        self._tokens = float(self.burst)
+        self._updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def _refill(self, now: float) -> None:
+        self._tokens = min(self.burst, self._tokens + (now - self._updated) * self.rate)
+        self._updated = now
+
+    def try_acquire(self) -> bool:
+        with self._lock:
+            self._refill(time.monotonic())
+            if self._tokens >= 1:
+                self._tokens -= 1
+                return True
+            return False
+
+    def time_until_token(self) -> float:
+        """
+        Seconds until a token is available (0 if one is available now),
+        without taking it.
+        """
+        with self._lock:
+            self._refill(time.monotonic())
+            return max(0.0, (1 - self._tokens) / self.rate)
+
+    def acquire(self, timeout: Optional[float] = None) -> bool:
+        """
+        Block until a token is available. Returns False on timeout.
+        """
+        deadline = None if timeout is None else time.monotonic() + timeout
+        while True:
+            with self._lock:
+                now = time.monotonic()
+                self._refill(now)
+                if self._tokens >= 1:
+                    self._tokens -= 1
+                    return True
+                wait = (1 - self._tokens) / self.rate
+            if deadline is not None and now + wait > deadline:
+                return False
+            time.sleep(wait)
+
+
+def default_batch_workers() -> int:
+    return max(1, int(os.environ.get("BATCH_MAX_WORKERS", 4)))
+
+
+def run_batch(items: Sequence[Any],
+              fn: Callable[[Any], Any],
+              max_workers: Optional[int] = None,
+              on_result: Optional[Callable[[int, Any, int], None]] = None) -> List[Any]:
+    """
+    Apply fn to every item on a bounded thread pool.
+
+    Results are returned in input order. on_result(index, result, done)
+    is called from the calling thread as each item finishes, so it is safe
+    to update UI elements (e.g. a Streamlit progress bar) from it. An item
+    whose fn raises yields None.
+    """
+    results: List[Any] = [None] * len(items)
+    if not items:
+        return results
+
+    workers = min(max_workers or default_batch_workers(), len(items))
+    with ThreadPoolExecutor(max_workers=workers, thread_name_prefix="leaf-batch") as pool:
+        futures = {pool.submit(fn, item): i for i, item in enumerate(items)}
+        for done, future in enumerate(as_completed(futures), start=1):
+            index = futures[future]
+            try:
+                results[index] = future.result()
+            except Exception as e:
+                logger.error(f"Batch item {index} failed: {str(e)}")
+            if on_result is not None:
+                on_result(index, results[index], done)
+    return results
+
+
+_shared_executor: Optional[ThreadPoolExecutor] = None
+_shared_executor_lock = threading.Lock()
+
+
+def get_detection_executor() -> ThreadPoolExecutor:
+    """
+    Process-wide pool for running blocking detections off an event loop,
+    sized by DETECTION_WORKERS (default 8).
+    """
+    global _shared_executor
+    if _shared_executor is None:
+        with _shared_executor_lock:
+            if _shared_executor is None:
+                workers = max(1, int(os.environ.get("DETECTION_WORKERS", 8)))
+                _shared_executor = ThreadPoolExecutor(max_workers=workers,
+                                                      thread_name_prefix="leaf-detect")
+                logger.info(f"Detection worker pool started with {workers} threads")
+    return _shared_executor
+
+
+def shutdown_detection_executor() -> None:
+    global _shared_executor
+    with _shared_executor_lock:
+        if _shared_executor is not None:
+            _shared_executor.shutdown(wait=False)
+            _shared_executor = None
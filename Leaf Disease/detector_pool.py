@@ -0,0 +1,88 @@
+import os
+import time
+import logging
+import threading
+from pathlib import Path
+from typing import Dict, Optional, Tuple
+
+from dotenv import find_dotenv, load_dotenv
+
+from leaf_detector import LeafDiseaseDetector
+
+
+logger = logging.getLogger(__name__)
+
+# One detector per credential set, shared by every thread in the process
+_lock = threading.Lock()
+_detectors: Dict[Tuple[Optional[str], ...], LeafDiseaseDetector] = {}
+_env_mtime: Optional[float] = None
+# Look at the .env file at most this often (seconds); 0 checks on every call
+ENV_CHECK_INTERVAL = float(os.environ.get("ENV_CHECK_INTERVAL", 5))
+_next_env_check = 0.0
+
+
+def _refresh_env() -> None:
+    """
+    Re-read the .env file only when it has changed on disk, checking at
+    most every ENV_CHECK_INTERVAL seconds so requests don't stat it.
+    """
+    global _env_mtime, _next_env_check
+    if time.monotonic() < _next_env_check:
+        return
+    with _lock:
+        now = time.monotonic()
+        if now < _next_env_check:
+            return
+        _next_env_check = now + ENV_CHECK_INTERVAL
+        env_path = find_dotenv(usecwd=True)
+        if not env_path:
+            return
+        try:
+            mtime = Path(env_path).stat().st_mtime
+        except OSError:
+            return
+        if mtime != _env_mtime:
+            # override=True so rotated keys replace the ones loaded at startup
+            load_dotenv(env_path, override=_env_mtime is not None)
+            _env_mtime = mtime
+
+
+def _credentials() -> Tuple[Optional[str], ...]:
+    _refresh_env()
+    return tuple(os.environ.get(name) for name in
+                 ("KINDWISE_API_KEY", "GEMINI_API_KEY", "KINDWISE_API_KEYS", "GEMINI_API_KEYS"))
+
+
+def get_detector() -> LeafDiseaseDetector:
+    """
+    Return the shared LeafDiseaseDetector for the current credentials.
+
+    The detector (and its Gemini client) is built once and reused across
+    requests and threads. When the API keys change, a new detector is built
+    and the stale one is dropped.
+    """
+    key = _credentials()
+    detector = _detectors.get(key)
+    if detector is not None:
+        return detector
+
+    with _lock:
+        detector = _detectors.get(key)
+        if detector is None:
+            if _detectors:
+                logger.info("API credentials changed, rebuilding detector")
+            # The *_API_KEYS lists are read by the detector itself
+            kindwise_key, gemini_key = key[:2]
+            detector = LeafDiseaseDetector(api_key=kindwise_key,
+                                           gemini_api_key=gemini_key)
+            _detectors.clear()
+            _detectors[key] = detector
+    return detector
+
+
+def reset_detectors() -> None:
+    """
+    Drop every pooled detector so the next call rebuilds from scratch.
+    """
+    with _lock:
+        _detectors.clear()
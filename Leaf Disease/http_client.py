@@ -0,0 +1,189 @@
+import os
+import time
+import logging
+import threading
+from typing import Dict, Optional, Tuple
+
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+
+from tracing import get_metrics_registry, span
+
+
+logger = logging.getLogger(__name__)
+
+RETRY_STATUSES = (429, 500, 502, 503, 504)
+# A non-idempotent request is only re-sent when the server asked for it
+POST_RETRY_STATUSES = (429, 503)
+
+
+class UpstreamRetry(Retry):
+    """
+    urllib3 Retry that never re-sends a POST that may have been processed:
+    POSTs are retried on connect errors (the request never left) and on
+    429/503 with a Retry-After header, never after a read error or a 5xx.
+    """
+
+    def is_retry(self, method: str, status_code: int, has_retry_after: bool = False) -> bool:
+        if method and method.upper() == "POST":
+            return bool(self.total and self.respect_retry_after_header and has_retry_after
+                        and status_code in POST_RETRY_STATUSES)
+        return super().is_retry(method, status_code, has_retry_after)
+
+
+class CircuitOpenError(Exception):
+    """
+    Raised instead of calling an upstream that has been failing repeatedly.
+    """
+
+
+class CircuitBreaker:
+    """
+    Opens after `failure_threshold` consecutive failures and rejects calls
+    for `reset_timeout` seconds, then lets one trial call through.
+    """
+
+    def __init__(self, failure_threshold: int = 5, reset_timeout: float = 30.0):
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self._failures = 0
+        self._opened_at: Optional[float] = None
+        self._trial_in_flight = False
+        self._lock = threading.Lock()
+
+    @property
+    def state(self) -> str:
+        with self._lock:
+            if self._opened_at is None:
+                return "closed"
+            if time.monotonic() - self._opened_at >= self.reset_timeout:
+                return "half-open"
+            return "open"
+
+    def allow(self) -> bool:
+        with self._lock:
+            if self._opened_at is None:
+                return True
+            if time.monotonic() - self._opened_at < self.reset_timeout or self._trial_in_flight:
+                return False
+            self._trial_in_flight = True
+            return True
+
+    def would_allow(self) -> bool:
+        """
+        Whether allow() would let a call through now, without claiming the
+        half-open trial slot.
+        """
+        with self._lock:
+            if self._opened_at is None:
+                return True
+            return time.monotonic() - self._opened_at >= self.reset_timeout and not self._trial_in_flight
+
+    def record_success(self) -> None:
+        with self._lock:
+            self._failures = 0
+            self._opened_at = None
+            self._trial_in_flight = False
+
+    def record_failure(self) -> None:
+        with self._lock:
+            self._failures += 1
+            self._trial_in_flight = False
+            if self._opened_at is not None or self._failures >= self.failure_threshold:
+                self._opened_at = time.monotonic()
+
+
+class HttpClient:
+    """
+    Keep-alive session for one upstream, with connect/read timeouts,
+    exponential backoff on 429/5xx and a circuit breaker that opens on
+    connection errors and 5xx. Read timeouts are
+    retried `read_retries` times, and only for idempotent methods.
+    """
+
+    def __init__(self, name: str,
+                 connect_timeout: float = 5.0,
+                 read_timeout: float = 30.0,
+                 retries: int = 3,
+                 read_retries: int = 0,
+                 backoff_factor: float = 0.5,
+                 pool_size: int = 10,
+                 breaker: Optional[CircuitBreaker] = None):
+        self.name = name
+        self.timeout: Tuple[float, float] = (connect_timeout, read_timeout)
+        self.breaker = breaker or CircuitBreaker()
+
+        # allowed_methods leaves out POST, so read errors on a POST are never
+        # retried; UpstreamRetry decides which POST statuses are safe to retry
+        retry = UpstreamRetry(
+            total=retries,
+            connect=retries,
+            read=read_retries,
+            status=retries,
+            backoff_factor=backoff_factor,
+            status_forcelist=RETRY_STATUSES,
+            allowed_methods=Retry.DEFAULT_ALLOWED_METHODS,
+            respect_retry_after_header=True,
+            raise_on_status=False,
+        )
+        adapter = HTTPAdapter(pool_connections=pool_size, pool_maxsize=pool_size, max_retries=retry)
+        self.session = requests.Session()
+        self.session.mount("https://", adapter)
+        self.session.mount("http://", adapter)
+
+    def request(self, method: str, url: str, **kwargs) -> requests.Response:
+        if not self.breaker.allow():
+            raise CircuitOpenError(f"{self.name} circuit is open; skipping call")
+        kwargs.setdefault("timeout", self.timeout)
+        try:
+            with span("http_request", upstream=self.name):
+                response = self.session.request(method, url, **kwargs)
+        except requests.RequestException:
+            self.breaker.record_failure()
+            raise
+        retries = getattr(getattr(response.raw, "retries", None), "history", ())
+        if retries:
+            get_metrics_registry().inc("leaf_http_retries_total", len(retries),
+                                       "Retried upstream HTTP attempts", upstream=self.name)
+        # A 429 is about one API key's quota, not the upstream's health; the
+        # quota manager rests that key, so it must not open the breaker for
+        # every rotated key
+        if response.status_code >= 500:
+            self.breaker.record_failure()
+        elif response.status_code != 429:
+            self.breaker.record_success()
+        return response
+
+    def get(self, url: str, **kwargs) -> requests.Response:
+        return self.request("GET", url, **kwargs)
+
+    def post(self, url: str, **kwargs) -> requests.Response:
+        return self.request("POST", url, **kwargs)
+
+
+_clients: Dict[str, HttpClient] = {}
+_clients_lock = threading.Lock()
+
+
+def get_http_client(name: str, read_timeout: float = 30.0) -> HttpClient:
+    """
+    Shared client per upstream name. Timeouts can be overridden with
+    HTTP_CONNECT_TIMEOUT and <NAME>_READ_TIMEOUT (e.g. KINDWISE_READ_TIMEOUT),
+    retries with HTTP_RETRIES and HTTP_READ_RETRIES (GET only, default 0).
+    """
+    client = _clients.get(name)
+    if client is None:
+        with _clients_lock:
+            client = _clients.get(name)
+            if client is None:
+                env_name = name.upper().replace("-", "_")
+                client = HttpClient(
+                    name,
+                    connect_timeout=float(os.environ.get("HTTP_CONNECT_TIMEOUT", 5)),
+                    read_timeout=float(os.environ.get(f"{env_name}_READ_TIMEOUT", read_timeout)),
+                    retries=int(os.environ.get("HTTP_RETRIES", 3)),
+                    read_retries=int(os.environ.get("HTTP_READ_RETRIES", 0)),
+                )
+                _clients[name] = client
+    return client
@@ -0,0 +1,438 @@
+import os
+import json
+import time
+import uuid
+import queue
+import socket
+import sqlite3
+import logging
+import ipaddress
+import threading
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass, field
+from typing import Callable, Dict, Optional
+from urllib.parse import urlsplit
+
+from tracing import get_metrics_registry
+
+
+logger = logging.getLogger(__name__)
+
+QUEUED, RUNNING, DONE, FAILED = "queued", "running", "done", "failed"
+
+
+class QueueFullError(Exception):
+    """
+    Raised by submit() when the backlog is at max_depth.
+    """
+
+
+class InvalidWebhookError(ValueError):
+    """
+    Raised by submit() for a webhook URL that is not a public http(s) address.
+    """
+
+
+def validate_webhook_url(url: str, allow_private: bool = False) -> str:
+    """
+    Check that a client-supplied webhook URL is http(s) and that every
+    address its host resolves to is public, so jobs can't be used to reach
+    loopback, private, link-local (cloud metadata) or reserved addresses.
+    """
+    resolve_webhook_url(url, allow_private)
+    return url
+
+
+def resolve_webhook_url(url: str, allow_private: bool = False) -> str:
+    """
+    Validate a webhook URL like validate_webhook_url and return the address
+    to connect to. Delivery connects to exactly this address, so a DNS
+    answer that changes after the check (rebinding) can't redirect the POST.
+    With allow_private the hostname is returned unresolved.
+    """
+    parts = urlsplit(url)
+    if parts.scheme not in ("http", "https") or not parts.hostname:
+        raise InvalidWebhookError("webhook_url must be an http(s) URL with a host")
+    if parts.username or parts.password:
+        raise InvalidWebhookError("webhook_url must not contain credentials")
+    if allow_private:
+        return parts.hostname
+    try:
+        infos = socket.getaddrinfo(parts.hostname, parts.port or (443 if parts.scheme == "https" else 80),
+                                   proto=socket.IPPROTO_TCP)
+    except (socket.gaierror, UnicodeError, ValueError):
+        raise InvalidWebhookError(f"webhook_url host {parts.hostname} does not resolve")
+    for info in infos:
+        address = ipaddress.ip_address(info[4][0].split("%", 1)[0])
+        if isinstance(address, ipaddress.IPv6Address) and address.ipv4_mapped is not None:
+            address = address.ipv4_mapped
+        if not address.is_global or address.is_multicast:
+            raise InvalidWebhookError(f"webhook_url host {parts.hostname} is not a public address")
+    return infos[0][4][0]
+
+
+@dataclass
+class Job:
+    id: str
+    status: str = QUEUED
+    created: float = field(default_factory=time.time)
+    started: Optional[float] = None
+    finished: Optional[float] = None
+    webhook_url: Optional[str] = None
+    result: Optional[Dict] = None
+    error: Optional[str] = None
+
+    def to_dict(self) -> Dict:
+        data = {
+            "job_id": self.id,
+            "status": self.status,
+            "created": self.created,
+            "started": self.started,
+            "finished": self.finished,
+        }
+        if self.started is not None:
+            data["wait_seconds"] = round(self.started - self.created, 3)
+        if self.finished is not None and self.started is not None:
+            data["run_seconds"] = round(self.finished - self.started, 3)
+        if self.result is not None:
+            data["result"] = self.result
+        if self.error is not None:
+            data["error"] = self.error
+        return data
+
+
+def _percentiles(samples) -> Dict:
+    values = sorted(samples)
+    if not values:
+        return {}
+    return {
+        "p50": round(values[len(values) // 2], 3),
+        "p95": round(values[min(len(values) - 1, int(0.95 * len(values)))], 3),
+    }
+
+
+class JobQueue:
+    """
+    Background detection jobs: submit() returns a job id straight away and
+    a pool of worker threads runs `runner(image_bytes)` in FIFO order.
+
+    Job records live in memory, or in SQLite when db_path is given; with
+    SQLite the queued images are stored too, so unfinished jobs survive a
+    restart and are picked up again. Finished jobs are kept for result_ttl
+    seconds. If a job has a webhook_url, its final state is POSTed there
+    from a separate delivery pool, so slow or dead receivers never hold up
+    detection workers.
+    """
+
+    def __init__(self, runner: Callable[[bytes], Dict],
+                 workers: int = 4,
+                 max_depth: int = 1000,
+                 result_ttl: float = 3600.0,
+                 db_path: Optional[str] = None,
+                 webhook_workers: int = 2,
+                 webhook_attempts: int = 3,
+                 allow_private_webhooks: bool = False):
+        self.runner = runner
+        self.workers = max(1, workers)
+        self.max_depth = max_depth
+        self.result_ttl = result_ttl
+        self.webhook_attempts = max(1, webhook_attempts)
+        self.allow_private_webhooks = allow_private_webhooks
+        self._webhook_pool = ThreadPoolExecutor(max_workers=max(1, webhook_workers),
+                                                thread_name_prefix="leaf-webhook")
+        self._webhook_http = None
+        self._queue: "queue.Queue[Optional[tuple]]" = queue.Queue()
+        self._jobs: Dict[str, Job] = {}
+        self._lock = threading.Lock()
+        self._threads = []
+        self._running = 0
+        self._counts = {"submitted": 0, "completed": 0, "failed": 0, "rejected": 0}
+        self._wait_times = deque(maxlen=500)
+        self._run_times = deque(maxlen=500)
+        self._last_purge = time.time()
+
+        self._db_lock = threading.Lock()
+        self._db = None
+        if db_path:
+            self._db = sqlite3.connect(db_path, check_same_thread=False)
+            self._db.execute(
+                "CREATE TABLE IF NOT EXISTS jobs ("
+                "id TEXT PRIMARY KEY, status TEXT NOT NULL, created REAL NOT NULL, "
+                "started REAL, finished REAL, webhook_url TEXT, image BLOB, "
+                "result TEXT, error TEXT)"
+            )
+            self._db.execute("CREATE INDEX IF NOT EXISTS idx_jobs_finished ON jobs(finished)")
+            self._db.commit()
+            logger.info(f"Job queue persisted at {db_path}")
+
+    # --- lifecycle ---
+
+    def start(self) -> None:
+        if self._threads:
+            return
+        if self._db is not None:
+            self._requeue_unfinished()
+        for i in range(self.workers):
+            thread = threading.Thread(target=self._work, name=f"leaf-job-{i}", daemon=True)
+            thread.start()
+            self._threads.append(thread)
+        logger.info(f"Job queue started with {self.workers} workers")
+
+    def shutdown(self, wait: bool = False) -> None:
+        for _ in self._threads:
+            self._queue.put(None)
+        if wait:
+            for thread in self._threads:
+                thread.join()
+        self._threads = []
+        self._webhook_pool.shutdown(wait=wait)
+
+    def _requeue_unfinished(self) -> None:
+        with self._db_lock:
+            rows = self._db.execute(
+                "SELECT id, created, webhook_url, image FROM jobs "
+                "WHERE status IN (?, ?) ORDER BY created", (QUEUED, RUNNING)
+            ).fetchall()
+            self._db.execute("UPDATE jobs SET status = ?, started = NULL WHERE status = ?", (QUEUED, RUNNING))
+            self._db.commit()
+        for job_id, created, webhook_url, image in rows:
+            if image is None:
+                continue
+            self._queue.put((job_id, created, bytes(image), webhook_url))
+        if rows:
+            logger.info(f"Requeued {len(rows)} unfinished jobs")
+
+    # --- public API ---
+
+    @property
+    def depth(self) -> int:
+        return self._queue.qsize()
+
+    def submit(self, image_bytes: bytes, webhook_url: Optional[str] = None) -> Job:
+        """
+        Queue an image for analysis and return its Job (status "queued").
+        Raises InvalidWebhookError for a webhook_url that fails
+        validate_webhook_url.
+        """
+        if webhook_url:
+            validate_webhook_url(webhook_url, self.allow_private_webhooks)
+        if self.depth >= self.max_depth:
+            with self._lock:
+                self._counts["rejected"] += 1
+            raise QueueFullError(f"Job queue is full ({self.max_depth} pending)")
+        job = Job(id=uuid.uuid4().hex, webhook_url=webhook_url)
+        image_bytes = bytes(image_bytes)
+        if self._db is not None:
+            with self._db_lock:
+                self._db.execute(
+                    "INSERT INTO jobs (id, status, created, webhook_url, image) VALUES (?, ?, ?, ?, ?)",
+                    (job.id, job.status, job.created, webhook_url, sqlite3.Binary(image_bytes)),
+                )
+                self._db.commit()
+        else:
+            with self._lock:
+                self._jobs[job.id] = job
+        with self._lock:
+            self._counts["submitted"] += 1
+        self._queue.put((job.id, job.created, image_bytes, webhook_url))
+        self._purge_finished()
+        return job
+
+    def get(self, job_id: str) -> Optional[Job]:
+        if self._db is None:
+            with self._lock:
+                return self._jobs.get(job_id)
+        with self._db_lock:
+            row = self._db.execute(
+                "SELECT id, status, created, started, finished, webhook_url, result, error "
+                "FROM jobs WHERE id = ?", (job_id,)
+            ).fetchone()
+        if row is None:
+            return None
+        return Job(id=row[0], status=row[1], created=row[2], started=row[3], finished=row[4],
+                   webhook_url=row[5], result=json.loads(row[6]) if row[6] else None, error=row[7])
+
+    def get_stats(self) -> Dict:
+        with self._lock:
+            stats = dict(self._counts)
+            stats["running"] = self._running
+            wait_times = list(self._wait_times)
+            run_times = list(self._run_times)
+        stats["depth"] = self.depth
+        stats["workers"] = self.workers
+        stats["wait_seconds"] = _percentiles(wait_times)
+        stats["run_seconds"] = _percentiles(run_times)
+        stats["persistent"] = self._db is not None
+        return stats
+
+    # --- workers ---
+
+    def _update(self, job: Job, keep_image: bool = False) -> None:
+        if self._db is None:
+            with self._lock:
+                self._jobs[job.id] = job
+            return
+        # A locked or full database must not take the worker thread down with it
+        try:
+            with self._db_lock:
+                self._db.execute(
+                    "UPDATE jobs SET status = ?, started = ?, finished = ?, result = ?, error = ?"
+                    + ("" if keep_image else ", image = NULL") + " WHERE id = ?",
+                    (job.status, job.started, job.finished,
+                     json.dumps(job.result) if job.result is not None else None, job.error, job.id),
+                )
+                self._db.commit()
+        except sqlite3.Error as e:
+            logger.error(f"Could not save job {job.id} ({job.status}): {str(e)}")
+
+    def _work(self) -> None:
+        registry = get_metrics_registry()
+        while True:
+            item = self._queue.get()
+            if item is None:
+                break
+            job_id, created, image_bytes, webhook_url = item
+            job = Job(id=job_id, status=RUNNING, created=created, started=time.time(),
+                      webhook_url=webhook_url)
+            self._update(job, keep_image=True)
+            wait = job.started - created
+            with self._lock:
+                self._running += 1
+                self._wait_times.append(wait)
+            registry.observe("leaf_job_wait_seconds", wait, "Time jobs spend queued before a worker picks them up")
+
+            try:
+                job.result = self.runner(image_bytes)
+                job.status = DONE
+            except Exception as e:
+                logger.error(f"Job {job_id} failed: {str(e)}")
+                job.status = FAILED
+                job.error = str(e)
+            job.finished = time.time()
+            run = job.finished - job.started
+            self._update(job)
+            with self._lock:
+                self._running -= 1
+                self._run_times.append(run)
+                self._counts["completed" if job.status == DONE else "failed"] += 1
+            registry.observe("leaf_job_run_seconds", run, "Time spent analyzing a job", status=job.status)
+
+            if webhook_url:
+                self._webhook_pool.submit(self._deliver, job)
+
+    def _deliver(self, job: Job) -> None:
+        """
+        POST the finished job to its webhook, retrying connection errors and
+        5xx with backoff. Runs on the webhook pool. No shared circuit breaker:
+        one tenant's dead endpoint must not stop delivery to the others.
+        """
+        import urllib3
+        from requests.certs import where
+
+        if self._webhook_http is None:
+            self._webhook_http = urllib3.PoolManager(num_pools=32, cert_reqs="CERT_REQUIRED", ca_certs=where())
+        parts = urlsplit(job.webhook_url)
+        port = parts.port or (443 if parts.scheme == "https" else 80)
+        path = (parts.path or "/") + (f"?{parts.query}" if parts.query else "")
+        body = json.dumps(job.to_dict()).encode("utf-8")
+        headers = {"Host": parts.netloc, "Content-Type": "application/json"}
+        # SNI and certificate checks still use the hostname, not the pinned address
+        tls = {"server_hostname": parts.hostname, "assert_hostname": parts.hostname} \
+            if parts.scheme == "https" else None
+        for attempt in range(1, self.webhook_attempts + 1):
+            try:
+                # Re-checked here: the host may resolve differently by now, and
+                # the connection goes to the address that passed the check
+                address = resolve_webhook_url(job.webhook_url, self.allow_private_webhooks)
+                pool = self._webhook_http.connection_from_host(address, port, parts.scheme, pool_kwargs=tls)
+                # No redirects, or a public URL could bounce us to an internal one
+                response = pool.urlopen("POST", path, body=body, headers=headers, redirect=False,
+                                        retries=False, timeout=urllib3.Timeout(connect=5, read=10))
+                if response.status < 500:
+                    if response.status >= 400:
+                        logger.warning(f"Webhook for job {job.id} returned {response.status}")
+                    return
+                error = f"status {response.status}"
+            except InvalidWebhookError as e:
+                logger.warning(f"Webhook for job {job.id} not delivered: {e}")
+                return
+            except urllib3.exceptions.HTTPError as e:
+                error = str(e)
+            if attempt < self.webhook_attempts:
+                time.sleep(2 ** (attempt - 1))
+        logger.warning(f"Webhook for job {job.id} failed after {self.webhook_attempts} attempts: {error}")
+
+    def _purge_finished(self) -> None:
+        now = time.time()
+        if now - self._last_purge < 60:
+            return
+        self._last_purge = now
+        cutoff = now - self.result_ttl
+        if self._db is not None:
+            with self._db_lock:
+                self._db.execute("DELETE FROM jobs WHERE finished IS NOT NULL AND finished < ?", (cutoff,))
+                self._db.commit()
+            return
+        with self._lock:
+            expired = [job_id for job_id, job in self._jobs.items()
+                       if job.finished is not None and job.finished < cutoff]
+            for job_id in expired:
+                del self._jobs[job_id]
+
+    def metrics_samples(self):
+        """
+        Collector for the metrics registry: queue depth and running jobs.
+        """
+        stats = self.get_stats()
+        yield "leaf_job_queue_depth", "gauge", "Jobs waiting for a worker", {}, stats["depth"]
+        yield "leaf_jobs_running", "gauge", "Jobs being analyzed right now", {}, stats["running"]
+        for event in ("submitted", "completed", "failed", "rejected"):
+            yield ("leaf_jobs_total", "counter", "Background jobs by lifecycle event",
+                   {"event": event}, stats[event])
+
+
+def _analyze(image_bytes: bytes) -> Dict:
+    from detector_pool import get_detector
+    return get_detector().analyze_leaf_image_bytes(image_bytes)
+
+
+_job_queue: Optional[JobQueue] = None
+_job_queue_lock = threading.Lock()
+
+
+def get_job_queue() -> JobQueue:
+    """
+    Process-wide job queue, started on first use. Configured from
+    JOB_WORKERS (default 4), JOB_QUEUE_MAX_DEPTH (1000), JOB_RESULT_TTL
+    (seconds, 3600), JOB_QUEUE_DB (SQLite path; in-memory if unset),
+    WEBHOOK_WORKERS (2), WEBHOOK_ATTEMPTS (3) and WEBHOOK_ALLOW_PRIVATE
+    (false; set it only for trusted clients on an internal network).
+    """
+    global _job_queue
+    if _job_queue is None:
+        with _job_queue_lock:
+            if _job_queue is None:
+                job_queue = JobQueue(
+                    _analyze,
+                    workers=int(os.environ.get("JOB_WORKERS", 4)),
+                    max_depth=int(os.environ.get("JOB_QUEUE_MAX_DEPTH", 1000)),
+                    result_ttl=float(os.environ.get("JOB_RESULT_TTL", 3600)),
+                    db_path=os.environ.get("JOB_QUEUE_DB") or None,
+                    webhook_workers=int(os.environ.get("WEBHOOK_WORKERS", 2)),
+                    webhook_attempts=int(os.environ.get("WEBHOOK_ATTEMPTS", 3)),
+                    allow_private_webhooks=os.environ.get("WEBHOOK_ALLOW_PRIVATE", "false").lower()
+                    in ("1", "true", "yes"),
+                )
+                job_queue.start()
+                get_metrics_registry().register_collector(job_queue.metrics_samples)
+                _job_queue = job_queue
+    return _job_queue
+
+
+def shutdown_job_queue() -> None:
+    global _job_queue
+    with _job_queue_lock:
+        if _job_queue is not None:
+            _job_queue.shutdown()
+            _job_queue = None
@@ -1,20 +1,36 @@
 import os
 import json
+import base64
 import logging
 import sys
-from typing import Dict, Optional, List
+import threading
+from typing import Dict, Optional, List, Union
 from dataclasses import dataclass
 from datetime import datetime
 
 
 
 import google.generativeai as genai
+from google.ai import generativelanguage as glm
+from google.api_core import exceptions as google_exceptions
+from google.api_core.client_options import ClientOptions
 from dotenv import load_dotenv
 
-
-# Configure logging
-logging.basicConfig(level=logging.INFO,
-                    format='%(asctime)s - %(levelname)s - %(message)s')
+from result_cache import get_result_cache, image_digest
+from perceptual_hash import get_near_duplicate_index
+from preprocessing import PreprocessConfig, preprocess_image
+from http_client import CircuitOpenError, HttpClient, get_http_client
+from provider_router import ProviderRouter
+from local_model import Prediction, get_local_classifier, local_model_tier
+from quota_manager import QuotaExhaustedError, get_quota_manager, parse_keys
+from single_flight import get_single_flight
+from leaf_prefilter import NOT_PLANT, PrefilterVerdict, get_leaf_prefilter
+from tracing import span
+from log_config import configure_logging
+
+
+# Configure logging (queued, so request threads never block on stdout)
+configure_logging()
 logger = logging.getLogger(__name__)
 
 
@@ -46,6 +62,20 @@ class DiseaseAnalysisResult:
     analysis_timestamp: str = datetime.now().astimezone().isoformat()
 
 
+def sniff_image_mime(image_bytes: Union[bytes, memoryview]) -> str:
+    """
+    Guess the MIME type of encoded image data from its magic bytes.
+    """
+    header = bytes(image_bytes[:12])
+    if header.startswith(b'\x89PNG'):
+        return "image/png"
+    if header[:4] == b'RIFF' and header[8:12] == b'WEBP':
+        return "image/webp"
+    if header.startswith(b'GIF8'):
+        return "image/gif"
+    return "image/jpeg"
+
+
 class LeafDiseaseDetector:
     """
     Advanced Leaf Disease Detection System using Kindwise (Plant.id) API.
@@ -53,30 +83,65 @@ class LeafDiseaseDetector:
 
     PLANT_ID_URL = "https://plant.id/api/v3/identification"
 
-    def __init__(self, api_key: Optional[str] = None):
+    def __init__(self, api_key: Optional[str] = None,
+                 gemini_api_key: Optional[str] = None,
+                 preprocess_config: Optional[PreprocessConfig] = None,
+                 router: Optional[ProviderRouter] = None):
         """
-        Initialize the Leaf Disease Detector with Plant.id and Groq credentials.
+        Initialize the Leaf Disease Detector with Plant.id and Gemini credentials.
+        Prefer detector_pool.get_detector() over constructing this per request.
         """
         load_dotenv()
-        self.api_key = api_key or os.environ.get("KINDWISE_API_KEY")
-        self.gemini_api_key = os.environ.get("GEMINI_API_KEY")
-        
-
+        # The primary key plus any extra comma-separated keys, used round-robin
+        self.kindwise_api_keys = parse_keys(api_key or os.environ.get("KINDWISE_API_KEY"),
+                                            os.environ.get("KINDWISE_API_KEYS"))
+        self.gemini_api_keys = parse_keys(gemini_api_key or os.environ.get("GEMINI_API_KEY"),
+                                          os.environ.get("GEMINI_API_KEYS"))
+        self.api_key = self.kindwise_api_keys[0] if self.kindwise_api_keys else None
+        self.gemini_api_key = self.gemini_api_keys[0] if self.gemini_api_keys else None
+        # Per-key token buckets and daily budgets, shared across detectors
+        self.quota = get_quota_manager()
+        self.quota.register("kindwise", self.kindwise_api_keys)
+        self.quota.register("gemini", self.gemini_api_keys)
+        self.preprocess_config = preprocess_config or PreprocessConfig.from_env()
+        self.router = router or ProviderRouter.from_env()
+        # Endpoint overrides, e.g. to point at the benchmark stub server
+        self.plant_id_url = os.environ.get("KINDWISE_API_URL", self.PLANT_ID_URL)
+        self.gemini_endpoint = os.environ.get("GEMINI_API_ENDPOINT")
+        # The SDK has no request timeout by default
+        self.gemini_timeout = float(os.environ.get("GEMINI_READ_TIMEOUT", 60))
+
+        # Millisecond CPU check that turns away junk images before any provider call
+        self.prefilter = get_leaf_prefilter()
+
+        # Optional on-device classifier (LOCAL_MODEL_PATH), loaded and warmed once
+        self.local_classifier = get_local_classifier()
+        self.local_tier = local_model_tier()
+        self.local_min_confidence = float(os.environ.get("LOCAL_MODEL_MIN_CONFIDENCE", 0.6))
 
         # Initialize Gemini
+        self._gemini_models = {}
+        self._gemini_models_lock = threading.Lock()
         if self.gemini_api_key:
-            genai.configure(api_key=self.gemini_api_key)
+            if self.gemini_endpoint:
+                genai.configure(api_key=self.gemini_api_key, transport="rest",
+                                client_options={"api_endpoint": self.gemini_endpoint})
+            else:
+                genai.configure(api_key=self.gemini_api_key)
             self.gemini_model = genai.GenerativeModel('gemini-1.5-flash')
-            logger.info("Gemini Vision engine initialized")
+            self._gemini_models[self.gemini_api_key] = self.gemini_model
+            logger.info(f"Gemini Vision engine initialized ({len(self.gemini_api_keys)} keys)")
             
         logger.info("Leaf Disease Detector initialized")
 
     def analyze_leaf_image_base64(self, base64_image: str,
                                   temperature: float = None,
-                                  max_tokens: int = None) -> Dict:
+                                  max_tokens: int = None,
+                                  use_cache: bool = True) -> Dict:
         """
         Analyze base64 encoded image data. 
-        Uses Groq Vision if available (Unlimited/Free), falls back to Kindwise.
+        Decodes once and delegates to analyze_leaf_image_bytes; callers that
+        already hold raw bytes should use that method directly.
         """
         try:
             # Clean base64 string
@@ -85,85 +150,359 @@ class LeafDiseaseDetector:
             else:
                 clean_base64 = base64_image
 
-            # 1. Try Gemini First (1500 free requests/day)
-            if self.gemini_api_key:
-                try:
-                    logger.info("Starting analysis with Gemini Vision")
-                    return self._analyze_with_gemini(clean_base64)
-                except Exception as e:
-                    logger.warning(f"Gemini analysis failed: {e}")
+            with span("decode"):
+                image_bytes = base64.b64decode(clean_base64)
+        except Exception as e:
+            logger.error(f"Analysis failed: {str(e)}")
+            raise
+        return self.analyze_leaf_image_bytes(image_bytes, temperature, max_tokens, use_cache)
 
-            # 2. Fallback to Kindwise
-            if not self.api_key:
-                raise ValueError("No API keys found (GEMINI or KINDWISE). Please check your Secrets.")
+    def analyze_leaf_image_bytes(self, image_bytes: Union[bytes, bytearray, memoryview],
+                                 temperature: float = None,
+                                 max_tokens: int = None,
+                                 use_cache: bool = True,
+                                 coalesce: bool = True) -> Dict:
+        """
+        Analyze raw image bytes.
+        Uses Gemini Vision if available, falls back to Kindwise.
+        Results are cached by image content; pass use_cache=False when the
+        caller has already checked the cache for this image. Near-duplicates
+        of previously analyzed images (by perceptual hash) are served from
+        the stored diagnosis as well. Concurrent calls for the same image
+        share a single analysis unless coalesce=False; that is kept separate
+        from use_cache because callers that checked the cache themselves
+        still want concurrent duplicates merged, while benchmarks need every
+        call to do its own work.
+        """
+        try:
+            if not image_bytes:
+                raise ValueError("No image bytes provided")
+
+            cache = get_result_cache()
+            cache_key = image_digest(image_bytes)
+            if use_cache:
+                with span("cache_lookup"):
+                    cached = cache.get(cache_key)
+                if cached is not None:
+                    logger.info("Serving analysis from result cache")
+                    return cached
+
+            if not coalesce:
+                return self._analyze_uncached(image_bytes, cache_key)
+            return get_single_flight().do(cache_key, lambda: self._analyze_uncached(image_bytes, cache_key))
 
-            logger.info("Starting analysis with Kindwise API")
+        except Exception as e:
+            logger.error(f"Analysis failed: {str(e)}")
+            raise
 
-            # Clean base64 string
-            if base64_image.startswith('data:'):
-                base64_image = base64_image.split(',', 1)[1]
+    def _analyze_uncached(self, image_bytes: Union[bytes, memoryview], cache_key: str) -> Dict:
+        """
+        Prefilter, near-duplicate lookup, then the provider chain; stores the result.
+        """
+        cache = get_result_cache()
+        with span("prefilter"):
+            verdict = self.prefilter.check(image_bytes)
+        if not verdict.accepted:
+            # Not cached: the check is cheap, and a threshold change should
+            # re-evaluate the image rather than serve a stale rejection
+            return self._convert_prefilter_rejection(verdict).__dict__
+
+        near_index = get_near_duplicate_index()
+        image_hash = None
+        near = None
+        if near_index.enabled:
+            with span("near_duplicate_lookup"):
+                image_hash = near_index.hash_image(image_bytes)
+                if image_hash is not None:
+                    near = near_index.lookup(image_hash)
+        if near is not None:
+            cache.put(cache_key, near)
+            return near
+
+        result = self._analyze_with_providers(self._prepare_upload(image_bytes))
+        cache.put(cache_key, result)
+        if image_hash is not None:
+            near_index.add(image_hash, result)
+        return result
+
+    def _prepare_upload(self, image_bytes: Union[bytes, memoryview]) -> Union[bytes, memoryview]:
+        """
+        Downscale and re-encode the image before it is sent to a provider.
+        Falls back to the original bytes if Pillow cannot process it.
+        """
+        try:
+            with span("preprocess"):
+                return preprocess_image(image_bytes, self.preprocess_config).data
+        except Exception as e:
+            logger.warning(f"Image preprocessing skipped: {e}")
+            return image_bytes
 
-            import requests
-            
-            headers = {
-                "Content-Type": "application/json",
-                "Api-Key": self.api_key,
-            }
-            
-            payload = {
-                "images": [f"data:image/jpeg;base64,{base64_image}"],
-                "health": "all",
-                "similar_images": True
-            }
-
-            # Requesting additional details
-            query_params = {
-                "details": "common_names,cause,treatment,description,url,classification,wiki_description,taxonomy,wiki_image",
-                "language": "en"
-            }
-
-            response = requests.post(self.PLANT_ID_URL, json=payload, headers=headers, params=query_params)
-            
-            if response.status_code != 201 and response.status_code != 200:
-                logger.error(f"Kindwise API error: {response.text}")
-                raise Exception(f"API request failed with status {response.status_code}: {response.text}")
+    def _acquire_key(self, provider: str, client: Optional[HttpClient] = None) -> str:
+        """
+        Reserve one call against the provider's quota and return the key to
+        use, waiting for its token bucket if needed. The client's circuit
+        breaker is checked first, so calls it would skip don't spend quota.
+        """
+        if client is not None and not client.breaker.would_allow():
+            raise CircuitOpenError(f"{client.name} circuit is open; skipping call")
+        return self.quota.acquire(provider)
 
-            result_data = response.json()
-            logger.info("Kindwise API request completed successfully")
+    def _gemini_model_for(self, api_key: str):
+        """
+        GenerativeModel bound to a specific key. genai.configure() only holds
+        one process-wide key, so extra keys get their own service client.
+        """
+        model = self._gemini_models.get(api_key)
+        if model is None:
+            with self._gemini_models_lock:
+                model = self._gemini_models.get(api_key)
+                if model is None:
+                    model = genai.GenerativeModel('gemini-1.5-flash')
+                    if self.gemini_endpoint:
+                        options = ClientOptions(api_key=api_key, api_endpoint=self.gemini_endpoint)
+                        model._client = glm.GenerativeServiceClient(client_options=options, transport="rest")
+                    else:
+                        model._client = glm.GenerativeServiceClient(client_options=ClientOptions(api_key=api_key))
+                    self._gemini_models[api_key] = model
+        return model
+
+    def _analyze_with_providers(self, image_bytes: Union[bytes, memoryview]) -> Dict:
+        """
+        Run the provider chain (Gemini first, Kindwise second) using the
+        configured routing strategy: sequential fallback, hedged or race.
+        The local classifier, if configured, runs before the remote APIs
+        (tier "first") or only once they have failed or are out of quota
+        ("fallback"); the fallback never takes part in hedging or races.
+        With either tier, when no remote provider can answer the local
+        prediction is returned even if it is below LOCAL_MODEL_MIN_CONFIDENCE,
+        flagged as low confidence in its description.
+        """
+        providers = []
+        throttled = []
+        exhausted = []
+        has_local = self.local_classifier is not None
+        # 0. Local model first: confident answers never leave the machine
+        if has_local and self.local_tier == "first":
+            providers.append(("local", lambda: self._analyze_with_local(image_bytes, strict=True), None))
+        local_only = len(providers)
+        # 1. Gemini First (1500 free requests/day), 2. then Kindwise.
+        # Providers out of daily quota are skipped rather than tried and failed;
+        # ones that would have to wait for a rate-limit token go after the rest.
+        # Keys are acquired by the router outside the timed call
+        remote = (
+            ("gemini", self.gemini_api_keys,
+             lambda key: self._analyze_with_gemini(image_bytes, key),
+             lambda: self._acquire_key("gemini")),
+            ("kindwise", self.kindwise_api_keys,
+             lambda key: self._analyze_with_kindwise(image_bytes, key),
+             lambda: self._acquire_key("kindwise", get_http_client("kindwise", read_timeout=60))),
+        )
+        for name, keys, fn, acquire in remote:
+            if not keys:
+                continue
+            if self.quota.has_headroom(name):
+                providers.append((name, fn, acquire))
+            elif self.quota.has_budget(name):
+                throttled.append((name, fn, acquire))
+            else:
+                exhausted.append(name)
+        providers.extend(throttled)
+        if exhausted:
+            logger.info(f"Skipping providers without quota: {', '.join(exhausted)}")
+        if len(providers) == local_only:
+            # No remote provider left: a low-confidence local answer beats an error
+            if has_local:
+                return self._analyze_with_local(image_bytes, strict=False)
+            if exhausted:
+                raise QuotaExhaustedError(f"Quota exhausted for {', '.join(exhausted)}")
+        if not has_local:
+            return self.router.run(providers)
+
+        # 3. Local model as the last resort, once the routed API attempt has failed
+        try:
+            result = self.router.run(providers)
+        except Exception as e:
+            logger.warning(f"Remote providers failed, using the local model: {e}")
+            return self._analyze_with_local(image_bytes, strict=False)
+        if result.get("disease_type") == "error":
+            logger.warning("Remote providers returned no usable result, using the local model")
+            return self._analyze_with_local(image_bytes, strict=False)
+        return result
+
+    def _analyze_with_local(self, image_bytes: Union[bytes, memoryview], strict: bool) -> Dict:
+        """
+        Classify the image with the on-device model. With strict=True a
+        low-confidence prediction raises, so the router moves on to the
+        remote providers; otherwise it is returned with a warning in the
+        description.
+        """
+        with span("local_inference"):
+            prediction = self.local_classifier.predict(image_bytes)
+        low_confidence = prediction.confidence < self.local_min_confidence
+        if strict and low_confidence:
+            raise ValueError(f"Local model not confident enough ({prediction.label} "
+                             f"{prediction.confidence:.2f} < {self.local_min_confidence:.2f})")
+        result = self._convert_local_prediction(prediction)
+        if low_confidence:
+            result.description = (f"Low confidence: the on-device classifier is only "
+                                  f"{prediction.confidence * 100:.1f}% sure and no remote provider "
+                                  f"was available to confirm it. {result.description}")
+        return result.__dict__
+
+    def analyze_leaf_images_local(self, images: List[Union[bytes, memoryview]]) -> List[Dict]:
+        """
+        Classify several images with the local model in batched forward
+        passes, without touching the remote providers or the caches.
+        """
+        if self.local_classifier is None:
+            raise ValueError("No local model configured (set LOCAL_MODEL_PATH)")
+        with span("local_inference", batch="true"):
+            predictions = self.local_classifier.predict_batch(images)
+        return [self._convert_local_prediction(p).__dict__ for p in predictions]
 
+    def _convert_prefilter_rejection(self, verdict: PrefilterVerdict) -> DiseaseAnalysisResult:
+        """
+        Convert a prefilter rejection to DiseaseAnalysisResult format, in the
+        same shape as the Kindwise "not a plant" answer.
+        """
+        if verdict.reason == NOT_PLANT:
+            return DiseaseAnalysisResult(
+                plant_name="Not a Plant",
+                scientific_name="Non-plant object detected",
+                description=f"{verdict.message} Please upload a clear photo of a plant leaf.",
+                taxonomy={},
+                disease_detected=False,
+                disease_name=None,
+                disease_type="invalid_image",
+                severity="none",
+                confidence=0,
+                symptoms=["Image is not a plant"],
+                possible_causes=["Upload contained non-plant objects"],
+                treatment=["Upload a valid plant image"],
+                similar_images=[]
+            )
+        return DiseaseAnalysisResult(
+            plant_name="Unusable Photo",
+            scientific_name="Image quality check failed",
+            description=verdict.message,
+            taxonomy={},
+            disease_detected=False,
+            disease_name=None,
+            disease_type="invalid_image",
+            severity="none",
+            confidence=0,
+            symptoms=[f"Image rejected: {verdict.reason.replace('_', ' ')}"],
+            possible_causes=["Lighting, focus or framing problem"],
+            treatment=["Retake the photo in good light with the leaf in focus and filling the frame"],
+            similar_images=[]
+        )
+
+    def _convert_local_prediction(self, prediction: Prediction) -> DiseaseAnalysisResult:
+        """
+        Convert a local classifier prediction to DiseaseAnalysisResult format.
+        """
+        alternatives = ", ".join(f"{label.replace('___', ' - ').replace('_', ' ')} ({score * 100:.1f}%)"
+                                 for label, score in prediction.top_k[1:])
+        description = "Diagnosed by the on-device classifier."
+        if alternatives:
+            description += f" Other candidates: {alternatives}."
+        disease = prediction.disease
+        return DiseaseAnalysisResult(
+            plant_name=prediction.plant,
+            scientific_name="Not provided by the local model",
+            description=description,
+            taxonomy={},
+            disease_detected=disease is not None,
+            disease_name=disease,
+            disease_type="unknown" if disease else "healthy",
+            severity="moderate" if disease else "none",
+            confidence=round(prediction.confidence * 100, 2),
+            symptoms=[f"Visual pattern consistent with {disease}"] if disease else ["No pathogenic symptoms detected"],
+            possible_causes=["See treatment guidance for this disease"] if disease else ["Optimal growing conditions"],
+            treatment=["Consult an expert for specific treatment"] if disease else ["Continue standard care"],
+            similar_images=[]
+        )
+
+    def _analyze_with_kindwise(self, image_bytes: Union[bytes, memoryview], api_key: Optional[str] = None) -> Dict:
+        """
+        Send the image to the Kindwise (Plant.id) identification endpoint.
+        This is the only place the image is base64 encoded. Without an
+        api_key one is acquired from the quota manager first.
+        """
+        logger.info("Starting analysis with Kindwise API")
+        # Pooled keep-alive session with timeouts, retries and a circuit breaker
+        client = get_http_client("kindwise", read_timeout=60)
+        if api_key is None:
+            api_key = self._acquire_key("kindwise", client)
+        with span("base64_encode"):
+            base64_image = base64.b64encode(image_bytes).decode('ascii')
+
+        headers = {
+            "Content-Type": "application/json",
+            "Api-Key": api_key,
+        }
+        
+        payload = {
+            "images": [f"data:{sniff_image_mime(image_bytes)};base64,{base64_image}"],
+            "health": "all",
+            "similar_images": True
+        }
+
+        # Requesting additional details
+        query_params = {
+            "details": "common_names,cause,treatment,description,url,classification,wiki_description,taxonomy,wiki_image",
+            "language": "en"
+        }
+
+        response = client.post(self.plant_id_url, json=payload, headers=headers, params=query_params)
+
+        if response.status_code == 429:
+            retry_after = response.headers.get("Retry-After", "")
+            self.quota.mark_exhausted("kindwise", api_key,
+                                      float(retry_after) if retry_after.isdigit() else None)
+        if response.status_code != 201 and response.status_code != 200:
+            logger.error(f"Kindwise API error: {response.text}")
+            raise Exception(f"API request failed with status {response.status_code}: {response.text}")
+
+        logger.info("Kindwise API request completed successfully")
+
+        with span("parse", provider="kindwise"):
+            result_data = response.json()
             # Map Kindwise response to DiseaseAnalysisResult
             result = self._convert_plant_id_response(result_data)
-            
-            return result.__dict__
-
-        except Exception as e:
-            logger.error(f"Analysis failed: {str(e)}")
-            raise
+        
+        return result.__dict__
 
 
-    def _analyze_with_gemini(self, base64_image: str) -> Dict:
+    def _analyze_with_gemini(self, image_bytes: Union[bytes, memoryview], api_key: Optional[str] = None) -> Dict:
         """
         Use Google's Gemini-1.5-Flash model to analyze the leaf image.
+        Without an api_key one is acquired from the quota manager first.
         """
-        import PIL.Image
-        import io
-        
-        # Convert base64 to PIL Image
-        img_data = base64.b64decode(base64_image)
-        img = PIL.Image.open(io.BytesIO(img_data))
+        # Pass the encoded bytes straight through as an inline blob, so the
+        # SDK doesn't decode to pixels and re-encode the image
+        img = {"mime_type": sniff_image_mime(image_bytes), "data": bytes(image_bytes)}
+        if api_key is None:
+            api_key = self._acquire_key("gemini")
         
         prompt = "Identify the plant and any diseases present in this leaf photo. Return your response ONLY as a JSON object with this exact structure: {\"plant_name\": \"...\", \"scientific_name\": \"...\", \"description\": \"...\", \"taxonomy\": {\"class\": \"...\", \"family\": \"...\", \"genus\": \"...\"}, \"disease_detected\": true/false, \"disease_name\": \"...\", \"disease_scientific_name\": \"...\", \"disease_type\": \"...\", \"severity\": \"...\", \"confidence\": 95.0, \"symptoms\": [\"...\"], \"possible_causes\": [\"...\"], \"treatment\": [\"...\"], \"care_calendar\": {\"watering\": \"...\", \"fertilizing\": \"...\", \"pruning\": \"...\", \"sunlight\": \"...\"}, \"similar_images\": []}"
         
-        response = self.gemini_model.generate_content([prompt, img])
+        try:
+            response = self._gemini_model_for(api_key).generate_content(
+                [prompt, img], request_options={"timeout": self.gemini_timeout})
+        except google_exceptions.ResourceExhausted:
+            self.quota.mark_exhausted("gemini", api_key)
+            raise
         
-        # Clean response text (remove markdown backticks if present)
-        text = response.text
-        if "```json" in text:
-            text = text.split("```json")[1].split("```")[0]
-        elif "```" in text:
-            text = text.split("```")[1].split("```")[0]
-            
-        return json.loads(text.strip())
+        with span("parse", provider="gemini"):
+            # Clean response text (remove markdown backticks if present)
+            text = response.text
+            if "```json" in text:
+                text = text.split("```json")[1].split("```")[0]
+            elif "```" in text:
+                text = text.split("```")[1].split("```")[0]
+
+            return json.loads(text.strip())
 
     def _convert_plant_id_response(self, data: Dict) -> DiseaseAnalysisResult:
         """
@@ -171,11 +510,11 @@ class LeafDiseaseDetector:
         """
         try:
             result_section = data.get("result", {})
-            
-            # DEBUG: Print keys to understand structure
-            print(f"DEBUG: Result keys: {list(result_section.keys())}")
-            if "health_assessment" in result_section:
-                print(f"DEBUG: Health keys: {list(result_section['health_assessment'].keys())}")
+            if logger.isEnabledFor(logging.DEBUG):
+                logger.debug("Kindwise response structure", extra={
+                    "result_keys": list(result_section.keys()),
+                    "health_keys": list(result_section.get("health_assessment", {}).keys()),
+                })
             
             # --- Check if it's a plant ---
             is_plant = result_section.get("is_plant", {}).get("binary", True)
@@ -337,7 +676,7 @@ def main():
         # Example usage
         detector = LeafDiseaseDetector()
         print("Leaf Disease Detector (minimal version) initialized successfully!")
-        print("Use analyze_leaf_image_base64() method with base64 image data.")
+        print("Use analyze_leaf_image_bytes() with raw image bytes, or analyze_leaf_image_base64() with base64 data.")
 
     except Exception as e:
         print(f"Error: {str(e)}")
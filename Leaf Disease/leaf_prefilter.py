@@ -0,0 +1,218 @@
+import io
+import os
+import json
+import logging
+import threading
+from dataclasses import dataclass
+from pathlib import Path
+from typing import Dict, Optional, Union
+
+import numpy as np
+from PIL import Image
+
+from tracing import get_metrics_registry
+
+
+logger = logging.getLogger(__name__)
+
+ANALYSIS_SIDE = 512
+
+# Reasons an image is rejected before any provider call
+TOO_DARK = "too_dark"
+OVEREXPOSED = "overexposed"
+BLANK = "blank"
+BLURRY = "blurry"
+NOT_PLANT = "not_plant"
+
+
+@dataclass
+class PrefilterConfig:
+    """
+    Thresholds for the pre-provider image check. Defaults are deliberately
+    loose: only obviously unusable images are rejected.
+    """
+    enabled: bool = True
+    min_brightness: float = 20.0        # mean luma, 0-255
+    max_brightness: float = 245.0
+    min_contrast: float = 4.0           # luma standard deviation
+    # Variance of the Laplacian; low because downscaling to ANALYSIS_SIDE
+    # already smooths phone photos, and mild softness is still diagnosable.
+    # 5 rejects a radius-3 Gaussian blur (~4.4), which hides lesion edges
+    min_sharpness: float = 5.0
+    min_green_fraction: float = 0.03
+    min_plant_fraction: float = 0.15    # green plus yellow/brown tissue
+    weights_path: Optional[str] = None  # optional logistic-regression JSON
+
+    @classmethod
+    def from_env(cls) -> "PrefilterConfig":
+        return cls(
+            enabled=os.environ.get("PREFILTER_ENABLED", "true").lower() not in ("0", "false", "no"),
+            min_brightness=float(os.environ.get("PREFILTER_MIN_BRIGHTNESS", 20)),
+            max_brightness=float(os.environ.get("PREFILTER_MAX_BRIGHTNESS", 245)),
+            min_contrast=float(os.environ.get("PREFILTER_MIN_CONTRAST", 4)),
+            min_sharpness=float(os.environ.get("PREFILTER_MIN_SHARPNESS", 5)),
+            min_green_fraction=float(os.environ.get("PREFILTER_MIN_GREEN_FRACTION", 0.03)),
+            min_plant_fraction=float(os.environ.get("PREFILTER_MIN_PLANT_FRACTION", 0.15)),
+            weights_path=os.environ.get("PREFILTER_WEIGHTS") or None,
+        )
+
+
+@dataclass
+class PrefilterVerdict:
+    accepted: bool
+    reason: Optional[str]
+    features: Dict[str, float]
+    message: str = ""
+
+
+def _laplacian_variance(gray: np.ndarray) -> float:
+    # 4-neighbour Laplacian via slicing; no SciPy/OpenCV needed
+    center = gray[1:-1, 1:-1]
+    laplacian = (gray[:-2, 1:-1] + gray[2:, 1:-1] + gray[1:-1, :-2] + gray[1:-1, 2:]) - 4 * center
+    return float(laplacian.var())
+
+
+def _entropy(gray: np.ndarray) -> float:
+    histogram = np.bincount(gray.astype(np.uint8).ravel(), minlength=256).astype(np.float64)
+    p = histogram[histogram > 0] / histogram.sum()
+    return float(-(p * np.log2(p)).sum())
+
+
+def extract_features(image_bytes: Union[bytes, memoryview], side: int = ANALYSIS_SIDE) -> Dict[str, float]:
+    """
+    Colour, exposure and sharpness features from a small thumbnail.
+    """
+    with Image.open(io.BytesIO(bytes(image_bytes))) as img:
+        # Decode JPEGs at reduced scale; everything below works on <= side px
+        img.draft("RGB", (side, side))
+        img = img.convert("RGB")
+        img.thumbnail((side, side), Image.BILINEAR)
+        rgb = np.asarray(img, dtype=np.float32)
+        hsv = np.asarray(img.convert("HSV"), dtype=np.float32)
+
+    gray = rgb @ np.array([0.299, 0.587, 0.114], dtype=np.float32)
+    hue = hsv[..., 0] * (360.0 / 255.0)
+    sat = hsv[..., 1] / 255.0
+    val = hsv[..., 2] / 255.0
+
+    lit = val > 0.12
+    green = lit & (sat > 0.15) & (hue >= 60) & (hue <= 170)
+    # Yellowed or necrotic tissue on diseased leaves
+    yellow_brown = lit & (val < 0.95) & (sat > 0.2) & (hue >= 15) & (hue < 60)
+
+    total = rgb.sum(axis=2) + 1e-6
+    r, g, b = (rgb[..., i] / total for i in range(3))
+
+    return {
+        "brightness": float(gray.mean()),
+        "contrast": float(gray.std()),
+        "dark_fraction": float((gray < 16).mean()),
+        "bright_fraction": float((gray > 250).mean()),
+        "sharpness": _laplacian_variance(gray),
+        "entropy": _entropy(gray),
+        "saturation": float(sat.mean()),
+        "green_fraction": float(green.mean()),
+        "plant_fraction": float((green | yellow_brown).mean()),
+        "excess_green": float((2 * g - r - b).mean()),
+    }
+
+
+class LeafPrefilter:
+    """
+    Rejects images that are clearly unusable (black, blown out, blank,
+    with no plant-coloured pixels or blurry) before a paid provider call.
+    """
+
+    def __init__(self, config: Optional[PrefilterConfig] = None):
+        self.config = config or PrefilterConfig.from_env()
+        self.model = self._load_model(self.config.weights_path)
+        self.stats = {"checked": 0, "accepted": 0, "rejected": 0}
+        self._stats_lock = threading.Lock()
+
+    @staticmethod
+    def _load_model(path: Optional[str]) -> Optional[Dict]:
+        """
+        Tiny classifier: {"features": [...], "weights": [...], "bias": b,
+        "threshold": 0.5}, a logistic regression over extract_features().
+        """
+        if not path:
+            return None
+        try:
+            model = json.loads(Path(path).read_text(encoding="utf-8"))
+            model["weights"] = np.asarray(model["weights"], dtype=np.float64)
+            model.setdefault("bias", 0.0)
+            model.setdefault("threshold", 0.5)
+            return model
+        except Exception as e:
+            logger.warning(f"Prefilter classifier not loaded: {e}")
+            return None
+
+    def _leaf_probability(self, features: Dict[str, float]) -> float:
+        x = np.asarray([features[name] for name in self.model["features"]], dtype=np.float64)
+        return float(1.0 / (1.0 + np.exp(-(x @ self.model["weights"] + self.model["bias"]))))
+
+    def _judge(self, features: Dict[str, float]):
+        c = self.config
+        if features["brightness"] < c.min_brightness or features["dark_fraction"] > 0.95:
+            return TOO_DARK, "The photo is too dark to analyze. Retake it in better light."
+        if features["brightness"] > c.max_brightness or features["bright_fraction"] > 0.95:
+            return OVEREXPOSED, "The photo is overexposed. Avoid direct glare and retake it."
+        if features["contrast"] < c.min_contrast:
+            return BLANK, "The image is nearly a single flat colour."
+        # Colour before focus: a smooth non-leaf image (a gradient, a wall) also
+        # has almost no Laplacian energy and would otherwise be called blurry
+        if features["green_fraction"] < c.min_green_fraction and features["plant_fraction"] < c.min_plant_fraction:
+            return NOT_PLANT, "No leaf-coloured area was found in the image."
+        if features["sharpness"] < c.min_sharpness:
+            return BLURRY, "The photo is too blurry. Hold the camera steady and focus on the leaf."
+        if self.model is not None:
+            probability = self._leaf_probability(features)
+            features["leaf_probability"] = round(probability, 4)
+            if probability < self.model["threshold"]:
+                return NOT_PLANT, "The image does not look like a plant leaf."
+        return None, ""
+
+    def check(self, image_bytes: Union[bytes, memoryview]) -> PrefilterVerdict:
+        """
+        Accept or reject an image. Images Pillow can't read are accepted,
+        leaving the decision to the providers.
+        """
+        if not self.config.enabled:
+            return PrefilterVerdict(True, None, {})
+        try:
+            features = extract_features(image_bytes)
+        except Exception as e:
+            logger.warning(f"Prefilter skipped: {e}")
+            return PrefilterVerdict(True, None, {})
+
+        reason, message = self._judge(features)
+        with self._stats_lock:
+            self.stats["checked"] += 1
+            self.stats["rejected" if reason else "accepted"] += 1
+            if reason:
+                self.stats[reason] = self.stats.get(reason, 0) + 1
+        if reason:
+            logger.info(f"Prefilter rejected image: {reason}")
+            get_metrics_registry().inc("leaf_prefilter_rejections_total", 1,
+                                       "Images rejected before any provider call", reason=reason)
+        return PrefilterVerdict(reason is None, reason, features, message)
+
+    def get_stats(self) -> Dict:
+        with self._stats_lock:
+            return dict(self.stats)
+
+
+_prefilter: Optional[LeafPrefilter] = None
+_prefilter_lock = threading.Lock()
+
+
+def get_leaf_prefilter() -> LeafPrefilter:
+    """
+    Shared prefilter configured from PREFILTER_* environment variables.
+    """
+    global _prefilter
+    if _prefilter is None:
+        with _prefilter_lock:
+            if _prefilter is None:
+                _prefilter = LeafPrefilter()
+    return _prefilter
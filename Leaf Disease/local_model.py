@@ -0,0 +1,256 @@
+import io
+import os
+import logging
+import threading
+from dataclasses import dataclass, field
+from pathlib import Path
+from typing import List, Optional, Sequence, Tuple, Union
+
+import numpy as np
+from PIL import Image
+
+
+logger = logging.getLogger(__name__)
+
+IMAGENET_MEAN = np.array([0.485, 0.456, 0.406], dtype=np.float32)
+IMAGENET_STD = np.array([0.229, 0.224, 0.225], dtype=np.float32)
+
+TIERS = ("first", "fallback", "off")
+
+
+@dataclass
+class Prediction:
+    """
+    Top-k output of the local classifier for one image.
+    """
+    label: str
+    confidence: float
+    top_k: List[Tuple[str, float]] = field(default_factory=list)
+
+    @property
+    def plant(self) -> str:
+        return split_label(self.label)[0]
+
+    @property
+    def disease(self) -> Optional[str]:
+        return split_label(self.label)[1]
+
+
+def split_label(label: str) -> Tuple[str, Optional[str]]:
+    """
+    Split a PlantVillage-style label ("Tomato___Early_blight",
+    "Pepper,_bell___healthy") into (plant, disease or None if healthy).
+    """
+    plant, _, condition = label.partition("___")
+    plant = plant.replace("_", " ").replace(",", "").strip().title()
+    condition = condition.replace("_", " ").strip()
+    if not condition or condition.lower() == "healthy":
+        return plant, None
+    return plant, condition.title()
+
+
+def _softmax(logits: np.ndarray) -> np.ndarray:
+    shifted = logits - logits.max(axis=1, keepdims=True)
+    exp = np.exp(shifted)
+    return exp / exp.sum(axis=1, keepdims=True)
+
+
+class LocalClassifier:
+    """
+    CPU image classifier backed by ONNX Runtime (.onnx) or TFLite (.tflite).
+
+    predict_batch() runs one forward pass per chunk of up to `batch_size`
+    images. Models with a fixed batch dimension of 1 are run image by image.
+    """
+
+    def __init__(self, model_path: Union[str, Path],
+                 labels: Sequence[str],
+                 threads: Optional[int] = None,
+                 batch_size: int = 16,
+                 normalize: str = "imagenet"):
+        self.model_path = Path(model_path)
+        self.labels = list(labels)
+        self.threads = threads or min(4, os.cpu_count() or 1)
+        self.batch_size = max(1, batch_size)
+        self.normalize = normalize
+        self._lock = threading.Lock()
+
+        if self.model_path.suffix == ".tflite":
+            self._init_tflite()
+        else:
+            self._init_onnx()
+        logger.info(f"Local classifier loaded: {self.model_path.name} ({self.backend}, "
+                    f"{len(self.labels)} labels, {self.threads} threads)")
+
+    def _init_onnx(self) -> None:
+        import onnxruntime as ort
+
+        options = ort.SessionOptions()
+        options.intra_op_num_threads = self.threads
+        options.inter_op_num_threads = 1
+        options.graph_optimization_level = ort.GraphOptimizationLevel.ORT_ENABLE_ALL
+        self._session = ort.InferenceSession(str(self.model_path), options,
+                                             providers=["CPUExecutionProvider"])
+        model_input = self._session.get_inputs()[0]
+        self._input_name = model_input.name
+        shape = model_input.shape
+        self.channels_first = shape[1] == 3
+        self.input_size = int(shape[2] if self.channels_first else shape[1])
+        # Symbolic (str/None) first dimension means any batch size works
+        self.fixed_batch = isinstance(shape[0], int) and shape[0] == 1
+        self.backend = "onnx"
+
+    def _init_tflite(self) -> None:
+        try:
+            from tflite_runtime.interpreter import Interpreter
+        except ImportError:
+            from tensorflow.lite import Interpreter
+
+        self._interpreter = Interpreter(model_path=str(self.model_path), num_threads=self.threads)
+        self._interpreter.allocate_tensors()
+        details = self._interpreter.get_input_details()[0]
+        self._input_index = details["index"]
+        output = self._interpreter.get_output_details()[0]
+        self._output_index = output["index"]
+        self._input_dtype = details["dtype"]
+        self._input_quant = details.get("quantization", (0.0, 0))
+        self._output_quant = output.get("quantization", (0.0, 0))
+        self._allocated_batch = int(details["shape"][0])
+        self.channels_first = False
+        self.input_size = int(details["shape"][1])
+        self.fixed_batch = False
+        self.backend = "tflite"
+
+    def _load(self, image_bytes: Union[bytes, memoryview]) -> np.ndarray:
+        size = self.input_size
+        with Image.open(io.BytesIO(bytes(image_bytes))) as img:
+            # JPEG draft decodes at 1/2..1/8 scale, far cheaper than a full decode
+            img.draft("RGB", (size, size))
+            pixels = np.asarray(img.convert("RGB").resize((size, size), Image.BILINEAR),
+                                dtype=np.float32) / 255.0
+        if self.normalize == "imagenet":
+            pixels = (pixels - IMAGENET_MEAN) / IMAGENET_STD
+        return pixels
+
+    def _batch_tensor(self, images: Sequence[Union[bytes, memoryview]]) -> np.ndarray:
+        batch = np.stack([self._load(image) for image in images])
+        if self.channels_first:
+            batch = batch.transpose(0, 3, 1, 2)
+        return np.ascontiguousarray(batch, dtype=np.float32)
+
+    def _run_onnx(self, batch: np.ndarray) -> np.ndarray:
+        if self.fixed_batch and len(batch) > 1:
+            return np.concatenate([self._run_onnx(batch[i:i + 1]) for i in range(len(batch))])
+        # InferenceSession.run is thread-safe; no lock needed
+        return self._session.run(None, {self._input_name: batch})[0]
+
+    def _run_tflite(self, batch: np.ndarray) -> np.ndarray:
+        if self._input_dtype != np.float32:
+            scale, zero_point = self._input_quant
+            batch = np.clip(np.rint(batch / (scale or 1.0) + zero_point),
+                            np.iinfo(self._input_dtype).min, np.iinfo(self._input_dtype).max)
+            batch = batch.astype(self._input_dtype)
+        with self._lock:
+            if len(batch) != self._allocated_batch:
+                self._interpreter.resize_tensor_input(self._input_index, list(batch.shape))
+                self._interpreter.allocate_tensors()
+                self._allocated_batch = len(batch)
+            self._interpreter.set_tensor(self._input_index, batch)
+            self._interpreter.invoke()
+            raw = np.array(self._interpreter.get_tensor(self._output_index), dtype=np.float32)
+        # Quantized models emit uint8/int8 scores; a scale of 0 means a float output
+        scale, zero_point = self._output_quant
+        if scale:
+            raw = (raw - zero_point) * scale
+        return raw
+
+    def _scores(self, batch: np.ndarray) -> np.ndarray:
+        raw = self._run_tflite(batch) if self.backend == "tflite" else self._run_onnx(batch)
+        raw = raw.reshape(len(batch), -1).astype(np.float32)
+        # Accept models that end in softmax as well as ones that emit logits
+        sums = raw.sum(axis=1)
+        if (raw >= 0).all() and np.allclose(sums, 1.0, atol=1e-3):
+            return raw
+        return _softmax(raw)
+
+    def predict_batch(self, images: Sequence[Union[bytes, memoryview]], top_k: int = 3) -> List[Prediction]:
+        """
+        Classify encoded images (JPEG, PNG, ...), in input order.
+        """
+        predictions: List[Prediction] = []
+        for start in range(0, len(images), self.batch_size):
+            scores = self._scores(self._batch_tensor(images[start:start + self.batch_size]))
+            order = np.argsort(-scores, axis=1)[:, :top_k]
+            for row, indices in zip(scores, order):
+                ranked = [(self._label(i), float(row[i])) for i in indices]
+                predictions.append(Prediction(label=ranked[0][0], confidence=ranked[0][1], top_k=ranked))
+        return predictions
+
+    def predict(self, image_bytes: Union[bytes, memoryview], top_k: int = 3) -> Prediction:
+        return self.predict_batch([image_bytes], top_k)[0]
+
+    def _label(self, index: int) -> str:
+        return self.labels[index] if index < len(self.labels) else f"class_{index}"
+
+    def warm_up(self, runs: int = 2) -> None:
+        """
+        Run a few dummy passes so the first real request doesn't pay for
+        kernel selection and memory arena growth.
+        """
+        shape = (1, 3, self.input_size, self.input_size) if self.channels_first \
+            else (1, self.input_size, self.input_size, 3)
+        dummy = np.zeros(shape, dtype=np.float32)
+        for _ in range(runs):
+            self._scores(dummy)
+
+
+def _read_labels(path: Path) -> List[str]:
+    return [line.strip() for line in path.read_text(encoding="utf-8").splitlines() if line.strip()]
+
+
+_classifier: Optional[LocalClassifier] = None
+_classifier_loaded = False
+_classifier_lock = threading.Lock()
+
+
+def local_model_tier() -> str:
+    """
+    Where the local model sits in the provider chain, from LOCAL_MODEL_TIER:
+    "first" (before the remote APIs), "fallback" (after them) or "off".
+    """
+    tier = os.environ.get("LOCAL_MODEL_TIER", "first").lower()
+    return tier if tier in TIERS else "first"
+
+
+def get_local_classifier() -> Optional[LocalClassifier]:
+    """
+    Shared classifier from LOCAL_MODEL_PATH, or None when no model is
+    configured or it cannot be loaded. Labels come from LOCAL_MODEL_LABELS
+    (default: labels.txt next to the model); LOCAL_MODEL_THREADS and
+    LOCAL_MODEL_BATCH_SIZE tune inference. Warmed up on first load.
+    """
+    global _classifier, _classifier_loaded
+    if _classifier_loaded:
+        return _classifier
+    with _classifier_lock:
+        if _classifier_loaded:
+            return _classifier
+        model_path = os.environ.get("LOCAL_MODEL_PATH")
+        if model_path and local_model_tier() != "off":
+            try:
+                path = Path(model_path)
+                labels_path = Path(os.environ.get("LOCAL_MODEL_LABELS", path.with_name("labels.txt")))
+                threads = int(os.environ.get("LOCAL_MODEL_THREADS", 0)) or None
+                classifier = LocalClassifier(
+                    path,
+                    _read_labels(labels_path),
+                    threads=threads,
+                    batch_size=int(os.environ.get("LOCAL_MODEL_BATCH_SIZE", 16)),
+                    normalize=os.environ.get("LOCAL_MODEL_NORMALIZE", "imagenet").lower(),
+                )
+                classifier.warm_up()
+                _classifier = classifier
+            except Exception as e:
+                logger.warning(f"Local classifier unavailable: {e}")
+        _classifier_loaded = True
+    return _classifier
@@ -0,0 +1,125 @@
+import os
+import sys
+import copy
+import json
+import atexit
+import random
+import logging
+import threading
+from datetime import datetime, timezone
+from logging.handlers import QueueHandler, QueueListener
+from queue import SimpleQueue
+from typing import Optional
+
+
+# Attributes every LogRecord has; anything else came in through extra=
+_RESERVED = set(vars(logging.LogRecord("", 0, "", 0, "", (), None))) | {"message", "asctime"}
+
+_listener: Optional[QueueListener] = None
+_configure_lock = threading.Lock()
+
+
+class JsonFormatter(logging.Formatter):
+    """
+    One JSON object per line with timestamp, level, logger, message and
+    any fields passed through extra=.
+    """
+
+    def format(self, record: logging.LogRecord) -> str:
+        entry = {
+            "ts": datetime.fromtimestamp(record.created, timezone.utc).isoformat(timespec="milliseconds"),
+            "level": record.levelname,
+            "logger": record.name,
+            "message": record.getMessage(),
+        }
+        for key, value in record.__dict__.items():
+            if key not in _RESERVED and not key.startswith("_"):
+                entry[key] = value
+        if record.exc_info and not record.exc_text:
+            record.exc_text = self.formatException(record.exc_info)
+        if record.exc_text:
+            entry["exc_info"] = record.exc_text
+        return json.dumps(entry, default=str)
+
+
+class SamplingFilter(logging.Filter):
+    """
+    Keeps a fraction of records below `min_level`; warnings and errors
+    always pass.
+    """
+
+    def __init__(self, rate: float = 1.0, min_level: int = logging.WARNING):
+        super().__init__()
+        self.rate = max(0.0, min(1.0, rate))
+        self.min_level = min_level
+
+    def filter(self, record: logging.LogRecord) -> bool:
+        if record.levelno >= self.min_level or self.rate >= 1.0:
+            return True
+        return random.random() < self.rate
+
+
+class _NonFormattingQueueHandler(QueueHandler):
+    # The stock QueueHandler runs the full formatter on the calling thread.
+    # Here only the message is rendered there (so mutable args and extra=
+    # values are captured as they are at the call site); timestamps, layout
+    # and JSON encoding are left to the listener thread.
+    def prepare(self, record: logging.LogRecord) -> logging.LogRecord:
+        record.msg = record.getMessage()
+        record.args = None
+        for key, value in record.__dict__.items():
+            if key not in _RESERVED and isinstance(value, (dict, list, set)):
+                record.__dict__[key] = copy.deepcopy(value)
+        if record.exc_info and not record.exc_text:
+            record.exc_text = logging.Formatter().formatException(record.exc_info)
+        record.exc_info = None
+        return record
+
+
+def configure_logging(force: bool = False) -> None:
+    """
+    Route the root logger through a background queue. Configured from
+    LOG_LEVEL (default INFO), LOG_FORMAT (text|json), LOG_FILE and
+    LOG_SAMPLE_RATE (fraction of sub-warning records kept, default 1).
+    Safe to call more than once.
+    """
+    global _listener
+    with _configure_lock:
+        if _listener is not None and not force:
+            return
+        if _listener is not None:
+            _listener.stop()
+
+        if os.environ.get("LOG_FORMAT", "text").lower() == "json":
+            formatter = JsonFormatter()
+        else:
+            formatter = logging.Formatter('%(asctime)s - %(levelname)s - %(message)s')
+
+        handlers = [logging.StreamHandler(sys.stderr)]
+        log_file = os.environ.get("LOG_FILE")
+        if log_file:
+            handlers.append(logging.FileHandler(log_file, encoding="utf-8"))
+        for handler in handlers:
+            handler.setFormatter(formatter)
+
+        queue = SimpleQueue()
+        queue_handler = _NonFormattingQueueHandler(queue)
+        queue_handler.addFilter(SamplingFilter(float(os.environ.get("LOG_SAMPLE_RATE", 1.0))))
+
+        root = logging.getLogger()
+        for existing in list(root.handlers):
+            root.removeHandler(existing)
+        root.addHandler(queue_handler)
+        root.setLevel(os.environ.get("LOG_LEVEL", "INFO").upper())
+
+        _listener = QueueListener(queue, *handlers, respect_handler_level=True)
+        _listener.start()
+
+
+def _stop_listener() -> None:
+    # Flush whatever is still queued at interpreter exit
+    if _listener is not None:
+        _listener.stop()
+
+
+atexit.register(_stop_listener)
@@ -0,0 +1,218 @@
+import io
+import os
+import copy
+import logging
+import threading
+from collections import deque
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+import numpy as np
+import PIL.Image
+
+
+logger = logging.getLogger(__name__)
+
+HASH_SIZE = 8  # 8x8 bits -> 64-bit hashes
+
+
+def _load_gray(image_bytes: bytes, size: Tuple[int, int]) -> np.ndarray:
+    img = PIL.Image.open(io.BytesIO(image_bytes))
+    # JPEG draft mode decodes at reduced scale, which is all a hash needs
+    img.draft('L', (size[0] * 4, size[1] * 4))
+    img = img.convert('L').resize(size, PIL.Image.LANCZOS)
+    return np.asarray(img, dtype=np.float32)
+
+
+def _bits_to_int(bits: np.ndarray) -> int:
+    return int.from_bytes(np.packbits(bits.flatten().astype(np.uint8)).tobytes(), 'big')
+
+
+def average_hash(image_bytes: bytes) -> int:
+    """
+    aHash: pixels brighter than the mean of an 8x8 thumbnail.
+    """
+    pixels = _load_gray(image_bytes, (HASH_SIZE, HASH_SIZE))
+    return _bits_to_int(pixels > pixels.mean())
+
+
+def difference_hash(image_bytes: bytes) -> int:
+    """
+    dHash: horizontal brightness gradients of a 9x8 thumbnail.
+    """
+    pixels = _load_gray(image_bytes, (HASH_SIZE + 1, HASH_SIZE))
+    return _bits_to_int(pixels[:, 1:] > pixels[:, :-1])
+
+
+_DCT_SIZE = HASH_SIZE * 4
+_n = np.arange(_DCT_SIZE)
+_DCT_MATRIX = np.cos(np.pi * (2 * _n[None, :] + 1) * _n[:, None] / (2 * _DCT_SIZE))
+
+
+def perceptual_hash(image_bytes: bytes) -> int:
+    """
+    pHash: low-frequency DCT coefficients of a 32x32 thumbnail compared
+    to their median. Robust to re-compression and small rescales.
+    """
+    pixels = _load_gray(image_bytes, (_DCT_SIZE, _DCT_SIZE))
+    dct = _DCT_MATRIX @ pixels @ _DCT_MATRIX.T
+    low = dct[:HASH_SIZE, :HASH_SIZE]
+    return _bits_to_int(low > np.median(low))
+
+
+HASH_FUNCTIONS: Dict[str, Callable[[bytes], int]] = {
+    "ahash": average_hash,
+    "dhash": difference_hash,
+    "phash": perceptual_hash,
+}
+
+
+def hamming_distance(a: int, b: int) -> int:
+    return bin(a ^ b).count('1')
+
+
+class BKTree:
+    """
+    Burkhard-Keller tree over 64-bit hashes for Hamming-radius queries.
+    """
+
+    def __init__(self):
+        # node: [hash, payload, {distance: child}]
+        self._root: Optional[list] = None
+        self._size = 0
+
+    def add(self, item: int, payload: Any) -> None:
+        node = [item, payload, {}]
+        self._size += 1
+        if self._root is None:
+            self._root = node
+            return
+        current = self._root
+        while True:
+            d = hamming_distance(item, current[0])
+            if d == 0:
+                # Same hash: keep the newest payload
+                current[1] = payload
+                self._size -= 1
+                return
+            child = current[2].get(d)
+            if child is None:
+                current[2][d] = node
+                return
+            current = child
+
+    def search(self, item: int, max_distance: int) -> List[Tuple[int, int, Any]]:
+        """
+        Return (distance, hash, payload) for every entry within max_distance.
+        """
+        if self._root is None:
+            return []
+        matches = []
+        stack = [self._root]
+        while stack:
+            node = stack.pop()
+            d = hamming_distance(item, node[0])
+            if d <= max_distance:
+                matches.append((d, node[0], node[1]))
+            # Triangle inequality: only children in [d - r, d + r] can match
+            for child_d, child in node[2].items():
+                if d - max_distance <= child_d <= d + max_distance:
+                    stack.append(child)
+        return matches
+
+    def __len__(self) -> int:
+        return self._size
+
+
+class NearDuplicateIndex:
+    """
+    Maps perceptual hashes of analyzed images to their diagnoses so that
+    re-photographed or re-compressed copies can be answered locally.
+    """
+
+    def __init__(self, max_distance: int = 6, algorithm: str = "phash",
+                 max_entries: int = 5000):
+        if algorithm not in HASH_FUNCTIONS:
+            raise ValueError(f"Unknown hash algorithm: {algorithm}")
+        self.max_distance = max_distance
+        self.algorithm = algorithm
+        self.max_entries = max_entries
+        self._hash_fn = HASH_FUNCTIONS[algorithm]
+        self._tree = BKTree()
+        self._order: deque = deque()
+        self._lock = threading.Lock()
+        self.stats = {"hits": 0, "misses": 0}
+
+    @property
+    def enabled(self) -> bool:
+        return self.max_distance >= 0 and self.max_entries > 0
+
+    def hash_image(self, image_bytes: bytes) -> Optional[int]:
+        try:
+            return self._hash_fn(image_bytes)
+        except Exception as e:
+            logger.warning(f"Perceptual hash failed: {e}")
+            return None
+
+    def lookup(self, image_hash: int) -> Optional[Dict]:
+        """
+        Return a copy of the closest stored diagnosis within the threshold.
+        """
+        with self._lock:
+            matches = self._tree.search(image_hash, self.max_distance)
+            if not matches:
+                self.stats["misses"] += 1
+                return None
+            self.stats["hits"] += 1
+            distance, _, result = min(matches, key=lambda m: m[0])
+        logger.info(f"Near-duplicate image found ({self.algorithm} distance {distance})")
+        return copy.deepcopy(result)
+
+    def add(self, image_hash: int, result: Dict) -> None:
+        if not result or result.get("disease_type") == "error":
+            return
+        with self._lock:
+            self._tree.add(image_hash, copy.deepcopy(result))
+            self._order.append(image_hash)
+            if len(self._order) > self.max_entries:
+                self._rebuild()
+
+    def _rebuild(self) -> None:
+        # BK-trees don't support deletion; rebuild from the newest half
+        keep = list(self._order)[-(self.max_entries // 2):]
+        old_tree = self._tree
+        self._tree = BKTree()
+        self._order = deque()
+        for h in keep:
+            for _, stored_hash, payload in old_tree.search(h, 0):
+                self._tree.add(stored_hash, payload)
+                self._order.append(stored_hash)
+
+    def get_stats(self) -> Dict:
+        with self._lock:
+            stats = dict(self.stats)
+            stats["entries"] = len(self._tree)
+        stats["max_distance"] = self.max_distance
+        stats["algorithm"] = self.algorithm
+        return stats
+
+
+_index: Optional[NearDuplicateIndex] = None
+_index_lock = threading.Lock()
+
+
+def get_near_duplicate_index() -> NearDuplicateIndex:
+    """
+    Process-wide near-duplicate index, configured from the environment:
+    NEAR_DUPLICATE_DISTANCE (bits, -1 disables), NEAR_DUPLICATE_HASH
+    (ahash, dhash or phash) and NEAR_DUPLICATE_MAX_ENTRIES.
+    """
+    global _index
+    if _index is None:
+        with _index_lock:
+            if _index is None:
+                _index = NearDuplicateIndex(
+                    max_distance=int(os.environ.get("NEAR_DUPLICATE_DISTANCE", 6)),
+                    algorithm=os.environ.get("NEAR_DUPLICATE_HASH", "phash"),
+                    max_entries=int(os.environ.get("NEAR_DUPLICATE_MAX_ENTRIES", 5000)),
+                )
+    return _index
@@ -0,0 +1,141 @@
+import io
+import os
+import logging
+import threading
+from dataclasses import dataclass
+from typing import Dict, Tuple, Union
+
+import PIL.Image
+import PIL.ImageOps
+
+
+logger = logging.getLogger(__name__)
+
+# Formats the providers accept as-is; anything else (BMP, TIFF, GIF...) is
+# always re-encoded so it is never sent under the wrong MIME type
+PROVIDER_FORMATS = ("JPEG", "PNG", "WEBP")
+
+
+@dataclass
+class PreprocessConfig:
+    """
+    Settings for the downscale/re-encode stage run before provider calls.
+    """
+    enabled: bool = True
+    max_side: int = 1600          # longest edge in pixels (~1.9 MP at 4:3)
+    output_format: str = "JPEG"   # JPEG or WEBP
+    quality: int = 85
+    min_input_bytes: int = 200 * 1024  # smaller uploads are sent as-is
+
+    @classmethod
+    def from_env(cls) -> "PreprocessConfig":
+        return cls(
+            enabled=os.environ.get("PREPROCESS_ENABLED", "1").lower() not in ("0", "false", "no"),
+            max_side=int(os.environ.get("PREPROCESS_MAX_SIDE", 1600)),
+            output_format=os.environ.get("PREPROCESS_FORMAT", "JPEG").upper(),
+            quality=int(os.environ.get("PREPROCESS_QUALITY", 85)),
+            min_input_bytes=int(os.environ.get("PREPROCESS_MIN_BYTES", 200 * 1024)),
+        )
+
+
+@dataclass
+class PreprocessResult:
+    """
+    Output of preprocess_image, with the size bookkeeping for reporting.
+    """
+    data: Union[bytes, memoryview]
+    original_bytes: int
+    output_bytes: int
+    original_size: Tuple[int, int]
+    output_size: Tuple[int, int]
+    changed: bool
+
+    @property
+    def bytes_saved(self) -> int:
+        return self.original_bytes - self.output_bytes
+
+
+# Running totals across the process
+_stats = {"images": 0, "reencoded": 0, "bytes_in": 0, "bytes_out": 0}
+_stats_lock = threading.Lock()
+
+
+def _record(result: PreprocessResult) -> None:
+    with _stats_lock:
+        _stats["images"] += 1
+        _stats["reencoded"] += int(result.changed)
+        _stats["bytes_in"] += result.original_bytes
+        _stats["bytes_out"] += result.output_bytes
+
+
+def get_preprocess_stats() -> Dict:
+    with _stats_lock:
+        stats = dict(_stats)
+    stats["bytes_saved"] = stats["bytes_in"] - stats["bytes_out"]
+    return stats
+
+
+def _needs_transpose(img: PIL.Image.Image) -> bool:
+    try:
+        return img.getexif().get(0x0112, 1) != 1  # EXIF Orientation tag
+    except Exception:
+        return False
+
+
+def preprocess_image(image_bytes: Union[bytes, memoryview],
+                     config: PreprocessConfig) -> PreprocessResult:
+    """
+    Fix EXIF orientation, bound the longest edge to config.max_side and
+    re-encode at config.quality. The original bytes are returned unchanged
+    when the image is already small, or when re-encoding would not help,
+    unless they are in a format the providers don't take.
+    """
+    original_bytes = len(image_bytes)
+    img = PIL.Image.open(io.BytesIO(image_bytes))
+    original_size = img.size
+    unchanged = PreprocessResult(image_bytes, original_bytes, original_bytes,
+                                 original_size, original_size, False)
+
+    foreign = img.format not in PROVIDER_FORMATS
+    if not config.enabled and not foreign:
+        return unchanged
+
+    oversized = config.enabled and max(original_size) > config.max_side
+    rotated = _needs_transpose(img)
+    if not oversized and not rotated and not foreign and original_bytes < config.min_input_bytes:
+        _record(unchanged)
+        return unchanged
+
+    # JPEG draft mode lets libjpeg decode at 1/2, 1/4 or 1/8 scale directly
+    if img.format == "JPEG" and oversized:
+        img.draft("RGB", (config.max_side, config.max_side))
+
+    img = PIL.ImageOps.exif_transpose(img)
+
+    if config.enabled and max(img.size) > config.max_side:
+        # Cheap integer box reduction first, then a high quality final pass
+        factor = max(img.size) // config.max_side
+        if factor >= 2:
+            img = img.reduce(factor)
+        img.thumbnail((config.max_side, config.max_side), PIL.Image.LANCZOS)
+
+    if img.mode not in ("RGB", "L"):
+        img = img.convert("RGB")
+
+    out = io.BytesIO()
+    save_kwargs = {"quality": config.quality}
+    if config.output_format == "JPEG":
+        save_kwargs["optimize"] = True
+    img.save(out, format=config.output_format, **save_kwargs)
+
+    if out.tell() >= original_bytes and not rotated and not foreign:
+        _record(unchanged)
+        return unchanged
+
+    result = PreprocessResult(out.getbuffer(), original_bytes, out.tell(),
+                              original_size, img.size, True)
+    _record(result)
+    logger.info(f"Preprocessed image {original_size} -> {img.size}, "
+                f"{original_bytes} -> {result.output_bytes} bytes "
+                f"({result.bytes_saved} saved)")
+    return result
@@ -0,0 +1,219 @@
+import os
+import time
+import logging
+import threading
+from collections import defaultdict, deque
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+from tracing import span
+
+
+logger = logging.getLogger(__name__)
+
+STRATEGIES = ("sequential", "hedged", "race")
+
+# (name, call, acquire): acquire(), if given, runs before the timed part
+# (e.g. waiting for quota) and its result is passed to call
+Provider = Tuple[str, Callable[..., Dict], Optional[Callable[[], Any]]]
+
+
+class LatencyTracker:
+    """
+    Rolling window of successful call latencies per provider.
+    """
+
+    def __init__(self, window: int = 200):
+        self.window = window
+        self._latencies: Dict[str, deque] = defaultdict(lambda: deque(maxlen=self.window))
+        self._counts: Dict[str, Dict[str, int]] = defaultdict(lambda: {"success": 0, "failure": 0})
+        self._lock = threading.Lock()
+
+    def record(self, provider: str, seconds: float, success: bool) -> None:
+        with self._lock:
+            if success:
+                self._latencies[provider].append(seconds)
+                self._counts[provider]["success"] += 1
+            else:
+                self._counts[provider]["failure"] += 1
+
+    def percentile(self, provider: str, p: float, min_samples: int = 20) -> Optional[float]:
+        """
+        p-th percentile (0-1) of recent latencies, or None with too few samples.
+        """
+        with self._lock:
+            samples = sorted(self._latencies.get(provider, ()))
+        if len(samples) < min_samples:
+            return None
+        return samples[min(len(samples) - 1, int(p * len(samples)))]
+
+    def get_stats(self) -> Dict:
+        with self._lock:
+            providers = set(self._latencies) | set(self._counts)
+            snapshot = {name: (sorted(self._latencies.get(name, ())), dict(self._counts[name]))
+                        for name in providers}
+        stats = {}
+        for name, (samples, counts) in snapshot.items():
+            entry = dict(counts)
+            if samples:
+                entry["p50"] = round(samples[len(samples) // 2], 3)
+                entry["p95"] = round(samples[min(len(samples) - 1, int(0.95 * len(samples)))], 3)
+            stats[name] = entry
+        return stats
+
+
+_tracker = LatencyTracker()
+_pool: Optional[ThreadPoolExecutor] = None
+_pool_lock = threading.Lock()
+
+
+def get_latency_tracker() -> LatencyTracker:
+    return _tracker
+
+
+def _get_pool() -> ThreadPoolExecutor:
+    # Separate from the detection pool so hedged calls can't starve it
+    global _pool
+    if _pool is None:
+        with _pool_lock:
+            if _pool is None:
+                _pool = ThreadPoolExecutor(max_workers=int(os.environ.get("PROVIDER_WORKERS", 16)),
+                                           thread_name_prefix="leaf-provider")
+    return _pool
+
+
+def _is_valid(result: Dict) -> bool:
+    return bool(result) and result.get("disease_type") != "error"
+
+
+class ProviderRouter:
+    """
+    Decides how the provider chain is run:
+
+    - sequential: try each provider in order, falling back on failure
+    - hedged: start the next provider if the current one hasn't answered
+      within its observed latency percentile (or hedge_delay until enough
+      samples exist)
+    - race: start all providers at once and take the first valid result
+
+    Losing calls are not interrupted; their results are discarded.
+    """
+
+    def __init__(self, strategy: str = "sequential",
+                 hedge_delay: float = 8.0,
+                 hedge_percentile: float = 0.95,
+                 min_hedge_delay: float = 0.5,
+                 tracker: Optional[LatencyTracker] = None):
+        if strategy not in STRATEGIES:
+            raise ValueError(f"Unknown provider strategy: {strategy}")
+        self.strategy = strategy
+        self.hedge_delay = hedge_delay
+        self.hedge_percentile = hedge_percentile
+        self.min_hedge_delay = min_hedge_delay
+        self.tracker = tracker or _tracker
+
+    @classmethod
+    def from_env(cls) -> "ProviderRouter":
+        return cls(
+            strategy=os.environ.get("PROVIDER_STRATEGY", "sequential").lower(),
+            hedge_delay=float(os.environ.get("HEDGE_DELAY", 8.0)),
+            hedge_percentile=float(os.environ.get("HEDGE_PERCENTILE", 0.95)),
+        )
+
+    def deadline_for(self, provider: str) -> float:
+        observed = self.tracker.percentile(provider, self.hedge_percentile)
+        if observed is None:
+            return self.hedge_delay
+        return max(self.min_hedge_delay, observed)
+
+    def _timed(self, name: str, fn: Callable[..., Dict], acquire: Optional[Callable[[], Any]] = None) -> Dict:
+        """
+        Call one provider, recording its latency. Time spent in acquire is
+        traced as its own quota_wait stage and kept out of the latency
+        samples, so queuing for quota doesn't stretch the hedge deadlines.
+        """
+        args = ()
+        if acquire is not None:
+            try:
+                with span("quota_wait", provider=name):
+                    args = (acquire(),)
+            except Exception:
+                self.tracker.record(name, 0.0, False)
+                raise
+        start = time.monotonic()
+        try:
+            with span("provider", provider=name):
+                result = fn(*args)
+        except Exception:
+            self.tracker.record(name, time.monotonic() - start, False)
+            raise
+        self.tracker.record(name, time.monotonic() - start, _is_valid(result))
+        return result
+
+    def run(self, providers: List[Provider]) -> Dict:
+        if not providers:
+            raise ValueError("No API keys found (GEMINI or KINDWISE). Please check your Secrets.")
+        if self.strategy == "sequential" or len(providers) == 1:
+            return self._run_sequential(providers)
+        return self._run_concurrent(providers)
+
+    def _run_sequential(self, providers: List[Provider]) -> Dict:
+        fallback_result = None
+        last_error: Optional[Exception] = None
+        for name, fn, acquire in providers:
+            try:
+                result = self._timed(name, fn, acquire)
+            except Exception as e:
+                logger.warning(f"{name} analysis failed: {e}")
+                last_error = e
+                continue
+            if _is_valid(result):
+                return result
+            fallback_result = fallback_result or result
+        if fallback_result is not None:
+            return fallback_result
+        raise last_error
+
+    def _run_concurrent(self, providers: List[Provider]) -> Dict:
+        pool = _get_pool()
+        queue = list(providers)
+        pending = {}
+        fallback_result = None
+        last_error: Optional[Exception] = None
+
+        def launch():
+            name, fn, acquire = queue.pop(0)
+            logger.info(f"Starting analysis with {name}")
+            pending[pool.submit(self._timed, name, fn, acquire)] = name
+
+        launch()
+        if self.strategy == "race":
+            while queue:
+                launch()
+
+        while pending:
+            # Hedge: give the newest call until its deadline before adding the next
+            timeout = self.deadline_for(list(pending.values())[-1]) if queue else None
+            done, _ = wait(pending, timeout=timeout, return_when=FIRST_COMPLETED)
+            if not done:
+                logger.info(f"No answer within {timeout:.2f}s, hedging with {queue[0][0]}")
+                launch()
+                continue
+            for future in done:
+                name = pending.pop(future)
+                try:
+                    result = future.result()
+                except Exception as e:
+                    logger.warning(f"{name} analysis failed: {e}")
+                    last_error = e
+                    continue
+                if _is_valid(result):
+                    return result
+                fallback_result = fallback_result or result
+            if queue and not pending:
+                # Everything in flight failed fast; fall back immediately
+                launch()
+
+        if fallback_result is not None:
+            return fallback_result
+        raise last_error
@@ -0,0 +1,317 @@
+import os
+import time
+import atexit
+import sqlite3
+import hashlib
+import logging
+import threading
+from datetime import datetime, timezone
+from typing import Dict, List, Optional
+
+from batch_executor import RateLimiter
+
+
+logger = logging.getLogger(__name__)
+
+# Free-tier daily request budgets; 0 means unlimited
+DEFAULT_DAILY_QUOTAS = {"gemini": 1500, "kindwise": 0}
+
+
+class QuotaExhaustedError(Exception):
+    """
+    Raised when no key for a provider has budget left.
+    """
+
+
+def key_id(api_key: str) -> str:
+    # Never store or log raw keys
+    return hashlib.sha256(api_key.encode("utf-8")).hexdigest()[:12]
+
+
+def _today() -> str:
+    return datetime.now(timezone.utc).strftime("%Y-%m-%d")
+
+
+class KeyQuota:
+    """
+    Usage state for one API key: a per-minute token bucket, a daily budget
+    (UTC days) and a cooldown after the provider answers 429.
+    """
+
+    def __init__(self, provider: str, api_key: str, per_minute: float, burst: int, daily_limit: int):
+        self.provider = provider
+        self.api_key = api_key
+        self.id = key_id(api_key)
+        self.limiter = RateLimiter(per_minute / 60.0, burst) if per_minute > 0 else None
+        self.daily_limit = daily_limit
+        self.day = _today()
+        self.used = 0
+        self.blocked_until = 0.0
+
+    def _roll_day(self) -> None:
+        today = _today()
+        if today != self.day:
+            self.day = today
+            self.used = 0
+
+    def has_budget(self, now: float) -> bool:
+        self._roll_day()
+        if now < self.blocked_until:
+            return False
+        return not self.daily_limit or self.used < self.daily_limit
+
+    def wait_for_token(self) -> float:
+        # Seconds until the token bucket allows a call; 0 when unthrottled
+        return self.limiter.time_until_token() if self.limiter is not None else 0.0
+
+    def row(self):
+        return (self.provider, self.id, self.day, self.used, self.blocked_until)
+
+    def remaining(self) -> Optional[int]:
+        self._roll_day()
+        return max(0, self.daily_limit - self.used) if self.daily_limit else None
+
+
+class QuotaManager:
+    """
+    Hands out API keys per provider: round-robin over the provider's keys,
+    skipping keys that are out of daily budget or cooling down after a 429,
+    and waiting on the per-key token bucket when every key is rate limited.
+    Daily usage and cooldowns are stored in SQLite (if db_path is set) so
+    they survive restarts; usage writes are batched every flush_interval
+    seconds, so a crash loses at most that much accounting.
+    """
+
+    def __init__(self, db_path: Optional[str] = None, max_wait: float = 30.0, cooldown: float = 60.0,
+                 flush_interval: float = 5.0):
+        self.max_wait = max_wait
+        self.cooldown = cooldown
+        self.flush_interval = flush_interval
+        self._keys: Dict[str, List[KeyQuota]] = {}
+        self._next: Dict[str, int] = {}
+        self._lock = threading.Lock()
+        # Entries changed since the last flush, keyed by (provider, key id)
+        self._dirty: Dict[tuple, KeyQuota] = {}
+        self._last_flush = time.monotonic()
+        self._db_lock = threading.Lock()
+        self._db = None
+        if db_path:
+            try:
+                self._db = sqlite3.connect(db_path, check_same_thread=False)
+                self._db.execute(
+                    "CREATE TABLE IF NOT EXISTS usage ("
+                    "provider TEXT NOT NULL, key_id TEXT NOT NULL, day TEXT NOT NULL, "
+                    "used INTEGER NOT NULL, blocked_until REAL NOT NULL DEFAULT 0, "
+                    "PRIMARY KEY (provider, key_id, day))"
+                )
+                self._db.commit()
+            except sqlite3.Error as e:
+                logger.warning(f"Quota usage will not be persisted: {e}")
+                self._db = None
+
+    def register(self, provider: str, api_keys: List[str]) -> None:
+        """
+        Set the provider's keys, e.g. after credentials rotate: keys no
+        longer listed are dropped, keys still listed keep their usage state.
+        Limits come from <PROVIDER>_RATE_LIMIT, <PROVIDER>_RATE_BURST and
+        <PROVIDER>_DAILY_QUOTA, applied to each key.
+        """
+        prefix = provider.upper()
+        per_minute = float(os.environ.get(f"{prefix}_RATE_LIMIT", 0))
+        burst = int(os.environ.get(f"{prefix}_RATE_BURST", 1))
+        daily = int(os.environ.get(f"{prefix}_DAILY_QUOTA", DEFAULT_DAILY_QUOTAS.get(provider, 0)))
+        with self._lock:
+            known = {entry.api_key: entry for entry in self._keys.get(provider, ())}
+            entries = []
+            for api_key in api_keys:
+                if not api_key or any(entry.api_key == api_key for entry in entries):
+                    continue
+                entry = known.get(api_key)
+                if entry is None:
+                    entry = KeyQuota(provider, api_key, per_minute, burst, daily)
+                    self._load(entry)
+                entries.append(entry)
+            self._keys[provider] = entries
+            self._next[provider] = 0
+
+    def _load(self, entry: KeyQuota) -> None:
+        if self._db is None:
+            return
+        with self._db_lock:
+            row = self._db.execute(
+                "SELECT used, blocked_until FROM usage WHERE provider = ? AND key_id = ? AND day = ?",
+                (entry.provider, entry.id, entry.day),
+            ).fetchone()
+        if row is not None:
+            entry.used, entry.blocked_until = row
+
+    def _mark_dirty(self, entry: KeyQuota, force: bool = False) -> Optional[List[tuple]]:
+        """
+        Record a change to entry. Caller holds _lock; returns the rows to
+        write (outside the lock) once a flush is due, else None.
+        """
+        if self._db is None:
+            return None
+        self._dirty[(entry.provider, entry.id)] = entry
+        now = time.monotonic()
+        if not force and now - self._last_flush < self.flush_interval:
+            return None
+        self._last_flush = now
+        rows = [e.row() for e in self._dirty.values()]
+        self._dirty.clear()
+        return rows
+
+    def _write(self, rows: Optional[List[tuple]]) -> None:
+        if not rows:
+            return
+        try:
+            # Rows are snapshotted under _lock but written here, so two flushes can
+            # land out of order; both columns only grow within a day, so keep the max
+            with self._db_lock:
+                self._db.executemany(
+                    "INSERT INTO usage (provider, key_id, day, used, blocked_until) "
+                    "VALUES (?, ?, ?, ?, ?) ON CONFLICT (provider, key_id, day) DO UPDATE SET "
+                    "used = MAX(used, excluded.used), "
+                    "blocked_until = MAX(blocked_until, excluded.blocked_until)", rows,
+                )
+                self._db.commit()
+        except sqlite3.Error as e:
+            logger.warning(f"Quota usage write failed: {e}")
+
+    def flush(self) -> None:
+        """
+        Write any pending usage changes to SQLite now.
+        """
+        with self._lock:
+            rows = [e.row() for e in self._dirty.values()]
+            self._dirty.clear()
+            self._last_flush = time.monotonic()
+        self._write(rows)
+
+    def has_budget(self, provider: str) -> bool:
+        """
+        True if at least one key for the provider still has daily budget
+        and is not cooling down. Providers with no registered keys have none.
+        """
+        now = time.time()
+        with self._lock:
+            return any(entry.has_budget(now) for entry in self._keys.get(provider, ()))
+
+    def has_headroom(self, provider: str) -> bool:
+        """
+        True if a call could be made right now: some key has budget, is not
+        cooling down and has a token in its bucket, so acquire() won't wait.
+        """
+        now = time.time()
+        with self._lock:
+            return any(entry.has_budget(now) and entry.wait_for_token() == 0
+                       for entry in self._keys.get(provider, ()))
+
+    def acquire(self, provider: str, timeout: Optional[float] = None) -> str:
+        """
+        Reserve one request and return the key to use for it. Raises
+        QuotaExhaustedError immediately when no key has budget left, or after
+        `timeout` (default max_wait) seconds if every key stays rate limited.
+        """
+        deadline = time.monotonic() + (self.max_wait if timeout is None else timeout)
+        while True:
+            now = time.time()
+            rows = None
+            with self._lock:
+                entries = self._keys.get(provider, [])
+                candidates = [e for e in entries if e.has_budget(now)]
+                if not candidates:
+                    raise QuotaExhaustedError(f"No {provider} API key has quota left")
+                start = self._next.get(provider, 0) % len(entries)
+                ordered = [entries[(start + i) % len(entries)] for i in range(len(entries))]
+                acquired = None
+                for entry in ordered:
+                    if entry not in candidates:
+                        continue
+                    if entry.limiter is None or entry.limiter.try_acquire():
+                        entry.used += 1
+                        self._next[provider] = (entries.index(entry) + 1) % len(entries)
+                        rows = self._mark_dirty(entry)
+                        acquired = entry
+                        break
+                if acquired is None:
+                    wait = min(e.wait_for_token() for e in candidates)
+            if acquired is not None:
+                self._write(rows)
+                return acquired.api_key
+            if time.monotonic() + wait > deadline:
+                raise QuotaExhaustedError(f"All {provider} API keys are rate limited")
+            # Wake a little after the token is due; another caller may take it first
+            time.sleep(min(wait + 0.01, 1.0))
+
+    def mark_exhausted(self, provider: str, api_key: str, retry_after: Optional[float] = None) -> None:
+        """
+        Take a key out of rotation after the provider rejected it with 429,
+        for `retry_after` seconds if the provider said so, else `cooldown`.
+        """
+        cooldown = retry_after if retry_after else self.cooldown
+        rows = None
+        with self._lock:
+            for entry in self._keys.get(provider, ()):
+                if entry.api_key == api_key:
+                    entry.blocked_until = time.time() + cooldown
+                    # Rare and important to keep across restarts: write now
+                    rows = self._mark_dirty(entry, force=True)
+                    logger.warning(f"{provider} key {entry.id} out of quota for {cooldown:.0f}s")
+        self._write(rows)
+
+    def get_stats(self) -> Dict:
+        now = time.time()
+        stats = {}
+        with self._lock:
+            for provider, entries in self._keys.items():
+                stats[provider] = [{
+                    "key_id": entry.id,
+                    "used_today": entry.used,
+                    "daily_limit": entry.daily_limit or None,
+                    "remaining": entry.remaining(),
+                    "available": entry.has_budget(now),
+                } for entry in entries]
+        return stats
+
+
+_manager: Optional[QuotaManager] = None
+_manager_lock = threading.Lock()
+
+
+def get_quota_manager() -> QuotaManager:
+    """
+    Process-wide quota manager. Usage is persisted to QUOTA_DB (default
+    quota_usage.sqlite3; empty to keep it in memory) at most every
+    QUOTA_FLUSH_INTERVAL seconds (default 5), a request waits at most
+    QUOTA_MAX_WAIT seconds (default 30) for a rate-limited key, and a key
+    rejected with 429 rests for QUOTA_COOLDOWN seconds (default 60) unless
+    the provider sent Retry-After.
+    """
+    global _manager
+    if _manager is None:
+        with _manager_lock:
+            if _manager is None:
+                manager = QuotaManager(
+                    db_path=os.environ.get("QUOTA_DB", "quota_usage.sqlite3") or None,
+                    max_wait=float(os.environ.get("QUOTA_MAX_WAIT", 30)),
+                    cooldown=float(os.environ.get("QUOTA_COOLDOWN", 60)),
+                    flush_interval=float(os.environ.get("QUOTA_FLUSH_INTERVAL", 5)),
+                )
+                atexit.register(manager.flush)
+                _manager = manager
+    return _manager
+
+
+def parse_keys(*values: Optional[str]) -> List[str]:
+    """
+    Collect keys from single-key and comma-separated variables, in order,
+    without duplicates.
+    """
+    keys: List[str] = []
+    for value in values:
+        for key in (value or "").split(","):
+            key = key.strip()
+            if key and key not in keys:
+                keys.append(key)
+    return keys
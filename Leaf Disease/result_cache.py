@@ -0,0 +1,211 @@
+import os
+import copy
+import json
+import time
+import sqlite3
+import hashlib
+import logging
+import threading
+from collections import OrderedDict
+from typing import Any, Dict, Hashable, Optional
+
+
+logger = logging.getLogger(__name__)
+
+
+def image_digest(image_bytes: bytes) -> str:
+    """
+    Content address for an image: SHA-256 of its raw bytes.
+    """
+    return hashlib.sha256(image_bytes).hexdigest()
+
+
+class LRUCache:
+    """
+    Small thread-safe LRU map with optional per-entry TTL.
+    """
+
+    def __init__(self, max_entries: int = 256, ttl: Optional[float] = None):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self._data: "OrderedDict[Hashable, tuple]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key: Hashable, default: Any = None) -> Any:
+        with self._lock:
+            entry = self._data.get(key)
+            if entry is None:
+                return default
+            expires_at, value = entry
+            if expires_at is not None and expires_at < time.time():
+                del self._data[key]
+                return default
+            self._data.move_to_end(key)
+            return value
+
+    def put(self, key: Hashable, value: Any) -> None:
+        if self.max_entries <= 0:
+            return
+        expires_at = time.time() + self.ttl if self.ttl else None
+        with self._lock:
+            self._data[key] = (expires_at, value)
+            self._data.move_to_end(key)
+            while len(self._data) > self.max_entries:
+                self._data.popitem(last=False)
+
+    def clear(self) -> None:
+        with self._lock:
+            self._data.clear()
+
+    def __len__(self) -> int:
+        return len(self._data)
+
+
+class ResultCache:
+    """
+    Two-tier cache of analysis results keyed on image digest.
+
+    Tier 1 is an in-memory LRU. Tier 2 is an optional SQLite file that
+    survives restarts and is trimmed by TTL and total stored size.
+    """
+
+    def __init__(self, max_entries: int = 256,
+                 ttl: Optional[float] = 7 * 24 * 3600,
+                 db_path: Optional[str] = None,
+                 max_db_bytes: int = 50 * 1024 * 1024):
+        self.ttl = ttl
+        self.max_db_bytes = max_db_bytes
+        self.memory = LRUCache(max_entries, ttl)
+        self.stats = {"memory_hits": 0, "disk_hits": 0, "misses": 0, "stores": 0}
+        self._stats_lock = threading.Lock()
+        self._db_lock = threading.Lock()
+        self._db = None
+        if db_path:
+            self._db = sqlite3.connect(db_path, check_same_thread=False)
+            self._db.execute(
+                "CREATE TABLE IF NOT EXISTS results ("
+                "key TEXT PRIMARY KEY, value TEXT NOT NULL, "
+                "created REAL NOT NULL, accessed REAL NOT NULL, size INTEGER NOT NULL)"
+            )
+            self._db.execute("CREATE INDEX IF NOT EXISTS idx_results_accessed ON results(accessed)")
+            self._db.commit()
+            logger.info(f"Result cache disk tier at {db_path}")
+
+    def _count(self, name: str) -> None:
+        with self._stats_lock:
+            self.stats[name] += 1
+
+    def get(self, key: str) -> Optional[Dict]:
+        """
+        Return a copy of the cached result for this digest, or None.
+        """
+        value = self.memory.get(key)
+        if value is not None:
+            self._count("memory_hits")
+            return copy.deepcopy(value)
+
+        if self._db is not None:
+            value = self._get_from_disk(key)
+            if value is not None:
+                self.memory.put(key, value)
+                self._count("disk_hits")
+                return copy.deepcopy(value)
+
+        self._count("misses")
+        return None
+
+    def put(self, key: str, result: Dict) -> None:
+        """
+        Store a result. Error results are not cached.
+        """
+        if not result or result.get("disease_type") == "error":
+            return
+        value = copy.deepcopy(result)
+        self.memory.put(key, value)
+        self._count("stores")
+        if self._db is not None:
+            self._put_to_disk(key, value)
+
+    def _get_from_disk(self, key: str) -> Optional[Dict]:
+        now = time.time()
+        with self._db_lock:
+            row = self._db.execute(
+                "SELECT value, created FROM results WHERE key = ?", (key,)
+            ).fetchone()
+            if row is None:
+                return None
+            if self.ttl and row[1] + self.ttl < now:
+                self._db.execute("DELETE FROM results WHERE key = ?", (key,))
+                self._db.commit()
+                return None
+            self._db.execute("UPDATE results SET accessed = ? WHERE key = ?", (now, key))
+            self._db.commit()
+        return json.loads(row[0])
+
+    def _put_to_disk(self, key: str, value: Dict) -> None:
+        payload = json.dumps(value)
+        now = time.time()
+        try:
+            with self._db_lock:
+                self._db.execute(
+                    "INSERT OR REPLACE INTO results (key, value, created, accessed, size) "
+                    "VALUES (?, ?, ?, ?, ?)",
+                    (key, payload, now, now, len(payload)),
+                )
+                self._evict_disk(now)
+                self._db.commit()
+        except sqlite3.Error as e:
+            logger.warning(f"Result cache disk write failed: {e}")
+
+    def _evict_disk(self, now: float) -> None:
+        # Caller holds _db_lock
+        if self.ttl:
+            self._db.execute("DELETE FROM results WHERE created < ?", (now - self.ttl,))
+        total = self._db.execute("SELECT COALESCE(SUM(size), 0) FROM results").fetchone()[0]
+        if total <= self.max_db_bytes:
+            return
+        for key, size in self._db.execute(
+                "SELECT key, size FROM results ORDER BY accessed ASC").fetchall():
+            self._db.execute("DELETE FROM results WHERE key = ?", (key,))
+            total -= size
+            if total <= self.max_db_bytes:
+                break
+
+    def get_stats(self) -> Dict:
+        with self._stats_lock:
+            stats = dict(self.stats)
+        lookups = stats["memory_hits"] + stats["disk_hits"] + stats["misses"]
+        stats["hit_rate"] = round((lookups - stats["misses"]) / lookups, 4) if lookups else 0.0
+        stats["memory_entries"] = len(self.memory)
+        stats["disk_enabled"] = self._db is not None
+        return stats
+
+    def clear(self) -> None:
+        self.memory.clear()
+        if self._db is not None:
+            with self._db_lock:
+                self._db.execute("DELETE FROM results")
+                self._db.commit()
+
+
+_cache: Optional[ResultCache] = None
+_cache_lock = threading.Lock()
+
+
+def get_result_cache() -> ResultCache:
+    """
+    Process-wide result cache, configured from the environment:
+    RESULT_CACHE_SIZE, RESULT_CACHE_TTL (seconds), RESULT_CACHE_DB and
+    RESULT_CACHE_DB_MAX_MB.
+    """
+    global _cache
+    if _cache is None:
+        with _cache_lock:
+            if _cache is None:
+                _cache = ResultCache(
+                    max_entries=int(os.environ.get("RESULT_CACHE_SIZE", 256)),
+                    ttl=float(os.environ.get("RESULT_CACHE_TTL", 7 * 24 * 3600)) or None,
+                    db_path=os.environ.get("RESULT_CACHE_DB") or None,
+                    max_db_bytes=int(float(os.environ.get("RESULT_CACHE_DB_MAX_MB", 50)) * 1024 * 1024),
+                )
+    return _cache
@@ -0,0 +1,157 @@
+import time
+import logging
+import threading
+from contextlib import contextmanager
+from typing import Callable, Dict, Iterable, List, Optional, Tuple
+
+
+logger = logging.getLogger(__name__)
+
+# Seconds; covers in-process stages (ms) up to slow provider calls
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+
+Labels = Tuple[Tuple[str, str], ...]
+
+
+class Histogram:
+    """
+    Cumulative-bucket histogram in the Prometheus style.
+    """
+
+    def __init__(self, buckets: Iterable[float] = DEFAULT_BUCKETS):
+        self.buckets = tuple(sorted(buckets))
+        self.counts = [0] * len(self.buckets)
+        self.count = 0
+        self.sum = 0.0
+
+    def observe(self, value: float) -> None:
+        self.count += 1
+        self.sum += value
+        for i, bound in enumerate(self.buckets):
+            if value <= bound:
+                self.counts[i] += 1
+                break
+
+
+def _escape_label(value) -> str:
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+class MetricsRegistry:
+    """
+    Process-wide store of histograms and counters, rendered as Prometheus
+    text exposition format.
+    """
+
+    def __init__(self):
+        self._histograms: Dict[Tuple[str, Labels], Histogram] = {}
+        self._counters: Dict[Tuple[str, Labels], float] = {}
+        self._help: Dict[str, str] = {}
+        self._collectors: List[Callable[[], Iterable[Tuple[str, str, str, Dict[str, str], float]]]] = []
+        self._lock = threading.Lock()
+
+    def observe(self, name: str, value: float, help_text: str = "", **labels) -> None:
+        key = (name, tuple(sorted((k, str(v)) for k, v in labels.items())))
+        with self._lock:
+            histogram = self._histograms.get(key)
+            if histogram is None:
+                histogram = self._histograms[key] = Histogram()
+                self._help.setdefault(name, help_text)
+            histogram.observe(value)
+
+    def inc(self, name: str, amount: float = 1.0, help_text: str = "", **labels) -> None:
+        key = (name, tuple(sorted((k, str(v)) for k, v in labels.items())))
+        with self._lock:
+            self._counters[key] = self._counters.get(key, 0.0) + amount
+            self._help.setdefault(name, help_text)
+
+    def register_collector(self, collector: Callable) -> None:
+        """
+        collector() yields (name, type, help, labels, value) samples at render
+        time, for values that already live elsewhere (e.g. cache counters).
+        """
+        with self._lock:
+            self._collectors.append(collector)
+
+    @staticmethod
+    def _format_labels(labels: Labels, extra: Optional[Tuple[str, str]] = None) -> str:
+        items = list(labels) + ([extra] if extra else [])
+        if not items:
+            return ""
+        escaped = (f'{k}="{_escape_label(v)}"' for k, v in items)
+        return "{" + ",".join(escaped) + "}"
+
+    def render_prometheus(self) -> str:
+        lines = []
+        with self._lock:
+            histograms = sorted(self._histograms.items())
+            counters = sorted(self._counters.items())
+            help_text = dict(self._help)
+            collectors = list(self._collectors)
+            snapshot = [(key, h.buckets, list(h.counts), h.count, h.sum) for key, h in histograms]
+
+        seen = set()
+        for (name, labels), buckets, counts, count, total in snapshot:
+            if name not in seen:
+                seen.add(name)
+                lines.append(f"# HELP {name} {help_text.get(name) or name}")
+                lines.append(f"# TYPE {name} histogram")
+            cumulative = 0
+            for bound, bucket_count in zip(buckets, counts):
+                cumulative += bucket_count
+                lines.append(f"{name}_bucket{self._format_labels(labels, ('le', repr(bound)))} {cumulative}")
+            lines.append(f"{name}_bucket{self._format_labels(labels, ('le', '+Inf'))} {count}")
+            lines.append(f"{name}_sum{self._format_labels(labels)} {total}")
+            lines.append(f"{name}_count{self._format_labels(labels)} {count}")
+
+        for (name, labels), value in counters:
+            if name not in seen:
+                seen.add(name)
+                lines.append(f"# HELP {name} {help_text.get(name) or name}")
+                lines.append(f"# TYPE {name} counter")
+            lines.append(f"{name}{self._format_labels(labels)} {value}")
+
+        for collector in collectors:
+            try:
+                samples = list(collector())
+            except Exception as e:
+                logger.warning(f"Metrics collector failed: {e}")
+                continue
+            for name, metric_type, description, labels, value in samples:
+                if name not in seen:
+                    seen.add(name)
+                    lines.append(f"# HELP {name} {description or name}")
+                    lines.append(f"# TYPE {name} {metric_type}")
+                label_tuple = tuple(sorted((k, str(v)) for k, v in labels.items()))
+                lines.append(f"{name}{self._format_labels(label_tuple)} {value}")
+        return "\n".join(lines) + "\n"
+
+
+_registry = MetricsRegistry()
+
+STAGE_METRIC = "leaf_stage_duration_seconds"
+
+
+def get_metrics_registry() -> MetricsRegistry:
+    return _registry
+
+
+@contextmanager
+def span(stage: str, **labels):
+    """
+    Time a pipeline stage and record it in leaf_stage_duration_seconds,
+    labelled with the stage, any extra labels and status=ok|error.
+    """
+    start = time.perf_counter()
+    status = "ok"
+    try:
+        yield
+    except BaseException:
+        status = "error"
+        raise
+    finally:
+        elapsed = time.perf_counter() - start
+        _registry.observe(STAGE_METRIC, elapsed, "Time spent in each detection pipeline stage",
+                          stage=stage, status=status, **labels)
+        logger.debug(f"span {stage} {labels or ''} {status} {elapsed * 1000:.1f} ms")
+
@@ -0,0 +1,200 @@
+import io
+import os
+import json
+import logging
+from typing import Callable, Optional, Tuple
+
+from PIL import Image
+
+
+logger = logging.getLogger(__name__)
+
+CHUNK_SIZE = 64 * 1024
+# Give up on finding the dimensions if the header runs past this
+MAX_HEADER_BYTES = 512 * 1024
+
+# (magic prefix, offset, mime); checked in order
+_SIGNATURES = (
+    (b'\xff\xd8\xff', 0, "image/jpeg"),
+    (b'\x89PNG\r\n\x1a\n', 0, "image/png"),
+    (b'GIF87a', 0, "image/gif"),
+    (b'GIF89a', 0, "image/gif"),
+    (b'BM', 0, "image/bmp"),
+    (b'II*\x00', 0, "image/tiff"),
+    (b'MM\x00*', 0, "image/tiff"),
+)
+
+
+class UploadRejected(Exception):
+    """
+    An upload failed validation; status_code is the HTTP status to return.
+    """
+
+    def __init__(self, status_code: int, detail: str):
+        super().__init__(detail)
+        self.status_code = status_code
+        self.detail = detail
+
+
+def detect_image_type(header: bytes) -> Optional[str]:
+    """
+    MIME type from the file's magic bytes, or None if it isn't a supported image.
+    """
+    for magic, offset, mime in _SIGNATURES:
+        if header[offset:offset + len(magic)] == magic:
+            return mime
+    if header[:4] == b'RIFF' and header[8:12] == b'WEBP':
+        return "image/webp"
+    return None
+
+
+def max_upload_bytes() -> int:
+    return int(float(os.environ.get("MAX_UPLOAD_MB", 10)) * 1024 * 1024)
+
+
+def max_image_pixels() -> int:
+    return int(float(os.environ.get("MAX_IMAGE_MEGAPIXELS", 50)) * 1_000_000)
+
+
+class UploadValidator:
+    """
+    Accumulates an upload chunk by chunk into one bounded buffer and rejects
+    it as soon as the size limit is crossed, the magic bytes aren't an
+    image, or the header (read lazily by Pillow, no pixel decode) declares
+    too many pixels.
+    """
+
+    def __init__(self, max_bytes: Optional[int] = None, max_pixels: Optional[int] = None):
+        self.max_bytes = max_bytes or max_upload_bytes()
+        self.max_pixels = max_pixels or max_image_pixels()
+        self.buffer = bytearray()
+        self.mime: Optional[str] = None
+        self.size: Optional[Tuple[int, int]] = None
+
+    def feed(self, chunk: bytes) -> None:
+        if len(self.buffer) + len(chunk) > self.max_bytes:
+            raise UploadRejected(413, f"File exceeds {self.max_bytes // (1024 * 1024)} MB")
+        self.buffer += chunk
+        if self.mime is None and len(self.buffer) >= 12:
+            self.mime = detect_image_type(bytes(self.buffer[:12]))
+            if self.mime is None:
+                raise UploadRejected(415, "Unsupported file type; upload a JPEG, PNG, WebP, GIF, BMP or TIFF image")
+        if self.mime is not None and self.size is None:
+            self._check_dimensions(final=False)
+
+    def _check_dimensions(self, final: bool) -> None:
+        try:
+            # Image.open only parses the header; pixels are never decoded here
+            with Image.open(io.BytesIO(self.buffer)) as img:
+                self.size = img.size
+        except Exception:
+            if final or len(self.buffer) >= MAX_HEADER_BYTES:
+                raise UploadRejected(415, "File is not a readable image")
+            return
+        width, height = self.size
+        if width * height > self.max_pixels:
+            raise UploadRejected(413, f"Image is {width}x{height}; the limit is "
+                                      f"{self.max_pixels / 1_000_000:g} megapixels")
+
+    def finish(self) -> bytes:
+        """
+        Final checks once the whole body is in; returns the upload bytes.
+        """
+        if not self.buffer:
+            raise UploadRejected(400, "Empty image file")
+        if self.mime is None:
+            raise UploadRejected(415, "Unsupported file type")
+        if self.size is None:
+            self._check_dimensions(final=True)
+        return bytes(self.buffer)
+
+
+async def read_image_upload(upload, max_bytes: Optional[int] = None, chunk_size: int = CHUNK_SIZE) -> bytes:
+    """
+    Read a FastAPI/Starlette UploadFile in chunks through an UploadValidator.
+    Starlette has already received and spooled the whole part by now, so
+    this bounds memory and validates the file, but does not stop the client
+    sending it; UploadSizeLimitMiddleware does that for the raw body.
+    """
+    validator = UploadValidator(max_bytes)
+    while True:
+        chunk = await upload.read(chunk_size)
+        if not chunk:
+            break
+        validator.feed(chunk)
+    return validator.finish()
+
+
+class UploadSizeLimitMiddleware:
+    """
+    ASGI middleware that counts POST body bytes as they arrive and answers
+    413 as soon as the body passes limit_for(path) + overhead, whether or
+    not the client sent a Content-Length. Runs before any multipart parsing,
+    so an oversized body is never read to the end or spooled to disk.
+    """
+
+    def __init__(self, app, limit_for: Callable[[str], int], overhead: int = 0):
+        self.app = app
+        self.limit_for = limit_for
+        self.overhead = overhead
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or scope["method"] != "POST":
+            await self.app(scope, receive, send)
+            return
+
+        limit = self.limit_for(scope["path"])
+        allowed = limit + self.overhead
+        headers = dict(scope.get("headers") or ())
+        declared = headers.get(b"content-length", b"").decode("latin-1")
+        if declared.isdigit() and int(declared) > allowed:
+            await self._reject(send, limit)
+            return
+
+        received = 0
+        rejected = False
+        response_started = False
+
+        async def limited_receive():
+            nonlocal received, rejected
+            if rejected:
+                return {"type": "http.disconnect"}
+            message = await receive()
+            if message["type"] == "http.request":
+                received += len(message.get("body", b""))
+                if received > allowed:
+                    rejected = True
+                    if not response_started:
+                        await self._reject(send, limit)
+                    # Looks like a client disconnect to the app, which stops parsing
+                    return {"type": "http.disconnect"}
+            return message
+
+        async def guarded_send(message):
+            nonlocal response_started
+            if rejected:
+                return  # our 413 has already been sent
+            if message["type"] == "http.response.start":
+                response_started = True
+            await send(message)
+
+        try:
+            await self.app(scope, limited_receive, guarded_send)
+        except Exception:
+            if not rejected:
+                raise
+
+    @staticmethod
+    async def _reject(send, limit: int) -> None:
+        logger.info(f"Rejected upload over {limit} bytes")
+        body = json.dumps({"detail": f"Upload exceeds {limit // (1024 * 1024)} MB"}).encode("utf-8")
+        await send({
+            "type": "http.response.start",
+            "status": 413,
+            "headers": [
+                (b"content-type", b"application/json"),
+                (b"content-length", str(len(body)).encode("ascii")),
+                (b"connection", b"close"),
+            ],
+        })
+        await send({"type": "http.response.body", "body": body})
@@ -1,15 +1,75 @@
-from fastapi import FastAPI, HTTPException, UploadFile, File
-from fastapi.responses import JSONResponse
+from fastapi import FastAPI, HTTPException, UploadFile, File, Form, Request
+from fastapi.responses import JSONResponse, StreamingResponse, PlainTextResponse
+from typing import List
+import asyncio
+import json
 import logging
 import os
-from utils import convert_image_to_base64_and_test, test_with_base64_data
+import time
+from utils import analyze_image_bytes_async, iter_pdf_report, iter_batch_pdf_report, get_cache_stats, get_preprocess_stats, get_provider_stats
+from utils import get_metrics_text, record_request_metrics, configure_logging
+from utils import submit_detection_job, get_detection_job, get_job_stats, get_quota_stats
+from upload_guard import UploadRejected, UploadSizeLimitMiddleware, max_upload_bytes, read_image_upload
 
 # Configure logging
-logging.basicConfig(level=logging.INFO)
+configure_logging()
 logger = logging.getLogger(__name__)
 
 app = FastAPI(title="Leaf Disease Detection API", version="1.0.0")
 
+# Per-request limits for /disease-detection-batch
+BATCH_MAX_FILES = int(os.environ.get("BATCH_MAX_FILES", 20))
+BATCH_MAX_BYTES = int(float(os.environ.get("BATCH_MAX_MB", 50)) * 1024 * 1024)
+BATCH_CONCURRENCY = int(os.environ.get("BATCH_CONCURRENCY", 4))
+# Multipart framing and form fields on top of the file bytes
+UPLOAD_OVERHEAD_BYTES = 64 * 1024
+BATCH_PATHS = ("/disease-detection-batch", "/disease-report-batch")
+
+@app.on_event("startup")
+def warm_up_detector():
+    """
+    Build the shared detector once so the first request doesn't pay for it.
+    """
+    try:
+        from detector_pool import get_detector
+        get_detector()
+    except Exception as e:
+        logger.warning(f"Detector warm-up failed: {str(e)}")
+
+@app.on_event("shutdown")
+def stop_detection_pool():
+    from batch_executor import shutdown_detection_executor
+    from job_queue import shutdown_job_queue
+    shutdown_detection_executor()
+    shutdown_job_queue()
+
+def upload_limit_for(path: str) -> int:
+    """
+    Body size limit for a POST route, before multipart overhead.
+    """
+    return BATCH_MAX_BYTES if path in BATCH_PATHS else max_upload_bytes()
+
+# Counts body bytes as they stream in (chunked or not) and answers 413 before
+# Starlette parses or spools the multipart body
+app.add_middleware(UploadSizeLimitMiddleware, limit_for=upload_limit_for, overhead=UPLOAD_OVERHEAD_BYTES)
+
+@app.middleware("http")
+async def time_requests(request: Request, call_next):
+    """
+    Record end-to-end latency per route for /metrics.
+    """
+    start = time.perf_counter()
+    status = 500
+    try:
+        response = await call_next(request)
+        status = response.status_code
+        return response
+    finally:
+        # Route template, not the raw path, to keep label cardinality bounded
+        route = request.scope.get("route")
+        path = getattr(route, "path", "unmatched")
+        record_request_metrics(request.method, path, status, time.perf_counter() - start)
+
 @app.post('/disease-detection-file')
 async def disease_detection_file(file: UploadFile = File(...)):
     """
@@ -19,11 +79,11 @@ async def disease_detection_file(file: UploadFile = File(...)):
     try:
         logger.info("Received image file for disease detection")
         
-        # Read uploaded file into memory
-        contents = await file.read()
+        # Read the upload in bounded chunks, rejecting non-images early
+        contents = await read_image_file(file)
         
-    # Process file directly from memory
-        result = convert_image_to_base64_and_test(contents)
+    # Process file directly from memory on the detection pool
+        result = await analyze_image_bytes_async(contents)
         
     # No cleanup needed since file is not saved locally
         
@@ -36,3 +96,189 @@ async def disease_detection_file(file: UploadFile = File(...)):
     except Exception as e:
         logger.error(f"Error in disease detection (file): {str(e)}")
         raise HTTPException(status_code=500, detail=f"Internal server error: {str(e)}")
+
+async def read_image_file(upload: UploadFile, max_bytes: int = None):
+    """
+    Read one uploaded image in chunks, stopping as soon as it is too large,
+    not an image, or declares too many pixels.
+    """
+    try:
+        return await read_image_upload(upload, max_bytes)
+    except UploadRejected as e:
+        raise HTTPException(status_code=e.status_code, detail=f"{upload.filename}: {e.detail}")
+
+async def read_batch_uploads(files: List[UploadFile]):
+    """
+    Read a multi-file upload into (filename, bytes) pairs, enforcing the
+    per-batch file count and total size limits.
+    """
+    if len(files) > BATCH_MAX_FILES:
+        raise HTTPException(status_code=413, detail=f"Too many files: {len(files)} (max {BATCH_MAX_FILES})")
+    uploads = []
+    total_bytes = 0
+    for upload in files:
+        remaining = BATCH_MAX_BYTES - total_bytes
+        if remaining <= 0:
+            raise HTTPException(status_code=413, detail=f"Batch exceeds {BATCH_MAX_BYTES // (1024 * 1024)} MB")
+        contents = await read_image_file(upload, min(max_upload_bytes(), remaining))
+        total_bytes += len(contents)
+        uploads.append((upload.filename, contents))
+    return uploads
+
+@app.post('/disease-detection-batch')
+async def disease_detection_batch(files: List[UploadFile] = File(...)):
+    """
+    Endpoint to detect diseases in several leaf images in one request.
+    Accepts multipart/form-data with repeated "files" fields and streams one
+    NDJSON line per image, in completion order, as each analysis finishes.
+    """
+    # Read every part before streaming; uploads are closed once the handler returns
+    uploads = await read_batch_uploads(files)
+    logger.info(f"Received batch of {len(uploads)} images for disease detection")
+
+    semaphore = asyncio.Semaphore(BATCH_CONCURRENCY)
+
+    async def analyze(index, filename, contents):
+        async with semaphore:
+            try:
+                result = await analyze_image_bytes_async(contents)
+            except Exception as e:
+                return {"index": index, "filename": filename, "error": str(e)}
+        if result is None:
+            return {"index": index, "filename": filename, "error": "Failed to process image file"}
+        return {"index": index, "filename": filename, "result": result}
+
+    async def stream_results():
+        tasks = [asyncio.ensure_future(analyze(i, name, data)) for i, (name, data) in enumerate(uploads)]
+        try:
+            for next_done in asyncio.as_completed(tasks):
+                line = await next_done
+                yield json.dumps(line) + "\n"
+        finally:
+            # Client went away: don't leave queued analyses running
+            for task in tasks:
+                task.cancel()
+
+    return StreamingResponse(stream_results(), media_type="application/x-ndjson")
+
+@app.post('/disease-report-file')
+async def disease_report_file(file: UploadFile = File(...), location: str = Form(None)):
+    """
+    Endpoint to analyze a leaf image and return the PDF report.
+    The report is rendered in memory and streamed back in chunks.
+    """
+    contents = await read_image_file(file)
+    result = await analyze_image_bytes_async(contents)
+    if result is None:
+        raise HTTPException(status_code=500, detail="Failed to process image file")
+    # Sync generator: Starlette iterates it on its threadpool
+    return StreamingResponse(
+        iter_pdf_report(result, contents, location=location),
+        media_type="application/pdf",
+        headers={"Content-Disposition": 'attachment; filename="Plant_Report.pdf"'},
+    )
+
+@app.post('/disease-report-batch')
+async def disease_report_batch(files: List[UploadFile] = File(...), location: str = Form(None)):
+    """
+    Endpoint to analyze several leaf images and return one consolidated
+    audit PDF (summary table plus a section per leaf), streamed in chunks.
+    """
+    uploads = await read_batch_uploads(files)
+    semaphore = asyncio.Semaphore(BATCH_CONCURRENCY)
+
+    async def analyze(contents):
+        async with semaphore:
+            return await analyze_image_bytes_async(contents)
+
+    results = await asyncio.gather(*(analyze(contents) for _, contents in uploads), return_exceptions=True)
+    items = []
+    failed = []
+    for (name, contents), result in zip(uploads, results):
+        if isinstance(result, Exception) or not result:
+            # Listed in the report's summary instead of silently dropped
+            logger.error(f"Audit analysis failed for {name}: {result}")
+            failed.append((name, "Analysis failed"))
+        else:
+            items.append({"name": name, "data": result, "bytes": contents})
+    if not items:
+        raise HTTPException(status_code=500, detail="Failed to process image files")
+    return StreamingResponse(
+        iter_batch_pdf_report(items, location=location, failed=failed),
+        media_type="application/pdf",
+        headers={"Content-Disposition": 'attachment; filename="Plant_Audit_Report.pdf"',
+                 "X-Failed-Images": str(len(failed))},
+    )
+
+@app.post('/jobs', status_code=202)
+async def submit_job(file: UploadFile = File(...), webhook_url: str = Form(None)):
+    """
+    Queue a leaf image for analysis and return a job id immediately.
+    Poll GET /jobs/{job_id} for the result, or pass webhook_url to have the
+    finished job POSTed to you.
+    """
+    contents = await read_image_file(file)
+    try:
+        # Webhook validation resolves the host, so keep it off the event loop
+        job = await asyncio.get_running_loop().run_in_executor(None, submit_detection_job, contents, webhook_url)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    if job is None:
+        raise HTTPException(status_code=503, detail="Job queue is full, retry later",
+                            headers={"Retry-After": "5"})
+    job["status_url"] = f"/jobs/{job['job_id']}"
+    return JSONResponse(status_code=202, content=job)
+
+@app.get('/jobs/stats')
+def job_stats():
+    """
+    Queue depth, running jobs and wait/run time percentiles.
+    """
+    return JSONResponse(content=get_job_stats())
+
+@app.get('/jobs/{job_id}')
+def get_job(job_id: str):
+    """
+    Job status: queued, running, done (with result) or failed (with error).
+    """
+    job = get_detection_job(job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail="Unknown or expired job id")
+    return JSONResponse(content=job)
+
+@app.get('/cache/stats')
+def cache_stats():
+    """
+    Hit/miss counters for the image result cache.
+    """
+    return JSONResponse(content=get_cache_stats())
+
+@app.get('/preprocess/stats')
+def preprocess_stats():
+    """
+    Bytes saved by downscaling uploads before provider calls.
+    """
+    return JSONResponse(content=get_preprocess_stats())
+
+@app.get('/providers/stats')
+def provider_stats():
+    """
+    Success/failure counts and latency percentiles for Gemini and Kindwise.
+    """
+    return JSONResponse(content=get_provider_stats())
+
+@app.get('/providers/quota')
+def provider_quota():
+    """
+    Requests used today and remaining daily budget per API key (keys are
+    shown as short hashes).
+    """
+    return JSONResponse(content=get_quota_stats())
+
+@app.get('/metrics')
+def metrics():
+    """
+    Prometheus scrape endpoint: per-stage and per-request latency histograms,
+    upstream retry counts and cache counters.
+    """
+    return PlainTextResponse(get_metrics_text(), media_type="text/plain; version=0.0.4")
@@ -0,0 +1,344 @@
+"""
+Offline performance benchmarks for the detection pipeline.
+
+Starts the stub provider server (benchmarks/stub_server.py), points the
+detector at it and measures, per scenario, image size and concurrency:
+throughput, latency percentiles and peak RSS.
+
+Scenarios:
+    detector   LeafDiseaseDetector.analyze_leaf_image_bytes (cache and coalescing bypassed)
+    convert    utils.convert_image_to_base64_and_test
+    pdf        utils.create_pdf_report for a recorded result
+    api        POST /disease-detection-file on an in-process uvicorn server
+
+Examples:
+    python benchmarks/run.py
+    python benchmarks/run.py --scenarios detector,api --sizes 1024,4000 --concurrency 1,8,32
+    python benchmarks/run.py --json bench.json
+    python benchmarks/run.py --baseline bench.json --max-regression 0.15
+
+With --baseline the run exits with status 1 when throughput drops or p90
+latency grows by more than --max-regression for any matching row.
+"""
+import io
+import os
+import sys
+import json
+import math
+import time
+import argparse
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+from typing import Callable, Dict, List, Optional
+
+ROOT = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(ROOT))
+sys.path.insert(0, str(Path(__file__).resolve().parent))
+
+from stub_server import RECORDINGS, StubServer  # noqa: E402
+
+SCENARIOS = ("detector", "convert", "pdf", "api")
+
+
+class RssSampler:
+    """
+    Tracks peak resident set size while a scenario runs.
+    """
+
+    def __init__(self, interval: float = 0.05):
+        self.interval = interval
+        self.peak = 0
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, name="rss-sampler", daemon=True)
+        try:
+            self._page_size = os.sysconf("SC_PAGE_SIZE")
+        except (AttributeError, ValueError, OSError):
+            self._page_size = 4096
+
+    def current(self) -> int:
+        try:
+            with open("/proc/self/statm") as f:
+                return int(f.read().split()[1]) * self._page_size
+        except OSError:
+            # Not Linux: fall back to the process-wide high-water mark
+            import resource
+            peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+            return peak if sys.platform == "darwin" else peak * 1024
+
+    def _run(self):
+        while not self._stop.is_set():
+            self.peak = max(self.peak, self.current())
+            self._stop.wait(self.interval)
+
+    def __enter__(self):
+        self.peak = self.current()
+        self._thread.start()
+        return self
+
+    def __exit__(self, *exc):
+        self._stop.set()
+        self._thread.join()
+        self.peak = max(self.peak, self.current())
+
+
+def percentile(sorted_values: List[float], p: float) -> float:
+    # Nearest-rank percentile
+    if not sorted_values:
+        return 0.0
+    return sorted_values[max(0, math.ceil(p * len(sorted_values)) - 1)]
+
+
+def make_leaf_images(side: int, count: int, seed: int = 0) -> List[bytes]:
+    """
+    Distinct synthetic leaf photos (green ellipse, brown lesions, sensor
+    noise) as JPEGs, so every request is a cache miss.
+    """
+    import numpy as np
+    from PIL import Image, ImageDraw
+
+    rng = np.random.default_rng(seed + side)
+    images = []
+    for _ in range(count):
+        img = Image.new("RGB", (side, int(side * 0.75)), (214, 222, 205))
+        draw = ImageDraw.Draw(img)
+        w, h = img.size
+        draw.ellipse((w * 0.1, h * 0.15, w * 0.9, h * 0.85), fill=(58, 128, 48))
+        for _ in range(int(rng.integers(5, 25))):
+            x, y = rng.uniform(0.25, 0.75) * w, rng.uniform(0.3, 0.7) * h
+            r = rng.uniform(0.01, 0.04) * w
+            draw.ellipse((x - r, y - r, x + r, y + r), fill=(112, 74, 36))
+        noise = rng.normal(0, 6, (h, w, 3))
+        pixels = np.clip(np.asarray(img, dtype=np.float32) + noise, 0, 255).astype(np.uint8)
+        buffer = io.BytesIO()
+        Image.fromarray(pixels).save(buffer, format="JPEG", quality=90)
+        images.append(buffer.getvalue())
+    return images
+
+
+def configure_environment(stub_url: str, providers: str, use_cache: bool) -> None:
+    # Set explicitly (not setdefault) so a local .env can't point us at the real APIs
+    os.environ["KINDWISE_API_URL"] = f"{stub_url}/api/v3/identification"
+    os.environ["GEMINI_API_ENDPOINT"] = stub_url
+    os.environ["KINDWISE_API_KEY"] = "bench" if providers in ("kindwise", "both") else ""
+    os.environ["GEMINI_API_KEY"] = "bench" if providers in ("gemini", "both") else ""
+    # Measure the pipeline, not the client-side throttle or the daily budgets
+    os.environ["KINDWISE_RATE_LIMIT"] = "0"
+    os.environ["GEMINI_RATE_LIMIT"] = "0"
+    os.environ["KINDWISE_DAILY_QUOTA"] = "0"
+    os.environ["GEMINI_DAILY_QUOTA"] = "0"
+    os.environ["QUOTA_DB"] = ""
+    os.environ.setdefault("LOG_LEVEL", "WARNING")
+    if not use_cache:
+        os.environ["RESULT_CACHE_SIZE"] = "0"
+        os.environ["RESULT_CACHE_DB"] = ""
+        os.environ["NEAR_DUPLICATE_DISTANCE"] = "-1"
+
+
+def recorded_result() -> Dict:
+    payload = json.loads((RECORDINGS / "gemini_generate_content.json").read_text(encoding="utf-8"))
+    text = payload["candidates"][0]["content"]["parts"][0]["text"]
+    return json.loads(text.split("```json")[1].split("```")[0])
+
+
+class ApiServer:
+    """
+    The FastAPI app on uvicorn in a background thread.
+    """
+
+    def __init__(self, port: int = 0):
+        import socket
+        import uvicorn
+        from app import app
+
+        if not port:
+            with socket.socket() as s:
+                s.bind(("127.0.0.1", 0))
+                port = s.getsockname()[1]
+        self.url = f"http://127.0.0.1:{port}"
+
+        class _Server(uvicorn.Server):
+            def install_signal_handlers(self):
+                pass
+
+        self.server = _Server(uvicorn.Config(app, host="127.0.0.1", port=port, log_level="warning"))
+        self.thread = threading.Thread(target=self.server.run, name="bench-api", daemon=True)
+
+    def __enter__(self):
+        self.thread.start()
+        deadline = time.monotonic() + 30
+        while not self.server.started:
+            if time.monotonic() > deadline or not self.thread.is_alive():
+                raise RuntimeError("API server failed to start")
+            time.sleep(0.05)
+        return self
+
+    def __exit__(self, *exc):
+        self.server.should_exit = True
+        self.thread.join(timeout=10)
+
+
+def build_call(scenario: str, api: Optional[ApiServer]) -> Callable[[bytes], object]:
+    if scenario == "detector":
+        import utils  # noqa: F401  (puts "Leaf Disease" on sys.path)
+        from detector_pool import get_detector
+        detector = get_detector()
+        # No coalescing either: the same few images are sent concurrently, and
+        # merged calls would report one analysis as several
+        return lambda image: detector.analyze_leaf_image_bytes(image, use_cache=False, coalesce=False)
+    if scenario == "convert":
+        from utils import convert_image_to_base64_and_test
+        return convert_image_to_base64_and_test
+    if scenario == "pdf":
+        from utils import create_pdf_report
+        result = recorded_result()
+        return lambda image: create_pdf_report(result, image, location="Benchmark")
+    if scenario == "api":
+        import requests
+        session = requests.Session()
+        adapter = requests.adapters.HTTPAdapter(pool_maxsize=64)
+        session.mount("http://", adapter)
+        url = f"{api.url}/disease-detection-file"
+
+        def call(image):
+            response = session.post(url, files={"file": ("leaf.jpg", image, "image/jpeg")}, timeout=120)
+            response.raise_for_status()
+            return response
+        return call
+    raise ValueError(f"Unknown scenario: {scenario}")
+
+
+def run_case(call: Callable[[bytes], object], images: List[bytes], requests_count: int,
+             concurrency: int) -> Dict:
+    latencies: List[float] = []
+    errors = 0
+    lock = threading.Lock()
+
+    def one(i: int):
+        nonlocal errors
+        start = time.perf_counter()
+        try:
+            result = call(images[i % len(images)])
+            ok = result is not None and not (isinstance(result, dict) and result.get("disease_type") == "error")
+        except Exception:
+            ok = False
+        elapsed = time.perf_counter() - start
+        with lock:
+            latencies.append(elapsed)
+            if not ok:
+                errors += 1
+
+    with RssSampler() as rss:
+        start = time.perf_counter()
+        with ThreadPoolExecutor(max_workers=concurrency) as pool:
+            list(pool.map(one, range(requests_count)))
+        wall = time.perf_counter() - start
+
+    latencies.sort()
+    return {
+        "requests": requests_count,
+        "errors": errors,
+        "throughput_rps": round(requests_count / wall, 2) if wall else 0.0,
+        "p50_ms": round(percentile(latencies, 0.50) * 1000, 1),
+        "p90_ms": round(percentile(latencies, 0.90) * 1000, 1),
+        "p99_ms": round(percentile(latencies, 0.99) * 1000, 1),
+        "max_ms": round(latencies[-1] * 1000, 1) if latencies else 0.0,
+        "peak_rss_mb": round(rss.peak / (1024 * 1024), 1),
+    }
+
+
+def print_table(rows: List[Dict]) -> None:
+    columns = ["scenario", "size", "concurrency", "requests", "errors", "throughput_rps",
+               "p50_ms", "p90_ms", "p99_ms", "max_ms", "peak_rss_mb"]
+    widths = {c: max(len(c), *(len(str(r[c])) for r in rows)) for c in columns}
+    print("  ".join(c.rjust(widths[c]) for c in columns))
+    for row in rows:
+        print("  ".join(str(row[c]).rjust(widths[c]) for c in columns))
+
+
+def compare(rows: List[Dict], baseline_rows: List[Dict], max_regression: float) -> List[str]:
+    """
+    Rows that got slower than the baseline by more than max_regression.
+    """
+    baseline = {(r["scenario"], r["size"], r["concurrency"]): r for r in baseline_rows}
+    failures = []
+    for row in rows:
+        old = baseline.get((row["scenario"], row["size"], row["concurrency"]))
+        if old is None:
+            continue
+        label = f"{row['scenario']} size={row['size']} c={row['concurrency']}"
+        if old["throughput_rps"] and row["throughput_rps"] < old["throughput_rps"] * (1 - max_regression):
+            failures.append(f"{label}: throughput {old['throughput_rps']} -> {row['throughput_rps']} rps")
+        if old["p90_ms"] and row["p90_ms"] > old["p90_ms"] * (1 + max_regression):
+            failures.append(f"{label}: p90 {old['p90_ms']} -> {row['p90_ms']} ms")
+    return failures
+
+
+def _int_list(value: str) -> List[int]:
+    return [int(v) for v in value.split(",") if v]
+
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--scenarios", default=",".join(SCENARIOS))
+    parser.add_argument("--sizes", type=_int_list, default=[640, 1600, 4000], help="image widths in px")
+    parser.add_argument("--concurrency", type=_int_list, default=[1, 4, 16])
+    parser.add_argument("--requests", type=int, default=32, help="requests per case")
+    parser.add_argument("--pool", type=int, default=8, help="distinct images per size")
+    parser.add_argument("--providers", choices=("kindwise", "gemini", "both"), default="kindwise")
+    parser.add_argument("--kindwise-latency", default="lognormal:-0.5,0.4")
+    parser.add_argument("--gemini-latency", default="lognormal:0,0.35")
+    parser.add_argument("--error-rate", type=float, default=0.0)
+    parser.add_argument("--cache", action="store_true", help="leave the result caches enabled")
+    parser.add_argument("--warmup", type=int, default=2, help="untimed calls before each scenario")
+    parser.add_argument("--json", dest="json_out", help="write results to this file")
+    parser.add_argument("--baseline", help="results file from an earlier run to compare against")
+    parser.add_argument("--max-regression", type=float, default=0.2)
+    args = parser.parse_args(argv)
+
+    scenarios = [s for s in args.scenarios.split(",") if s]
+    unknown = set(scenarios) - set(SCENARIOS)
+    if unknown:
+        parser.error(f"unknown scenarios: {', '.join(sorted(unknown))}")
+
+    images = {size: make_leaf_images(size, args.pool) for size in args.sizes}
+    rows: List[Dict] = []
+    with StubServer(kindwise_latency=args.kindwise_latency, gemini_latency=args.gemini_latency,
+                    error_rate=args.error_rate) as stub:
+        configure_environment(stub.url, args.providers, args.cache)
+        api = ApiServer().__enter__() if "api" in scenarios else None
+        try:
+            for scenario in scenarios:
+                call = build_call(scenario, api)
+                for size in args.sizes:
+                    for _ in range(args.warmup):
+                        try:
+                            call(images[size][0])
+                        except Exception:
+                            pass
+                    for concurrency in args.concurrency:
+                        row = {"scenario": scenario, "size": size, "concurrency": concurrency}
+                        row.update(run_case(call, images[size], args.requests, concurrency))
+                        rows.append(row)
+                        print(f"{scenario:<9} size={size:<5} c={concurrency:<3} "
+                              f"{row['throughput_rps']:>8} rps  p90 {row['p90_ms']:>8} ms", file=sys.stderr)
+        finally:
+            if api is not None:
+                api.__exit__(None, None, None)
+        print(f"Stub requests served: {stub.requests}", file=sys.stderr)
+
+    print_table(rows)
+    if args.json_out:
+        Path(args.json_out).write_text(json.dumps({"args": vars(args), "results": rows}, indent=2, default=str))
+
+    if args.baseline:
+        baseline_rows = json.loads(Path(args.baseline).read_text())["results"]
+        failures = compare(rows, baseline_rows, args.max_regression)
+        for failure in failures:
+            print(f"REGRESSION {failure}")
+        return 1 if failures else 0
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,150 @@
+"""
+Local stand-in for the Plant.id v3 and Gemini APIs.
+
+Replays the recorded responses in benchmarks/recordings after sleeping for
+a latency drawn from a configurable distribution, so the detection pipeline
+can be exercised without keys or network access.
+
+Latency specs:
+    fixed:0.5             always 0.5 s
+    uniform:0.2,0.8       uniform between the bounds
+    normal:0.6,0.15       mean, standard deviation (clipped at 0)
+    lognormal:-0.5,0.4    mu, sigma of the underlying normal
+
+Run standalone:
+    python benchmarks/stub_server.py --port 8765 --kindwise-latency lognormal:-0.5,0.4
+"""
+import sys
+import time
+import random
+import argparse
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from pathlib import Path
+from typing import Callable, Dict, Optional
+
+RECORDINGS = Path(__file__).parent / "recordings"
+
+
+def parse_latency(spec: str) -> Callable[[], float]:
+    """
+    Turn a latency spec such as "lognormal:-0.5,0.4" into a sampler.
+    """
+    kind, _, args = spec.partition(":")
+    params = [float(x) for x in args.split(",")] if args else []
+    kind = kind.lower()
+    if kind == "fixed":
+        return lambda: params[0] if params else 0.0
+    if kind == "uniform":
+        return lambda: random.uniform(params[0], params[1])
+    if kind == "normal":
+        return lambda: max(0.0, random.gauss(params[0], params[1]))
+    if kind == "lognormal":
+        return lambda: random.lognormvariate(params[0], params[1])
+    raise ValueError(f"Unknown latency distribution: {spec}")
+
+
+class StubServer:
+    """
+    Threaded HTTP server replaying recorded provider responses.
+    """
+
+    def __init__(self, host: str = "127.0.0.1", port: int = 0,
+                 kindwise_latency: str = "fixed:0",
+                 gemini_latency: str = "fixed:0",
+                 error_rate: float = 0.0):
+        self.kindwise_latency = parse_latency(kindwise_latency)
+        self.gemini_latency = parse_latency(gemini_latency)
+        self.error_rate = error_rate
+        self.plant_id_body = (RECORDINGS / "plant_id_v3.json").read_bytes()
+        self.gemini_body = (RECORDINGS / "gemini_generate_content.json").read_bytes()
+        self.requests: Dict[str, int] = {"kindwise": 0, "gemini": 0}
+        self._lock = threading.Lock()
+        self._thread: Optional[threading.Thread] = None
+        self.httpd = ThreadingHTTPServer((host, port), self._handler_class())
+        self.httpd.daemon_threads = True
+
+    @property
+    def url(self) -> str:
+        host, port = self.httpd.server_address[:2]
+        return f"http://{host}:{port}"
+
+    def _handler_class(self):
+        server = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"
+
+            def log_message(self, format, *args):
+                pass
+
+            def _reply(self, status: int, body: bytes) -> None:
+                self.send_response(status)
+                self.send_header("Content-Type", "application/json")
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def do_POST(self):
+                # Read the whole upload, as the real API would
+                length = int(self.headers.get("Content-Length", 0))
+                self.rfile.read(length)
+                path = self.path.split("?", 1)[0]
+                if path.endswith("/identification"):
+                    provider, status, body = "kindwise", 201, server.plant_id_body
+                    delay = server.kindwise_latency()
+                elif ":generateContent" in path:
+                    provider, status, body = "gemini", 200, server.gemini_body
+                    delay = server.gemini_latency()
+                else:
+                    self._reply(404, b'{"error": "not found"}')
+                    return
+                with server._lock:
+                    server.requests[provider] += 1
+                time.sleep(delay)
+                if server.error_rate and random.random() < server.error_rate:
+                    self._reply(503, b'{"error": "stub overloaded"}')
+                    return
+                self._reply(status, body)
+
+        return Handler
+
+    def start(self) -> "StubServer":
+        self._thread = threading.Thread(target=self.httpd.serve_forever, name="stub-server", daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self) -> None:
+        self.httpd.shutdown()
+        self.httpd.server_close()
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc):
+        self.stop()
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8765)
+    parser.add_argument("--kindwise-latency", default="lognormal:-0.5,0.4")
+    parser.add_argument("--gemini-latency", default="lognormal:0,0.35")
+    parser.add_argument("--error-rate", type=float, default=0.0)
+    args = parser.parse_args(argv)
+
+    server = StubServer(args.host, args.port, args.kindwise_latency, args.gemini_latency, args.error_rate)
+    print(f"Stub provider server on {server.url}")
+    print(f"  KINDWISE_API_URL={server.url}/api/v3/identification")
+    print(f"  GEMINI_API_ENDPOINT={server.url}")
+    try:
+        server.httpd.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.httpd.server_close()
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,210 @@
+"""
+Offline city gazetteer for the weather risk feature.
+
+The data file is a sorted TSV (normalized name, name, country, latitude,
+longitude, population) that is memory-mapped rather than parsed up front.
+Exact and prefix lookups binary-search the mapped lines; fuzzy lookups use
+a trigram index built on first use.
+
+Build a full file from a GeoNames dump (e.g. cities15000.txt):
+    python gazetteer.py build cities15000.txt data/gazetteer.tsv
+"""
+import os
+import sys
+import mmap
+import threading
+import unicodedata
+from array import array
+from collections import Counter
+from pathlib import Path
+
+DEFAULT_PATH = Path(__file__).parent / "data" / "gazetteer.tsv"
+FUZZY_MIN_SCORE = 0.45
+
+
+def normalize_name(name: str) -> str:
+    """
+    Lowercase, strip accents and punctuation, collapse whitespace.
+    """
+    text = unicodedata.normalize('NFKD', name)
+    text = ''.join(c for c in text if not unicodedata.combining(c)).lower()
+    text = ''.join(c if c.isalnum() else ' ' for c in text)
+    return ' '.join(text.split())
+
+
+def _trigrams(norm: str):
+    padded = f"  {norm} "
+    return {padded[i:i + 3] for i in range(len(padded) - 2)}
+
+
+class Gazetteer:
+    """
+    Memory-mapped city index with exact, prefix and trigram fuzzy matching.
+    """
+
+    def __init__(self, path=DEFAULT_PATH):
+        self.path = Path(path)
+        self._file = open(self.path, 'rb')
+        self._mm = mmap.mmap(self._file.fileno(), 0, access=mmap.ACCESS_READ)
+        self._offsets = array('L')
+        pos = 0
+        size = len(self._mm)
+        while pos < size:
+            end = self._mm.find(b'\n', pos)
+            if end == -1:
+                end = size
+            if end > pos and self._mm[pos:pos + 1] != b'#':
+                self._offsets.append(pos)
+            pos = end + 1
+        self._trigram_index = None
+        self._trigram_lock = threading.Lock()
+
+    def __len__(self) -> int:
+        return len(self._offsets)
+
+    def _line(self, i: int) -> bytes:
+        start = self._offsets[i]
+        end = self._mm.find(b'\n', start)
+        return self._mm[start:end if end != -1 else len(self._mm)]
+
+    def _key(self, i: int) -> str:
+        start = self._offsets[i]
+        return self._mm[start:self._mm.find(b'\t', start)].decode('utf-8')
+
+    def _row(self, i: int) -> dict:
+        _, name, country, lat, lon, population = self._line(i).decode('utf-8').split('\t')
+        return {
+            "name": name,
+            "country": country,
+            "latitude": float(lat),
+            "longitude": float(lon),
+            "population": int(population or 0),
+        }
+
+    def _lower_bound(self, key: str) -> int:
+        lo, hi = 0, len(self._offsets)
+        while lo < hi:
+            mid = (lo + hi) // 2
+            if self._key(mid) < key:
+                lo = mid + 1
+            else:
+                hi = mid
+        return lo
+
+    def _build_trigram_index(self):
+        index = {}
+        for i in range(len(self._offsets)):
+            for gram in _trigrams(self._key(i)):
+                index.setdefault(gram, array('L')).append(i)
+        return index
+
+    def _fuzzy(self, norm: str):
+        if self._trigram_index is None:
+            with self._trigram_lock:
+                if self._trigram_index is None:
+                    self._trigram_index = self._build_trigram_index()
+        query = _trigrams(norm)
+        overlap = Counter()
+        for gram in query:
+            overlap.update(self._trigram_index.get(gram, ()))
+        best, best_score = None, 0.0
+        for i, shared in overlap.most_common(50):
+            candidate = len(_trigrams(self._key(i)))
+            score = shared / (len(query) + candidate - shared)
+            if score > best_score:
+                best, best_score = i, score
+        return best if best_score >= FUZZY_MIN_SCORE else None
+
+    def lookup(self, name: str, fuzzy: bool = True, prefix: bool = True, max_prefix_matches: int = 50):
+        """
+        Best match for a place name (exact, then prefix and fuzzy if
+        allowed), with ties broken by population. Returns a row dict or None.
+        """
+        norm = normalize_name(name)
+        if not norm or not self._offsets:
+            return None
+        start = self._lower_bound(norm)
+
+        exact = []
+        i = start
+        while i < len(self._offsets) and self._key(i) == norm:
+            exact.append(self._row(i))
+            i += 1
+        if exact:
+            return max(exact, key=lambda r: r["population"])
+
+        if prefix and len(norm) >= 3:
+            matches = []
+            i = start
+            while i < len(self._offsets) and len(matches) < max_prefix_matches and self._key(i).startswith(norm):
+                matches.append(self._row(i))
+                i += 1
+            if matches:
+                return max(matches, key=lambda r: r["population"])
+
+        if not fuzzy:
+            return None
+        match = self._fuzzy(norm)
+        return self._row(match) if match is not None else None
+
+    def close(self) -> None:
+        self._mm.close()
+        self._file.close()
+
+
+_gazetteer = None
+_gazetteer_lock = threading.Lock()
+
+
+def get_gazetteer():
+    """
+    Shared gazetteer from GAZETTEER_PATH (default data/gazetteer.tsv), or
+    None if the file is missing.
+    """
+    global _gazetteer
+    if _gazetteer is None:
+        with _gazetteer_lock:
+            if _gazetteer is None:
+                path = Path(os.environ.get("GAZETTEER_PATH", DEFAULT_PATH))
+                if not path.exists():
+                    return None
+                _gazetteer = Gazetteer(path)
+    return _gazetteer
+
+
+def write_gazetteer(rows, out_path) -> int:
+    """
+    Write (name, country, lat, lon, population) rows in sorted gazetteer format.
+    """
+    records = []
+    for name, country, lat, lon, population in rows:
+        norm = normalize_name(name)
+        if norm:
+            records.append((norm, name, country, f"{float(lat):.4f}", f"{float(lon):.4f}", str(int(population or 0))))
+    records.sort(key=lambda r: (r[0], -int(r[5])))
+    with open(out_path, 'w', encoding='utf-8', newline='\n') as f:
+        f.write("# normalized_name\tname\tcountry\tlatitude\tlongitude\tpopulation\n")
+        for record in records:
+            f.write('\t'.join(record) + '\n')
+    return len(records)
+
+
+def _read_geonames(path):
+    # GeoNames columns: 1 name, 2 asciiname, 4 lat, 5 lon, 8 country, 14 population
+    with open(path, encoding='utf-8') as f:
+        for line in f:
+            cols = line.rstrip('\n').split('\t')
+            if len(cols) < 15:
+                continue
+            yield cols[1], cols[8], cols[4], cols[5], cols[14] or 0
+            if cols[2] and cols[2] != cols[1]:
+                yield cols[2], cols[8], cols[4], cols[5], cols[14] or 0
+
+
+if __name__ == "__main__":
+    if len(sys.argv) == 4 and sys.argv[1] == "build":
+        count = write_gazetteer(_read_geonames(sys.argv[2]), sys.argv[3])
+        print(f"Wrote {count} places to {sys.argv[3]}")
+    else:
+        print(__doc__)
+        sys.exit(1)
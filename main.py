@@ -1,7 +1,7 @@
 import streamlit as st
-import requests
 import os
-from utils import convert_image_to_base64_and_test, create_pdf_report
+from utils import analyze_image_bytes, get_pdf_report, get_batch_pdf_report, run_batch
+from weather import get_botanical_risk, get_risk_outlook
 import datetime
 
 # Set Streamlit theme to wide mode
@@ -288,54 +288,8 @@ with st.sidebar:
     st.subheader("🌦️ Environmental Risk")
     location = st.text_input("Enter Location (City Name)", "Delhi")
     
-    # Real-time weather integration helper (Using Open-Meteo Open Data)
-    def get_botanical_risk(city):
-        try:
-            # 1. Geocoding: Get Lat/Lon for the city name
-            geo_url = f"https://geocoding-api.open-meteo.com/v1/search?name={city}&count=1&language=en&format=json"
-            geo_resp = requests.get(geo_url, timeout=5).json()
-            
-            if not geo_resp.get('results'):
-                return None, f"❌ City not found: {city}"
-            
-            lat = geo_resp['results'][0]['latitude']
-            lon = geo_resp['results'][0]['longitude']
-            full_name = geo_resp['results'][0]['name']
-            
-            # 2. Weather: Get Temperature and Humidity
-            weather_url = f"https://api.open-meteo.com/v1/forecast?latitude={lat}&longitude={lon}&current=temperature_2m,relative_humidity_2m"
-            w_resp = requests.get(weather_url, timeout=5).json()
-            
-            current = w_resp.get('current', {})
-            humidity = current.get('relative_humidity_2m', 0)
-            temp = current.get('temperature_2m', 0)
-            
-            # Risk Calculation Logic
-            risk_score = humidity 
-            if temp > 30: risk_score += 10 # Heat stress
-            if humidity > 80: risk_score = min(95, risk_score + 15) # Fungal spike
-            
-            risk_level = "Low"
-            if risk_score > 40: risk_level = "Medium"
-            if risk_score > 70: risk_level = "High"
-            
-            msg = "Conditions are stable."
-            if humidity > 75: msg = "⚠️ High humidity detected. Fungal diseases (Rust, Mildew) move faster now."
-            elif temp > 35: msg = "🔥 Heat stress alert. Watch for wilting and leaf burn."
-            elif humidity < 30: msg = "🏜️ Very dry air. Check for spider mites and dehydration."
-            
-            return {
-                "score": int(risk_score),
-                "level": risk_level,
-                "msg": msg,
-                "temp": temp,
-                "humidity": humidity,
-                "city": full_name
-            }, None
-        except Exception as e:
-            return None, f"Connection error: {e}"
-
     if location:
+        # Geocodes and conditions are cached, so reruns render immediately
         with st.spinner("Fetching local climate data..."):
             risk_data, error = get_botanical_risk(location)
             
@@ -353,6 +307,13 @@ with st.sidebar:
                 <div style='font-size: 0.85rem; line-height: 1.4;'>{risk_data["msg"]}</div>
             </div>
             """, unsafe_allow_html=True)
+
+            # Forecast-based outlook (leaf wetness & infection model), also cached
+            # and refreshed in the background so reruns never wait on the network
+            outlook = get_risk_outlook(location)
+            if outlook:
+                st.caption("📈 Disease risk outlook: " + " | ".join(
+                    f"Day {d['day']}: {d['level']} ({d['score']}%)" for d in outlook))
     
     st.markdown("---")
     st.info("💡 Tip: Upload multiple leaves for a full plant health audit.")
@@ -378,39 +339,57 @@ uploaded_files = st.file_uploader(
 
 if uploaded_files:
     if st.button("🚀 Analyze All Leaves"):
-        results = []
+        def analyze_leaf(upload):
+            name, img_bytes = upload
+            res = analyze_image_bytes(img_bytes)
+            if not res:
+                return None
+            # PDFs are rendered on demand when a download is requested
+            return {
+                "name": name,
+                "data": res,
+                "bytes": img_bytes
+            }
+
+        uploads = [(file.name, file.getvalue()) for file in uploaded_files]
         progress_bar = st.progress(0)
-        for i, file in enumerate(uploaded_files):
-            with st.spinner(f"Analyzing leaf {i+1}/{len(uploaded_files)}..."):
-                img_bytes = file.getvalue()
-                res = convert_image_to_base64_and_test(img_bytes)
-                if res:
-                    # Pre-generate PDF for instant download and store in results
-                    pdf_data = None
-                    try:
-                        # Use resolved city name if weather data exists, otherwise use raw input
-                        pdf_location = st.session_state.get('weather_risk', {}).get('city', location)
-                        pdf_data = create_pdf_report(res, img_bytes, location=pdf_location)
-                    except Exception as pdf_err:
 
+        def on_result(index, result, done):
+            progress_bar.progress(done / len(uploads))
 
-                        # Log but don't stall the whole loop
-                        pass
-                        
-                    results.append({
-                        "name": file.name, 
-                        "data": res, 
-                        "bytes": img_bytes,
-                        "pdf": pdf_data
-                    })
-                progress_bar.progress((i + 1) / len(uploaded_files))
+        with st.spinner(f"Analyzing {len(uploads)} leaves..."):
+            batch = run_batch(uploads, analyze_leaf, on_result=on_result)
+        results = [item for item in batch if item]
+        failed = [(name, "Analysis failed") for (name, _), item in zip(uploads, batch) if not item]
         st.session_state.batch_results = results
+        st.session_state.batch_failed = failed
+        st.session_state.pdf_ready = set()
+        st.session_state.audit_pdf_ready = False
         st.success(f"Successfully analyzed {len(results)} images!")
+        if failed:
+            st.warning(f"Could not analyze: {', '.join(name for name, _ in failed)}")
 
 # --- Display Results ---
 if st.session_state.batch_results:
     st.markdown("---")
     st.subheader(f"📊 Analysis Batch - {len(st.session_state.batch_results)} Items")
+
+    # Consolidated audit report: one PDF for the whole batch, rendered on demand
+    if st.session_state.get('audit_pdf_ready') or st.button("📚 Prepare Full Audit Report"):
+        st.session_state.audit_pdf_ready = True
+        audit_location = st.session_state.get('weather_risk', {}).get('city', location)
+        audit_pdf = get_batch_pdf_report(st.session_state.batch_results, location=audit_location,
+                                          failed=st.session_state.get('batch_failed'))
+        if audit_pdf:
+            st.download_button(
+                label="📥 Download Full Audit Report",
+                data=audit_pdf,
+                file_name="Plant_Audit_Report.pdf",
+                mime="application/pdf",
+                key="dl_audit"
+            )
+        else:
+            st.warning("⚠️ Audit report generation unavailable for this batch.")
     
     for idx, item in enumerate(st.session_state.batch_results):
         with st.expander(f"🍃 Result: {item['name']} - {item['data'].get('plant_name', 'Plant')}", expanded=(idx==0)):
@@ -419,18 +398,24 @@ if st.session_state.batch_results:
             with col_img:
                 st.image(item['bytes'], use_column_width=True)
                 
-                # Feature 3: PDF Export
-                if item.get('pdf'):
-                    # Provide Download Option (Most reliable on Deployed apps)
-                    st.download_button(
-                        label="📥 Download PDF Report",
-                        data=item['pdf'],
-                        file_name=f"Plant_Report_{idx}_{item['name']}.pdf",
-                        mime="application/pdf",
-                        key=f"dl_{idx}"
-                    )
-                else:
-                    st.warning("⚠️ PDF generation unavailable for this result.")
+                # Feature 3: PDF Export (rendered lazily, cached across reruns)
+                pdf_ready = st.session_state.setdefault('pdf_ready', set())
+                if idx in pdf_ready or st.button("📄 Prepare PDF Report", key=f"prep_{idx}"):
+                    pdf_ready.add(idx)
+                    # Use resolved city name if weather data exists, otherwise use raw input
+                    pdf_location = st.session_state.get('weather_risk', {}).get('city', location)
+                    pdf_data = get_pdf_report(item['data'], item['bytes'], location=pdf_location)
+                    if pdf_data:
+                        # Provide Download Option (Most reliable on Deployed apps)
+                        st.download_button(
+                            label="📥 Download PDF Report",
+                            data=pdf_data,
+                            file_name=f"Plant_Report_{idx}_{item['name']}.pdf",
+                            mime="application/pdf",
+                            key=f"dl_{idx}"
+                        )
+                    else:
+                        st.warning("⚠️ PDF generation unavailable for this result.")
             
             with col_info:
                 res = item['data']
@@ -482,6 +467,9 @@ if st.session_state.batch_results:
 
     if st.button("🗑️ Clear All Results"):
         st.session_state.batch_results = []
+        st.session_state.batch_failed = []
+        st.session_state.pdf_ready = set()
+        st.session_state.audit_pdf_ready = False
         st.rerun()
 else:
     st.info("👋 Upload leaf images above and click 'Analyze All' to start your batch audit.")
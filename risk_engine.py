@@ -0,0 +1,117 @@
+import numpy as np
+
+# Hourly thresholds for leaf wetness
+WET_RH = 90.0            # % relative humidity
+WET_PRECIP_MM = 0.1      # mm of rain in the hour
+
+# Generic foliar-fungus temperature response (beta function, degrees C)
+T_MIN, T_OPT, T_MAX = 5.0, 22.0, 32.0
+# Hours of continuous wetness needed for infection at T_OPT
+WETNESS_AT_OPT = 6.0
+
+
+def _rolling_mean(values: np.ndarray, window: int) -> np.ndarray:
+    """
+    Trailing mean over the last `window` hours along axis 1. The first
+    hours average over what is available.
+    """
+    csum = np.cumsum(values, axis=1, dtype=np.float64)
+    out = csum.copy()
+    out[:, window:] = csum[:, window:] - csum[:, :-window]
+    counts = np.minimum(np.arange(1, values.shape[1] + 1), window)
+    return out / counts
+
+
+def _wet_run_length(wet: np.ndarray) -> np.ndarray:
+    """
+    Hours of continuous wetness ending at each hour (0 when dry).
+    """
+    hours = np.arange(wet.shape[1])
+    last_dry = np.maximum.accumulate(np.where(wet, -1, hours), axis=1)
+    return np.where(wet, hours - last_dry, 0)
+
+
+def temperature_response(temp: np.ndarray) -> np.ndarray:
+    """
+    0-1 suitability of temperature for fungal infection, peaking at T_OPT.
+    """
+    t = np.clip(temp, T_MIN, T_MAX)
+    a = (t - T_MIN) / (T_OPT - T_MIN)
+    b = (T_MAX - t) / (T_MAX - T_OPT)
+    exponent = (T_MAX - T_OPT) / (T_OPT - T_MIN)
+    return a * np.power(b, exponent)
+
+
+def risk_level(scores: np.ndarray) -> np.ndarray:
+    """
+    Map 0-100 scores to the Low/Medium/High labels used in the sidebar.
+    """
+    return np.where(scores > 70, "High", np.where(scores > 40, "Medium", "Low"))
+
+
+def compute_risk_curves(temperature, humidity, precipitation=None, hours_per_day: int = 24):
+    """
+    Score disease risk for many locations at once from hourly forecasts.
+
+    Args:
+        temperature: (locations, hours) air temperature in degrees C
+        humidity: (locations, hours) relative humidity in %
+        precipitation: optional (locations, hours) rain in mm
+        hours_per_day: hours per daily bucket; trailing partial days are dropped
+
+    Returns:
+        dict of arrays. Per hour, shape (locations, hours): wet,
+        wet_run_hours, rh_6h_mean, rh_24h_mean and infection_index (0-1).
+        Per day, shape (locations, days): leaf_wetness_hours,
+        degree_hours (wet hours weighted by temperature above T_MIN),
+        daily_infection_index (daily max), score (0-100) and level.
+    """
+    temp = np.atleast_2d(np.asarray(temperature, dtype=np.float64))
+    rh = np.atleast_2d(np.asarray(humidity, dtype=np.float64))
+    temp = np.nan_to_num(temp, nan=T_MIN)
+    rh = np.nan_to_num(rh, nan=0.0)
+
+    wet = rh >= WET_RH
+    if precipitation is not None:
+        rain = np.nan_to_num(np.atleast_2d(np.asarray(precipitation, dtype=np.float64)))
+        wet |= rain >= WET_PRECIP_MM
+
+    run = _wet_run_length(wet)
+    response = temperature_response(temp)
+    # Wetness needed grows as temperature moves away from the optimum
+    required = WETNESS_AT_OPT / np.maximum(response, 1e-3)
+    infection = np.minimum(run / required, 1.0)
+
+    rh_6h = _rolling_mean(rh, 6)
+    rh_24h = _rolling_mean(rh, 24)
+    degree_hours = np.where(wet, np.maximum(temp - T_MIN, 0.0), 0.0)
+
+    days = temp.shape[1] // hours_per_day
+    span = days * hours_per_day
+    shape = (temp.shape[0], days, hours_per_day)
+    daily_wet = wet[:, :span].reshape(shape).sum(axis=2)
+    daily_degree_hours = degree_hours[:, :span].reshape(shape).sum(axis=2)
+    daily_infection = infection[:, :span].reshape(shape).max(axis=2)
+    daily_rh = rh_24h[:, :span].reshape(shape).max(axis=2)
+    daily_heat = (temp[:, :span].reshape(shape) > 30).sum(axis=2)
+
+    score = (
+        45 * daily_infection
+        + 25 * np.clip(daily_wet / 12.0, 0, 1)
+        + 20 * np.clip((daily_rh - 50) / 40.0, 0, 1)
+        + 10 * np.clip(daily_heat / 6.0, 0, 1)
+    )
+    score = np.clip(np.rint(score), 0, 100).astype(int)
+
+    return {
+        "wet": wet,
+        "wet_run_hours": run,
+        "rh_6h_mean": rh_6h,
+        "rh_24h_mean": rh_24h,
+        "infection_index": infection,
+        "leaf_wetness_hours": daily_wet,
+        "degree_hours": daily_degree_hours,
+        "daily_infection_index": daily_infection,
+        "score": score,
+        "level": risk_level(score),
+    }
@@ -1,147 +1,456 @@
 import json
 import sys,os
-import base64
+import hashlib
+import logging
 import datetime
+import threading
 from pathlib import Path
 
 # Add the Leaf Disease directory to Python path
 sys.path.insert(0, str(Path(__file__).parent / "Leaf Disease"))
 
+logger = logging.getLogger(__name__)
+
 # Detector is imported inside functions to avoid naming collisions at module level
 
 
-def test_with_base64_data(base64_image_string: str):
+def test_with_base64_data(base64_image_string: str, use_cache: bool = True):
     """
     Test disease detection with base64 image data
 
     Args:
         base64_image_string (str): Base64 encoded image data
+        use_cache (bool): Look the image up in the result cache first
     """
     try:
-        from leaf_detector import LeafDiseaseDetector
-        detector = LeafDiseaseDetector()
-        result = detector.analyze_leaf_image_base64(base64_image_string)
-        print(json.dumps(result, indent=2))
+        from detector_pool import get_detector
+        detector = get_detector()
+        result = detector.analyze_leaf_image_base64(base64_image_string, use_cache=use_cache)
+        logger.debug("Analysis result", extra={"result": result})
         return result
     except Exception as e:
-        print(f'{{"error": "{str(e)}"}}')
+        logger.error(f"Analysis failed: {str(e)}")
         return None
 
 
-def convert_image_to_base64_and_test(image_bytes: bytes):
+def analyze_image_bytes(image_bytes, use_cache: bool = True):
     """
-    Convert image bytes to base64 and test it
+    Run disease detection on raw image bytes without a base64 round trip
 
     Args:
-        image_bytes (bytes): Image data in bytes
+        image_bytes (bytes | memoryview): Encoded image data (JPEG, PNG, ...)
+        use_cache (bool): Look the image up in the result cache first
     """
     try:
         if not image_bytes:
-            print('{"error": "No image bytes provided"}')
+            logger.warning("No image bytes provided")
             return None
 
-        base64_string = base64.b64encode(image_bytes).decode('utf-8')
-        print(f"Converted image to base64 ({len(base64_string)} characters)")
-        return test_with_base64_data(base64_string)
+        from detector_pool import get_detector
+        detector = get_detector()
+        return detector.analyze_leaf_image_bytes(image_bytes, use_cache=use_cache)
     except Exception as e:
-        print(f'{{"error": "{str(e)}"}}')
+        logger.error(f"Analysis failed: {str(e)}")
         return None
 
 
-def create_pdf_report(result: dict, image_bytes: bytes = None, location: str = None):
+def configure_logging(force: bool = False):
     """
-    Generate a PDF report for the disease analysis.
+    Send logs through a background queue handler, configured from LOG_LEVEL,
+    LOG_FORMAT (text|json), LOG_FILE and LOG_SAMPLE_RATE.
     """
-    from fpdf import FPDF
-    import tempfile
-    
-    def clean_text(text):
-        if not text: return ""
-        if not isinstance(text, str): text = str(text)
-        # Replace common Unicode characters that cause Helvetica/Arial encoding issues
-        replacements = {
-            '\u2013': '-', # en dash
-            '\u2014': '-', # em dash
-            '\u2011': '-', # non-breaking hyphen
-            '\u2018': "'", # left single quote
-            '\u2019': "'", # right single quote
-            '\u201c': '"', # left double quote
-            '\u201d': '"', # right double quote
-            '\u2022': '*', # bullet point
-            '\u2122': '(TM)',
-            '\u00ae': '(R)',
-            '\u00a9': '(C)',
-        }
-        for old, new in replacements.items():
-            text = text.replace(old, new)
-        # Final pass to ensure it's compatible with latin-1
-        return text.encode('latin-1', 'replace').decode('latin-1')
-
-    class PDF(FPDF):
-        def header(self):
-            # Brand highlight at the top
-            self.set_fill_color(22, 101, 52) # Dark Green (#166534)
-            self.rect(0, 0, 210, 15, 'F')
-            
-            self.ln(5)
-            try:
-                self.set_font('Helvetica', 'B', 20)
-                self.set_text_color(22, 101, 52)
-            except:
-                pass
-            self.cell(0, 15, 'Plant Health & Treatment Report', 0, 1, 'C')
-            
-            # Subtle accent line
-            self.set_draw_color(74, 222, 128) # Light Green (#4ade80)
-            self.set_line_width(0.5)
-            self.line(40, 32, 170, 32)
-            self.ln(10)
-
-        def footer(self):
-            self.set_y(-15)
-            self.set_font('Helvetica', 'I', 8)
-            self.set_text_color(128, 128, 128)
-            self.cell(0, 10, f'Page {self.page_no()} | Leaf Disease AI Diagnostic System', 0, 0, 'C')
+    from log_config import configure_logging as _configure_logging
+    _configure_logging(force)
+
+
+def run_batch(items, fn, max_workers: int = None, on_result=None):
+    """
+    Run fn over items on a bounded thread pool, results in input order
+
+    Args:
+        items (list): Inputs, e.g. (name, image_bytes) pairs
+        fn (callable): Worker called once per item
+        max_workers (int): Pool size (default: BATCH_MAX_WORKERS or 4)
+        on_result (callable): on_result(index, result, done) as items finish
+    """
+    from batch_executor import run_batch as _run_batch
+    return _run_batch(items, fn, max_workers, on_result)
+
+
+async def analyze_image_bytes_async(image_bytes, use_cache: bool = True):
+    """
+    Awaitable analyze_image_bytes that runs on the shared detection pool,
+    keeping the event loop free during provider round trips
+
+    Args:
+        image_bytes (bytes | memoryview): Encoded image data
+        use_cache (bool): Look the image up in the result cache first
+    """
+    import asyncio
+    from batch_executor import get_detection_executor
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(get_detection_executor(), analyze_image_bytes,
+                                      image_bytes, use_cache)
+
+
+def analyze_images_local(images):
+    """
+    Classify several images with the local CPU model in batched passes
+
+    Args:
+        images (list): Encoded image bytes
+    """
+    from detector_pool import get_detector
+    return get_detector().analyze_leaf_images_local(images)
+
+
+def submit_detection_job(image_bytes, webhook_url: str = None):
+    """
+    Queue an image for background analysis and return the job as a dict,
+    or None if the queue is full. Raises ValueError for a webhook_url that
+    is not a public http(s) address.
+
+    Args:
+        image_bytes (bytes): Encoded image data
+        webhook_url (str): Optional URL that receives the finished job as JSON
+    """
+    from job_queue import QueueFullError, get_job_queue
+    try:
+        return get_job_queue().submit(image_bytes, webhook_url).to_dict()
+    except QueueFullError as e:
+        logger.warning(str(e))
+        return None
+
+
+def get_detection_job(job_id: str):
+    """
+    Status (and result, once finished) of a background job, or None if unknown.
+    """
+    from job_queue import get_job_queue
+    job = get_job_queue().get(job_id)
+    return job.to_dict() if job is not None else None
+
+
+def get_job_stats():
+    """
+    Queue depth, running jobs and wait/run time percentiles for background jobs.
+    """
+    from job_queue import get_job_queue
+    return get_job_queue().get_stats()
+
+
+def get_http_client(name: str, read_timeout: float = 30.0):
+    """
+    Shared keep-alive HTTP client (timeouts, retries, circuit breaker) for an upstream
+
+    Args:
+        name (str): Upstream name, e.g. "open-meteo"
+        read_timeout (float): Default read timeout in seconds
+    """
+    from http_client import get_http_client as _get_http_client
+    return _get_http_client(name, read_timeout)
+
+
+def convert_image_to_base64_and_test(image_bytes: bytes):
+    """
+    Kept for existing callers; the bytes are no longer base64 encoded here.
+    Use analyze_image_bytes instead.
+
+    Args:
+        image_bytes (bytes): Image data in bytes
+    """
+    return analyze_image_bytes(image_bytes)
+
+
+def get_cache_stats():
+    """
+    Hit/miss counters for the analysis result cache and near-duplicate index,
+    and how many requests shared an identical in-flight analysis.
+    """
+    from result_cache import get_result_cache
+    from perceptual_hash import get_near_duplicate_index
+    from single_flight import get_single_flight
+    stats = get_result_cache().get_stats()
+    stats["near_duplicate"] = get_near_duplicate_index().get_stats()
+    stats["single_flight"] = get_single_flight().get_stats()
+    return stats
+
+
+def get_preprocess_stats():
+    """
+    Bytes in/out and bytes saved by the pre-upload downscaling stage, and
+    how many images the leaf prefilter rejected (by reason).
+    """
+    from preprocessing import get_preprocess_stats as _get_preprocess_stats
+    from leaf_prefilter import get_leaf_prefilter
+    stats = _get_preprocess_stats()
+    stats["prefilter"] = get_leaf_prefilter().get_stats()
+    return stats
+
+
+def get_provider_stats():
+    """
+    Per-provider success/failure counts and recent latency percentiles.
+    """
+    from provider_router import get_latency_tracker
+    return get_latency_tracker().get_stats()
+
+
+def get_quota_stats():
+    """
+    Per-key usage today, daily limit and availability for each provider.
+    """
+    from quota_manager import get_quota_manager
+    return get_quota_manager().get_stats()
+
+
+_metrics_collectors_registered = False
+
+
+def _cache_metrics():
+    stats = get_cache_stats()
+    for tier in ("memory_hits", "disk_hits", "misses", "stores"):
+        yield ("leaf_result_cache_total", "counter", "Result cache lookups and stores by outcome",
+               {"event": tier}, stats.get(tier, 0))
+    near = stats.get("near_duplicate", {})
+    yield ("leaf_near_duplicate_hits_total", "counter", "Uploads served from a perceptually similar image",
+           {}, near.get("hits", 0))
+    preprocess = get_preprocess_stats()
+    yield ("leaf_preprocess_bytes_saved_total", "counter", "Upload bytes saved by downscaling before provider calls",
+           {}, preprocess.get("bytes_saved", 0))
+
+
+def get_metrics_text():
+    """
+    Per-stage latency histograms and counters in Prometheus text format.
+    """
+    global _metrics_collectors_registered
+    from tracing import get_metrics_registry
+    registry = get_metrics_registry()
+    if not _metrics_collectors_registered:
+        _metrics_collectors_registered = True
+        registry.register_collector(_cache_metrics)
+    return registry.render_prometheus()
+
+
+def record_request_metrics(method: str, path: str, status: int, seconds: float):
+    """
+    Record one HTTP request in leaf_request_duration_seconds.
+    """
+    from tracing import get_metrics_registry
+    get_metrics_registry().observe("leaf_request_duration_seconds", seconds,
+                                   "End-to-end API request latency",
+                                   method=method, path=path, status=status)
+
+
+_report_cache = None
+_report_cache_lock = threading.Lock()
+
+
+def _report_cache_key(result: dict, image_bytes, location):
+    from result_cache import image_digest
+    result_hash = hashlib.sha256(json.dumps(result, sort_keys=True, default=str).encode('utf-8')).hexdigest()
+    image_hash = image_digest(image_bytes) if image_bytes else None
+    return (result_hash, image_hash, location)
 
+
+def get_pdf_report(result: dict, image_bytes: bytes = None, location: str = None):
+    """
+    Render a PDF report on demand, reusing a previous render of the same
+    result, image and location. Returns None if rendering fails.
+    """
+    key = _report_cache_key(result, image_bytes, location)
+    return _cached_report(key, lambda: create_pdf_report(result, image_bytes, location=location))
+
+
+def _get_report_cache():
+    global _report_cache
+    if _report_cache is None:
+        with _report_cache_lock:
+            if _report_cache is None:
+                from result_cache import LRUCache
+                _report_cache = LRUCache(max_entries=int(os.environ.get("REPORT_CACHE_SIZE", 32)))
+    return _report_cache
+
+
+def _cached_report(key, render):
+    report_cache = _get_report_cache()
+    pdf_data = report_cache.get(key)
+    if pdf_data is None:
+        try:
+            pdf_data = render()
+        except Exception as e:
+            logger.error(f"PDF generation failed: {str(e)}")
+            return None
+        report_cache.put(key, pdf_data)
+    return pdf_data
+
+
+REPORT_IMAGE_WIDTH_MM = 80
+REPORT_IMAGE_DPI = 150
+REPORT_IMAGE_MIN_HEIGHT_MM = 40
+_report_pdf_class = None
+
+
+def _clean_text(text):
+    if not text: return ""
+    if not isinstance(text, str): text = str(text)
+    # Replace common Unicode characters that cause Helvetica/Arial encoding issues
+    replacements = {
+        '\u2013': '-', # en dash
+        '\u2014': '-', # em dash
+        '\u2011': '-', # non-breaking hyphen
+        '\u2018': "'", # left single quote
+        '\u2019': "'", # right single quote
+        '\u201c': '"', # left double quote
+        '\u201d': '"', # right double quote
+        '\u2022': '*', # bullet point
+        '\u2122': '(TM)',
+        '\u00ae': '(R)',
+        '\u00a9': '(C)',
+    }
+    for old, new in replacements.items():
+        text = text.replace(old, new)
+    # Final pass to ensure it's compatible with latin-1
+    return text.encode('latin-1', 'replace').decode('latin-1')
+
+
+def _get_report_pdf_class():
+    """
+    FPDF subclass with the report header/footer, defined once per process.
+    """
+    global _report_pdf_class
+    if _report_pdf_class is None:
+        from fpdf import FPDF
+
+        class PDF(FPDF):
+            def header(self):
+                # Brand highlight at the top
+                self.set_fill_color(22, 101, 52) # Dark Green (#166534)
+                self.rect(0, 0, 210, 15, 'F')
+
+                self.ln(5)
+                try:
+                    self.set_font('Helvetica', 'B', 20)
+                    self.set_text_color(22, 101, 52)
+                except:
+                    pass
+                self.cell(0, 15, 'Plant Health & Treatment Report', 0, 1, 'C')
+
+                # Subtle accent line
+                self.set_draw_color(74, 222, 128) # Light Green (#4ade80)
+                self.set_line_width(0.5)
+                self.line(40, 32, 170, 32)
+                self.ln(10)
+
+            def footer(self):
+                self.set_y(-15)
+                self.set_font('Helvetica', 'I', 8)
+                self.set_text_color(128, 128, 128)
+                self.cell(0, 10, f'Page {self.page_no()} | Leaf Disease AI Diagnostic System', 0, 0, 'C')
+
+        _report_pdf_class = PDF
+    return _report_pdf_class
+
+
+def _prepare_report_image(image_bytes, width_mm: float, max_height_mm: float):
+    """
+    Downscale an image to fit width_mm x max_height_mm at REPORT_IMAGE_DPI
+    and return (in-memory JPEG, printed width, printed height in mm), so no
+    temp file is needed and tall images never run past the page.
+    """
+    import io
+    import PIL.Image
+    import PIL.ImageOps
+
+    max_w_px = int(width_mm / 25.4 * REPORT_IMAGE_DPI)
+    max_h_px = int(max_height_mm / 25.4 * REPORT_IMAGE_DPI)
+    img = PIL.Image.open(io.BytesIO(image_bytes))
+    img.draft('RGB', (max_w_px, max_h_px))
+    img = PIL.ImageOps.exif_transpose(img)
+    img.thumbnail((max_w_px, max_h_px), PIL.Image.LANCZOS)
+    if img.mode != 'RGB':
+        img = img.convert('RGB')
+    buffer = io.BytesIO()
+    img.save(buffer, format='JPEG', quality=85, optimize=True)
+    buffer.seek(0)
+    # Scale from whichever side hit its limit, preserving the aspect ratio
+    scale = min(width_mm / img.width, max_height_mm / img.height)
+    return buffer, img.width * scale, img.height * scale
+
+
+def _render_pdf(build, kind: str):
+    """
+    Build and serialize a report, timed as the pdf_render stage.
+    """
+    from tracing import span
+    with span("pdf_render", kind=kind):
+        return _pdf_buffer(build())
+
+
+def _pdf_buffer(pdf):
+    """
+    Finished PDF as the bytearray fpdf2 builds, without an extra copy.
+    """
+    return pdf.output()
+
+
+def _new_report_pdf():
     # Initialize PDF
-    pdf = PDF()
+    pdf = _get_report_pdf_class()()
     pdf.set_left_margin(15)
     pdf.set_right_margin(15)
     pdf.set_auto_page_break(auto=True, margin=20)
+    return pdf
+
+
+def _build_pdf_report(result: dict, image_bytes: bytes = None, location: str = None):
+    """
+    Lay out the single-leaf report and return the FPDF document.
+    """
+    pdf = _new_report_pdf()
     pdf.add_page()
-    
+    _render_leaf_section(pdf, result, image_bytes, location)
+    return pdf
+
+
+def _render_leaf_section(pdf, result: dict, image_bytes: bytes = None, location: str = None):
+    """
+    Draw one leaf's report (image, diagnosis, treatment, care) on the current page.
+    """
     base_font = "Helvetica"
     effective_width = pdf.w - 2 * 15
 
     # 1. Image Section
     if image_bytes:
         try:
-            with tempfile.NamedTemporaryFile(delete=False, suffix='.jpg') as tmp:
-                tmp.write(image_bytes)
-                tmp_path = tmp.name
-            
+            # Embed from memory, pre-shrunk to fit the rest of the page
+            # (images placed at an explicit y don't trigger a page break)
+            max_h = pdf.h - pdf.b_margin - pdf.get_y() - 5
+            if max_h < REPORT_IMAGE_MIN_HEIGHT_MM:
+                pdf.add_page()
+                max_h = pdf.h - pdf.b_margin - pdf.get_y() - 5
+            img_buffer, img_w, img_h = _prepare_report_image(image_bytes, REPORT_IMAGE_WIDTH_MM, max_h)
             # Center the image
-            img_w = 80
-            pdf.image(tmp_path, x=(210-img_w)/2, y=pdf.get_y(), w=img_w)
-            os.unlink(tmp_path)
-            pdf.ln(65)
-        except:
+            pdf.image(img_buffer, x=(210-img_w)/2, y=pdf.get_y(), w=img_w, h=img_h)
+            pdf.ln(img_h + 5)
+        except Exception:
             pdf.ln(5)
 
     # 2. Plant Summary Section
     pdf.set_fill_color(240, 249, 241) # Very light green bg
     pdf.set_text_color(22, 101, 52)
     pdf.set_font(base_font, 'B', 14)
-    pdf.cell(effective_width, 10, "  " + clean_text(f"Plant: {result.get('plant_name', 'Unknown')}"), 0, 1, 'L', True)
+    pdf.cell(effective_width, 10, "  " + _clean_text(f"Plant: {result.get('plant_name', 'Unknown')}"), 0, 1, 'L', True)
     
     pdf.set_text_color(0, 0, 0)
     pdf.set_font(base_font, 'I', 11)
-    pdf.cell(effective_width, 8, clean_text(f"Scientific Name: {result.get('scientific_name', 'N/A')}"), 0, 1)
+    pdf.cell(effective_width, 8, _clean_text(f"Scientific Name: {result.get('scientific_name', 'N/A')}"), 0, 1)
     
     if location:
         pdf.set_font(base_font, 'B', 11)
         pdf.set_text_color(22, 101, 52)
-        pdf.cell(effective_width, 8, clean_text(f"Selected Location: {location}"), 0, 1)
+        pdf.cell(effective_width, 8, _clean_text(f"Selected Location: {location}"), 0, 1)
         pdf.set_text_color(0, 0, 0)
         pdf.ln(2)
 
@@ -161,12 +470,12 @@ def create_pdf_report(result: dict, image_bytes: bytes = None, location: str = N
         pdf.set_font(base_font, 'B', 11)
         pdf.cell(40, 8, "Primary Issue:", 0, 0)
         pdf.set_font(base_font, '', 11)
-        pdf.cell(0, 8, clean_text(result.get('disease_name', 'N/A')), 0, 1)
+        pdf.cell(0, 8, _clean_text(result.get('disease_name', 'N/A')), 0, 1)
         
         pdf.set_font(base_font, 'B', 11)
         pdf.cell(40, 8, "Severity Level:", 0, 0)
         pdf.set_font(base_font, '', 11)
-        pdf.cell(0, 8, clean_text(result.get('severity', 'Moderate') or 'Moderate').upper(), 0, 1)
+        pdf.cell(0, 8, _clean_text(result.get('severity', 'Moderate') or 'Moderate').upper(), 0, 1)
         
         pdf.set_font(base_font, 'B', 11)
         pdf.cell(40, 8, "AI Confidence:", 0, 0)
@@ -182,7 +491,7 @@ def create_pdf_report(result: dict, image_bytes: bytes = None, location: str = N
     pdf.ln(2)
     for s in result.get('symptoms', []):
         pdf.set_x(20)
-        pdf.multi_cell(effective_width-10, 7, clean_text(f"- {s}"))
+        pdf.multi_cell(effective_width-10, 7, _clean_text(f"- {s}"))
     
     # 5. Full Treatment Points (Enhanced)
     pdf.ln(5)
@@ -198,7 +507,7 @@ def create_pdf_report(result: dict, image_bytes: bytes = None, location: str = N
     else:
         for t in treatment_points:
             pdf.set_x(20)
-            pdf.multi_cell(effective_width-10, 7, clean_text(f"• {t}"))
+            pdf.multi_cell(effective_width-10, 7, _clean_text(f"• {t}"))
 
     # 6. Personalized Care Calendar
     calendar = result.get('care_calendar', {})
@@ -215,24 +524,152 @@ def create_pdf_report(result: dict, image_bytes: bytes = None, location: str = N
                 pdf.set_font(base_font, 'B', 10)
                 pdf.cell(30, 7, f"{activity.title()}:", 0, 0)
                 pdf.set_font(base_font, '', 10)
-                pdf.multi_cell(effective_width-40, 7, clean_text(notes))
+                pdf.multi_cell(effective_width-40, 7, _clean_text(notes))
 
     # 7. Timestamps
     pdf.ln(10)
     pdf.set_font(base_font, 'I', 8)
     pdf.set_text_color(100, 100, 100)
     timestamp = result.get('analysis_timestamp') or datetime.datetime.now().strftime("%Y-%m-%d %H:%M")
-    pdf.cell(effective_width, 10, clean_text(f"Report Generated: {timestamp}"), 0, 1, 'R')
+    pdf.cell(effective_width, 10, _clean_text(f"Report Generated: {timestamp}"), 0, 1, 'R')
+
+
+def create_pdf_report(result: dict, image_bytes: bytes = None, location: str = None):
+    """
+    Generate a PDF report for the disease analysis.
+    """
+    return bytes(_render_pdf(lambda: _build_pdf_report(result, image_bytes, location), "single"))
+
+
+def iter_pdf_report(result: dict, image_bytes: bytes = None, location: str = None,
+                    chunk_size: int = 64 * 1024):
+    """
+    Render the PDF report and yield it in chunks, e.g. for a streaming response.
+    """
+    buffer = memoryview(_render_pdf(lambda: _build_pdf_report(result, image_bytes, location), "single"))
+    for start in range(0, len(buffer), chunk_size):
+        yield bytes(buffer[start:start + chunk_size])
+
+def _build_batch_pdf_report(items: list, location: str = None, failed: list = None):
+    """
+    Lay out one audit document for a whole batch: a summary table followed
+    by a section per leaf. items are dicts with "name", "data" and "bytes";
+    failed lists (name, error) for images that could not be analyzed, which
+    get an error row in the summary so nothing leaves the audit unnoticed.
+    """
+    failed = failed or []
+    pdf = _new_report_pdf()
+    pdf.add_page()
+    base_font = "Helvetica"
+    effective_width = pdf.w - 2 * 15
+
+    # Summary
+    pdf.set_fill_color(240, 249, 241)
+    pdf.set_text_color(22, 101, 52)
+    pdf.set_font(base_font, 'B', 14)
+    pdf.cell(effective_width, 10, "  " + _clean_text(f"Batch Audit Summary - {len(items) + len(failed)} Leaves"), 0, 1, 'L', True)
+    pdf.set_text_color(0, 0, 0)
+    if location:
+        pdf.set_font(base_font, 'B', 11)
+        pdf.cell(effective_width, 8, _clean_text(f"Selected Location: {location}"), 0, 1)
+    diseased = sum(1 for item in items if item['data'].get('disease_detected'))
+    pdf.set_font(base_font, '', 11)
+    counts = f"Healthy: {len(items) - diseased}   |   Disease detected: {diseased}"
+    if failed:
+        counts += f"   |   Analysis failed: {len(failed)}"
+    pdf.cell(effective_width, 8, counts, 0, 1)
+    pdf.ln(3)
+
+    columns = [("#", 10), ("File", 45), ("Plant", 45), ("Status", 25), ("Issue", 35), ("Conf.", 20)]
+    pdf.set_font(base_font, 'B', 10)
+    pdf.set_fill_color(22, 101, 52)
+    pdf.set_text_color(255, 255, 255)
+    for title, width in columns:
+        pdf.cell(width, 8, title, 1, 0, 'C', True)
+    pdf.ln()
+    pdf.set_text_color(0, 0, 0)
+    pdf.set_font(base_font, '', 9)
+    for idx, item in enumerate(items, start=1):
+        res = item['data']
+        row = [
+            str(idx),
+            item.get('name', ''),
+            res.get('plant_name', 'Unknown'),
+            "Diseased" if res.get('disease_detected') else "Healthy",
+            res.get('disease_name') or "-",
+            f"{res.get('confidence', 0)}%",
+        ]
+        pdf.set_fill_color(*((254, 242, 242) if res.get('disease_detected') else (255, 255, 255)))
+        for (title, width), value in zip(columns, row):
+            text = _clean_text(value)
+            # Truncate to the column instead of wrapping, keeps rows one line high
+            while text and pdf.get_string_width(text) > width - 2:
+                text = text[:-1]
+            pdf.cell(width, 7, text, 1, 0, 'L', True)
+        pdf.ln()
+    for idx, (name, error) in enumerate(failed, start=len(items) + 1):
+        row = [str(idx), name, "-", "FAILED", error or "Analysis failed", "-"]
+        pdf.set_fill_color(255, 237, 213)
+        for (title, width), value in zip(columns, row):
+            text = _clean_text(value)
+            while text and pdf.get_string_width(text) > width - 2:
+                text = text[:-1]
+            pdf.cell(width, 7, text, 1, 0, 'L', True)
+        pdf.ln()
+    if failed:
+        pdf.ln(2)
+        pdf.set_font(base_font, 'I', 9)
+        pdf.set_text_color(154, 52, 18)
+        pdf.multi_cell(effective_width, 6, _clean_text(
+            f"{len(failed)} image(s) could not be analyzed and have no section in this report: "
+            + ", ".join(name for name, _ in failed)))
+        pdf.set_text_color(0, 0, 0)
+
+    # One section per leaf, all in the same document
+    for item in items:
+        pdf.add_page()
+        pdf.set_font(base_font, 'B', 10)
+        pdf.set_text_color(100, 100, 100)
+        pdf.cell(effective_width, 6, _clean_text(f"File: {item.get('name', '')}"), 0, 1)
+        pdf.set_text_color(0, 0, 0)
+        _render_leaf_section(pdf, item['data'], item.get('bytes'), location)
+    return pdf
+
+
+def create_batch_pdf_report(items: list, location: str = None, failed: list = None):
+    """
+    Generate one consolidated audit PDF covering every leaf in a batch.
+    failed lists (name, error) for images whose analysis failed.
+    """
+    return bytes(_render_pdf(lambda: _build_batch_pdf_report(items, location, failed), "batch"))
+
+
+def iter_batch_pdf_report(items: list, location: str = None, chunk_size: int = 64 * 1024,
+                          failed: list = None):
+    """
+    Render the consolidated audit PDF and yield it in chunks.
+    """
+    buffer = memoryview(_render_pdf(lambda: _build_batch_pdf_report(items, location, failed), "batch"))
+    for start in range(0, len(buffer), chunk_size):
+        yield bytes(buffer[start:start + chunk_size])
+
+
+def get_batch_pdf_report(items: list, location: str = None, failed: list = None):
+    """
+    Consolidated audit PDF on demand, reused while the batch and location
+    are unchanged. Returns None if rendering fails.
+    """
+    failed = [tuple(entry) for entry in failed or []]
+    key = (("batch",) + tuple(_report_cache_key(item['data'], item.get('bytes'), location) for item in items)
+           + tuple(failed))
+    return _cached_report(key, lambda: create_batch_pdf_report(items, location, failed))
 
-    output = pdf.output(dest='S')
-    if isinstance(output, str):
-        return output.encode('latin-1')
-    return bytes(output)
 
 def main():
     """Test with base64 conversion"""
     image_path = "Media/brown-spot-4 (1).jpg"
-    convert_image_to_base64_and_test(image_path)
+    result = analyze_image_bytes(Path(image_path).read_bytes())
+    print(json.dumps(result, indent=2))
 
 
 if __name__ == "__main__":
@@ -0,0 +1,279 @@
+import os
+import time
+import logging
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+# utils puts the "Leaf Disease" directory on sys.path for result_cache
+from utils import get_http_client
+from result_cache import LRUCache
+from gazetteer import get_gazetteer
+from risk_engine import compute_risk_curves
+
+logger = logging.getLogger(__name__)
+
+GEOCODE_URL = "https://geocoding-api.open-meteo.com/v1/search"
+FORECAST_URL = "https://api.open-meteo.com/v1/forecast"
+
+# auto: local gazetteer first, Open-Meteo geocoding as fallback
+# local: never geocode over the network; remote: always use Open-Meteo
+GEOCODER = os.environ.get("GEOCODER", "auto").lower()
+
+# Current conditions are cached per grid cell of this many degrees (~11 km)
+GRID_DEGREES = float(os.environ.get("WEATHER_GRID_DEGREES", 0.1))
+WEATHER_TTL = float(os.environ.get("WEATHER_TTL", 600))
+# Past the TTL, stale conditions are still served (and refreshed) this long
+WEATHER_STALE_GRACE = float(os.environ.get("WEATHER_STALE_GRACE", 3600))
+# Refresh ahead once an entry reaches this fraction of its TTL
+REFRESH_AHEAD = 0.8
+
+# City names rarely move: geocodes are kept until evicted by size
+_geocodes = LRUCache(max_entries=4096)
+_geocode_misses = LRUCache(max_entries=1024, ttl=3600)
+# grid cell -> (fetched_at, conditions)
+_conditions = LRUCache(max_entries=4096)
+_refreshing = set()
+_refresh_lock = threading.Lock()
+_refresh_pool = ThreadPoolExecutor(max_workers=2, thread_name_prefix="weather-refresh")
+
+
+def _http():
+    return get_http_client("open-meteo", read_timeout=5)
+
+
+def _gazetteer_place(gazetteer, city: str, inexact: bool):
+    # inexact allows prefix and fuzzy matches ("Hyde" -> Hyderabad)
+    row = gazetteer.lookup(city, fuzzy=inexact, prefix=inexact)
+    if row is None:
+        return None
+    return {"name": row['name'], "latitude": row['latitude'], "longitude": row['longitude']}
+
+
+def geocode(city: str):
+    """
+    Resolve a city name to {"name", "latitude", "longitude"}, or None if
+    not found. The bundled gazetteer is tried first; network results are
+    memoized for the life of the process.
+    """
+    key = city.strip().lower()
+    place = _geocodes.get(key)
+    if place is not None:
+        return place
+
+    gazetteer = get_gazetteer() if GEOCODER != "remote" else None
+    if gazetteer is not None:
+        # Prefix/fuzzy matches only when offline-only; otherwise anything but
+        # an exact name goes to Open-Meteo, which knows far more places
+        place = _gazetteer_place(gazetteer, city, inexact=GEOCODER == "local")
+        if place is not None:
+            _geocodes.put(key, place)
+            return place
+    if GEOCODER == "local" or _geocode_misses.get(key):
+        return None
+
+    params = {"name": city.strip(), "count": 1, "language": "en", "format": "json"}
+    try:
+        geo_resp = _http().get(GEOCODE_URL, params=params).json()
+    except Exception:
+        # No connectivity: settle for the closest local spelling
+        place = _gazetteer_place(gazetteer, city, inexact=True) if gazetteer is not None else None
+        if place is None:
+            raise
+        return place
+    if not geo_resp.get('results'):
+        _geocode_misses.put(key, True)
+        return None
+    top = geo_resp['results'][0]
+    place = {"name": top['name'], "latitude": top['latitude'], "longitude": top['longitude']}
+    _geocodes.put(key, place)
+    return place
+
+
+def _grid_cell(lat: float, lon: float):
+    return (round(lat / GRID_DEGREES), round(lon / GRID_DEGREES))
+
+
+def _fetch_conditions(lat: float, lon: float):
+    params = {"latitude": lat, "longitude": lon, "current": "temperature_2m,relative_humidity_2m"}
+    w_resp = _http().get(FORECAST_URL, params=params).json()
+    current = w_resp.get('current', {})
+    return {
+        "temp": current.get('temperature_2m', 0),
+        "humidity": current.get('relative_humidity_2m', 0),
+    }
+
+
+def _store_conditions(cell, lat: float, lon: float):
+    conditions = _fetch_conditions(lat, lon)
+    _conditions.put(cell, (time.time(), conditions))
+    return conditions
+
+
+def _refresh(key, fetch) -> None:
+    try:
+        fetch()
+    except Exception as e:
+        logger.warning(f"Background weather refresh failed: {e}")
+    finally:
+        with _refresh_lock:
+            _refreshing.discard(key)
+
+
+def _schedule_refresh(key, fetch) -> None:
+    # fetch() re-downloads and stores the entry; one refresh per key at a time
+    with _refresh_lock:
+        if key in _refreshing:
+            return
+        _refreshing.add(key)
+    _refresh_pool.submit(_refresh, key, fetch)
+
+
+def _is_servable(entry) -> bool:
+    # entry is (fetched_at, value); stale entries are served within the grace period
+    return entry is not None and time.time() - entry[0] < WEATHER_TTL + WEATHER_STALE_GRACE
+
+
+def _needs_refresh(entry) -> bool:
+    return time.time() - entry[0] >= WEATHER_TTL * REFRESH_AHEAD
+
+
+def current_conditions(lat: float, lon: float):
+    """
+    Current temperature and humidity for a location, served from a
+    per-grid-cell cache. Entries near or past their TTL are returned
+    immediately and refreshed in the background.
+    """
+    cell = _grid_cell(lat, lon)
+    entry = _conditions.get(cell)
+    if _is_servable(entry):
+        if _needs_refresh(entry):
+            _schedule_refresh(cell, lambda: _store_conditions(cell, lat, lon))
+        return entry[1]
+    return _store_conditions(cell, lat, lon)
+
+
+def score_risk(temp: float, humidity: float):
+    """
+    Turn current temperature and humidity into a risk score, level and advice.
+    """
+    # Risk Calculation Logic
+    risk_score = humidity
+    if temp > 30: risk_score += 10 # Heat stress
+    if humidity > 80: risk_score = min(95, risk_score + 15) # Fungal spike
+
+    risk_level = "Low"
+    if risk_score > 40: risk_level = "Medium"
+    if risk_score > 70: risk_level = "High"
+
+    msg = "Conditions are stable."
+    if humidity > 75: msg = "⚠️ High humidity detected. Fungal diseases (Rust, Mildew) move faster now."
+    elif temp > 35: msg = "🔥 Heat stress alert. Watch for wilting and leaf burn."
+    elif humidity < 30: msg = "🏜️ Very dry air. Check for spider mites and dehydration."
+    return int(risk_score), risk_level, msg
+
+
+def get_botanical_risk(city):
+    """
+    Real-time weather risk for a city (Using Open-Meteo Open Data).
+    Returns (risk_data, error).
+    """
+    try:
+        # 1. Geocoding: Get Lat/Lon for the city name
+        place = geocode(city)
+        if place is None:
+            return None, f"❌ City not found: {city}"
+
+        # 2. Weather: Get Temperature and Humidity
+        conditions = current_conditions(place['latitude'], place['longitude'])
+        temp = conditions['temp']
+        humidity = conditions['humidity']
+
+        risk_score, risk_level, msg = score_risk(temp, humidity)
+        return {
+            "score": risk_score,
+            "level": risk_level,
+            "msg": msg,
+            "temp": temp,
+            "humidity": humidity,
+            "city": place['name']
+        }, None
+    except Exception as e:
+        return None, f"Connection error: {e}"
+
+
+# (grid cells, days) -> (fetched_at, hourly forecast arrays); served stale
+# and refreshed in the background like current conditions
+_forecasts = LRUCache(max_entries=256)
+
+
+def fetch_hourly_forecasts(places, days: int = 3):
+    """
+    Hourly temperature, humidity and rain for many (lat, lon) pairs in a
+    single Open-Meteo request. Returns (temperature, humidity, precipitation)
+    arrays shaped (locations, hours). Cached entries near or past their TTL
+    are returned immediately and refreshed in the background.
+    """
+    places = list(places)
+    key = (tuple(_grid_cell(lat, lon) for lat, lon in places), days)
+    entry = _forecasts.get(key)
+    if _is_servable(entry):
+        if _needs_refresh(entry):
+            _schedule_refresh(("forecast",) + key, lambda: _store_forecasts(key, places, days))
+        return entry[1]
+    return _store_forecasts(key, places, days)
+
+
+def _store_forecasts(key, places, days: int):
+    import numpy as np
+
+    params = {
+        "latitude": ",".join(f"{lat:.4f}" for lat, _ in places),
+        "longitude": ",".join(f"{lon:.4f}" for _, lon in places),
+        "hourly": "temperature_2m,relative_humidity_2m,precipitation",
+        "forecast_days": days,
+        "timezone": "auto",
+    }
+    resp = _http().get(FORECAST_URL, params=params).json()
+    # One location returns an object, several return a list
+    entries = resp if isinstance(resp, list) else [resp]
+    hours = days * 24
+
+    def column(name):
+        return np.array([(e.get('hourly', {}).get(name) or [np.nan] * hours)[:hours] for e in entries],
+                        dtype=np.float64)
+
+    arrays = (column('temperature_2m'), column('relative_humidity_2m'), column('precipitation'))
+    _forecasts.put(key, (time.time(), arrays))
+    return arrays
+
+
+def get_risk_forecasts(places, days: int = 3):
+    """
+    Daily disease-risk curves for many farm plots in one batched pass.
+
+    Args:
+        places: list of (lat, lon)
+        days: forecast horizon
+
+    Returns:
+        compute_risk_curves output; row i belongs to places[i].
+    """
+    temperature, humidity, precipitation = fetch_hourly_forecasts(places, days)
+    return compute_risk_curves(temperature, humidity, precipitation)
+
+
+def get_risk_outlook(city, days: int = 3):
+    """
+    Daily risk scores and levels for one city, e.g. for the sidebar.
+    Returns a list of {"day", "score", "level"} or None if unavailable.
+    """
+    try:
+        place = geocode(city)
+        if place is None:
+            return None
+        curves = get_risk_forecasts([(place['latitude'], place['longitude'])], days)
+        return [{"day": d + 1, "score": int(curves['score'][0, d]), "level": str(curves['level'][0, d])}
+                for d in range(curves['score'].shape[1])]
+    except Exception as e:
+        logger.warning(f"Risk outlook unavailable: {e}")
+        return None